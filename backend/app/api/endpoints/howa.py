@@ -1,7 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List, Dict, Any
-from ...models.howa import GenerateHowaRequest, HowaResponse, InteractiveStepRequest, InteractiveStepResponse
-from ...services.howa_service import HowaGenerationService
+from ...models.howa import (
+    GenerateHowaRequest, HowaResponse, InteractiveStepRequest, InteractiveStepResponse, StoredHowaResponse
+)
+from ...services.howa_service import HowaGenerationService, SessionNotFoundError
+from ...services.howa_store import get_howa_store
+from ...core.drain import RETRY_AFTER_SECONDS, DrainingError, drain
 
 router = APIRouter()
 
@@ -12,6 +16,14 @@ def get_howa_service():
     """HowaGenerationServiceのインスタンスを生成する依存関係"""
     return HowaGenerationService()
 
+def _draining_error(e: DrainingError) -> HTTPException:
+    """停止中に受け付けなかった・打ち切った生成は 503 にし、クライアントに別の Pod での再試行を促す"""
+    return HTTPException(
+        status_code=503,
+        detail=f"サーバーを停止中のため処理できませんでした。再試行してください: {e}",
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
 # --- ▲▲▲ ここまで ▲▲▲ ---
 
 
@@ -31,8 +43,10 @@ async def generate_howa_endpoint(
     内部で経典検索、ニュース検索、執筆、評価の一連の処理を実行します。
     """
     try:
-        # 新しい一括生成メソッドを呼び出す
-        return await service.generate_full_howa(request)
+        # 新しい一括生成メソッドを呼び出す。停止時のドレインで完了を待てるよう追跡する
+        return await drain.run(service.generate_full_howa(request))
+    except DrainingError as e:
+        raise _draining_error(e)
     except Exception as e:
         # 予期せぬエラーは500エラーとして処理
         raise HTTPException(status_code=500, detail=f"サーバー内部で予期せぬエラーが発生しました: {str(e)}")
@@ -52,21 +66,64 @@ async def interactive_step_endpoint(
 ):
     """
     対話的に法話を生成するプロセスの各ステップを個別に実行します。
+    keep_session を true にした最初の呼び出しで返される session_id を次の呼び出しで渡すと、
+    前のステップの結果はサーバー側で引き継がれます。
+    until を指定すると、step から until までのステップを1回の呼び出しで実行します。
     開発やデバッグに使用します。
     """
     try:
-        # サービスメソッドにaudiencesも渡すように修正
-        result = await service.execute_interactive_step(
+        session_id, steps, result = await drain.run(service.execute_interactive_steps(
             step=request.step,
+            until=request.until,
+            session_id=request.session_id,
             theme=request.theme,
             audiences=request.audiences,
-            context=request.context
-        )
+            context=request.context,
+            keep_session=request.keep_session
+        ))
         return InteractiveStepResponse(
-            step=request.step,
+            step=steps[-1],
             result=result,
-            message=f"Step '{request.step}' executed successfully."
+            message=f"Step '{', '.join(steps)}' executed successfully.",
+            session_id=session_id,
+            steps=steps
         )
+    except DrainingError as e:
+        raise _draining_error(e)
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-# --- ▲▲▲ ここまで ▲▲▲ ---
\ No newline at end of file
+# --- ▲▲▲ ここまで ▲▲▲ ---
+
+
+# --- ▼▼▼ 4. 保存済みの法話の取得 ▼▼▼ ---
+@router.get(
+    "/{howa_id}",
+    response_model=StoredHowaResponse,
+    summary="保存された法話を取得する"
+)
+async def get_stored_howa_endpoint(howa_id: str):
+    """
+    一括生成のレスポンスに含まれる id で、生成済みの法話とその生成記録（候補、所要時間、トークン数）を取得します。
+    """
+    store = get_howa_store()
+    record = await store.aget(howa_id) if store is not None else None
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"法話が見つかりません: {howa_id}")
+    return StoredHowaResponse(
+        id=record.id,
+        theme=record.theme,
+        audiences=record.audiences,
+        created_at=record.created_at,
+        howa=HowaResponse(**record.response, id=record.id),
+        candidates=record.candidates,
+        timings=record.timings,
+        llm_calls=record.llm_calls,
+        prompt_tokens=record.prompt_tokens,
+        output_tokens=record.output_tokens,
+        total_tokens=record.total_tokens,
+    )
+# --- ▲▲▲ ここまで ▲▲▲ ---
@@ -0,0 +1,500 @@
+"""
+ワーカー間・レプリカ間で共有できるキャッシュ。
+
+バックエンドは設定（CACHE_BACKEND）で切り替える。
+
+- "memory": プロセス内の LRU。ワーカーごとに別になる
+- "sqlite": 同じノードのワーカーが共有する SQLite ファイル（WAL モード）
+- "redis": Redis プロトコルのサーバー。全レプリカで共有する
+
+値は JSON にできるもの（pydantic モデルは model_dump したもの）で、一定サイズ以上は zlib で圧縮して保存する。
+キャッシュの障害はリクエストを失敗させず、ミス扱いにして stats の errors に数える。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# 圧縮の有無を示す値の先頭1バイト
+_PLAIN = b"j"
+_COMPRESSED = b"z"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    sets: int = 0
+    evictions: int = 0
+    errors: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def make_key(*parts: Any) -> str:
+    """リクエストの内容などからキャッシュキーを作る。同じ内容なら順序も含めて同じキーになる"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cache:
+    """
+    キャッシュの共通インターフェース。サブクラスは _get_raw / _set_raw / _delete_raw / _clear_raw を実装する。
+    ttl は秒で、None なら既定の TTL（default_ttl も None なら無期限）。
+    shared はプロセスの外（他のワーカーや再起動後のプロセス）からも読めるかどうか。
+    """
+
+    shared = True
+
+    def __init__(self, *, namespace: str, default_ttl: Optional[float] = None, compress_min_bytes: int = 1024) -> None:
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.compress_min_bytes = compress_min_bytes
+        self._stats = CacheStats()
+        self._stats_lock = threading.Lock()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _count(self, field: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self._stats, field, getattr(self._stats, field) + amount)
+
+    def _encode(self, value: Any) -> bytes:
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if len(data) >= self.compress_min_bytes:
+            return _COMPRESSED + zlib.compress(data)
+        return _PLAIN + data
+
+    @staticmethod
+    def _decode(data: bytes) -> Any:
+        if data[:1] == _COMPRESSED:
+            return json.loads(zlib.decompress(data[1:]))
+        return json.loads(data[1:])
+
+    def get(self, key: str) -> Optional[Any]:
+        """値を返す。無い・期限切れ・バックエンドの障害のときは None"""
+        try:
+            data = self._get_raw(self._key(key))
+            value = None if data is None else self._decode(data)
+        except Exception as e:
+            logger.warning(f"Cache get failed ({type(self).__name__}): {e}")
+            self._count("errors")
+            data = value = None
+        self._count("misses" if data is None else "hits")
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        try:
+            self._set_raw(self._key(key), self._encode(value), ttl)
+        except Exception as e:
+            logger.warning(f"Cache set failed ({type(self).__name__}): {e}")
+            self._count("errors")
+            return
+        self._count("sets")
+
+    def delete(self, key: str) -> None:
+        try:
+            self._delete_raw(self._key(key))
+        except Exception as e:
+            logger.warning(f"Cache delete failed ({type(self).__name__}): {e}")
+            self._count("errors")
+
+    def clear(self) -> None:
+        """この名前空間のエントリをすべて消す"""
+        try:
+            self._clear_raw(f"{self.namespace}:")
+        except Exception as e:
+            logger.warning(f"Cache clear failed ({type(self).__name__}): {e}")
+            self._count("errors")
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """イベントループ上から呼ぶための get。I/O のあるバックエンドは別スレッドで実行する"""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+    async def adelete(self, key: str) -> None:
+        await asyncio.to_thread(self.delete, key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = asdict(self._stats)
+            stats["hit_rate"] = self._stats.hit_rate
+        stats["backend"] = type(self).__name__
+        return stats
+
+    def _get_raw(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _set_raw(self, key: str, data: bytes, ttl: Optional[float]) -> None:
+        raise NotImplementedError
+
+    def _delete_raw(self, key: str) -> None:
+        raise NotImplementedError
+
+    def _clear_raw(self, prefix: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryCache(Cache):
+    """プロセス内の LRU。エントリ数と（圧縮後の）合計バイト数で上限を決める"""
+
+    shared = False
+
+    def __init__(self, *, max_entries: int = 1024, max_bytes: Optional[int] = None, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set(key, value, ttl)
+
+    async def adelete(self, key: str) -> None:
+        self.delete(key)
+
+    def _get_raw(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def _set_raw(self, key: str, data: bytes, ttl: Optional[float]) -> None:
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (data, expires)
+            self._bytes += len(data)
+            evicted = 0
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes and len(self._entries) > 1
+            ):
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+
+    def _remove(self, key: str) -> None:
+        data, _ = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    def _delete_raw(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _clear_raw(self, prefix: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            stats.update(entries=len(self._entries), bytes=self._bytes)
+        return stats
+
+
+class SQLiteCache(Cache):
+    """
+    SQLite ファイルのキャッシュ。同じファイルを開いた全ワーカーで共有される。
+    上限を超えたら最後に読まれた時刻の古いものから消す（確認は PRUNE_INTERVAL 回の書き込みごと）。
+    """
+
+    PRUNE_INTERVAL = 64
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        timeout: float = 5.0,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # 接続はスレッドごと。fork 後のワーカーは親の接続を使わず開き直す
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires REAL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _get_raw(self, key: str) -> Optional[bytes]:
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        data, expires = row
+        if expires is not None and expires <= now:
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires <= ?", (key, now))
+            return None
+        conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return data
+
+    def _set_raw(self, key: str, data: bytes, ttl: Optional[float]) -> None:
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), expires, now),
+        )
+        with self._writes_lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_INTERVAL == 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """期限切れと上限超過のエントリを消し、消した数を返す"""
+        conn = self._connection()
+        removed = conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?", (time.time(),)).rowcount
+        if self.max_entries is not None:
+            removed += conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        if self.max_bytes is not None:
+            # 新しいものから数えた累計サイズが上限を超える分を消す
+            removed += conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM ("
+                "SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS total FROM cache"
+                ") WHERE total > ?)",
+                (self.max_bytes,),
+            ).rowcount
+        if removed:
+            self._count("evictions", removed)
+        return removed
+
+    def _delete_raw(self, key: str) -> None:
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _clear_raw(self, prefix: str) -> None:
+        self._connection().execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        try:
+            prefix = f"{self.namespace}:"
+            entries, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE substr(key, 1, ?) = ?",
+                (len(prefix), prefix),
+            ).fetchone()
+            stats.update(entries=entries, bytes=size)
+        except sqlite3.Error:
+            pass
+        return stats
+
+
+class RedisError(Exception):
+    """Redis サーバーがエラー応答を返した"""
+
+
+class _RedisConnection:
+    """RESP2 で1本の接続を扱う最小限のクライアント"""
+
+    def __init__(self, host: str, port: int, *, db: int, password: Optional[str], timeout: float) -> None:
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if password:
+            self.command("AUTH", password)
+        if db:
+            self.command("SELECT", db)
+
+    def command(self, *args: Any) -> Any:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+        return self._read()
+
+    def _read(self) -> Any:
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the Redis server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by the Redis server")
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCache(Cache):
+    """
+    Redis プロトコルのサーバーを使うキャッシュ。全ワーカー・全レプリカで共有される。
+    サイズの上限はサーバー側の maxmemory と eviction ポリシー（allkeys-lru など）で決める。
+    """
+
+    def __init__(self, url: str, *, timeout: float = 1.0, pool_size: int = 8, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported cache URL: {url}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._pool: List[_RedisConnection] = []
+        self._pool_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _command(self, *args: Any) -> Any:
+        conn = None
+        with self._pool_lock:
+            if self._pid != os.getpid():
+                # fork 後は親の接続を共有しない
+                self._pool, self._pid = [], os.getpid()
+            if self._pool:
+                conn = self._pool.pop()
+        if conn is None:
+            conn = _RedisConnection(self.host, self.port, db=self.db, password=self.password, timeout=self.timeout)
+        try:
+            result = conn.command(*args)
+        except RedisError:
+            self._release(conn)
+            raise
+        except Exception:
+            conn.close()
+            raise
+        self._release(conn)
+        return result
+
+    def _release(self, conn: _RedisConnection) -> None:
+        with self._pool_lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(conn)
+                return
+        conn.close()
+
+    def _get_raw(self, key: str) -> Optional[bytes]:
+        return self._command("GET", key)
+
+    def _set_raw(self, key: str, data: bytes, ttl: Optional[float]) -> None:
+        if ttl is None:
+            self._command("SET", key, data)
+        else:
+            self._command("SET", key, data, "PX", max(1, int(ttl * 1000)))
+
+    def _delete_raw(self, key: str) -> None:
+        self._command("DEL", key)
+
+    def _clear_raw(self, prefix: str) -> None:
+        cursor = b"0"
+        while True:
+            cursor, keys = self._command("SCAN", cursor, "MATCH", f"{prefix}*", "COUNT", 500)
+            if keys:
+                self._command("DEL", *keys)
+            if cursor in (b"0", "0"):
+                return
+
+    def ping(self) -> bool:
+        return self._command("PING") == "PONG"
+
+
+def create_cache(namespace: str, **overrides: Any) -> Cache:
+    """設定に従ってキャッシュを作る。overrides で名前空間ごとに上限や TTL を変えられる"""
+    settings = get_settings()
+    options: Dict[str, Any] = {
+        "namespace": namespace,
+        "default_ttl": settings.cache_default_ttl,
+        "compress_min_bytes": settings.cache_compress_min_bytes,
+    }
+    options.update(overrides)
+    backend = settings.cache_backend
+    if backend == "sqlite":
+        options.setdefault("max_entries", settings.cache_max_entries)
+        options.setdefault("max_bytes", settings.cache_max_bytes)
+        return SQLiteCache(settings.cache_path, **options)
+    if backend == "redis":
+        if not settings.cache_url:
+            raise ValueError("CACHE_URL is required for the redis cache backend")
+        return RedisCache(settings.cache_url, timeout=settings.cache_timeout, **options)
+    options.setdefault("max_entries", settings.cache_max_entries)
+    options.setdefault("max_bytes", settings.cache_max_bytes)
+    return MemoryCache(**options)
+
+
+@lru_cache(maxsize=None)
+def get_cache(namespace: str) -> Cache:
+    """名前空間ごとに1つのキャッシュをプロセス内で共有する"""
+    return create_cache(namespace)
@@ -0,0 +1,39 @@
+"""
+外部 SDK のクライアントを遅延生成して共有するモジュール。
+
+google.genai と google.cloud.discoveryengine_v1 は読み込むだけで1秒近くかかるため、
+モジュールの読み込み時には import せず、最初に使うとき（または起動時のウォームアップ）に読み込む。
+クライアントはプロセス内で1つずつ作り、リクエストごとに作り直さない。
+"""
+
+import logging
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from .config import get_settings
+
+if TYPE_CHECKING:
+    from google import genai
+    from google.cloud import discoveryengine_v1
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_genai_client() -> "genai.Client":
+    """Gemini API クライアント。HTTP 接続はイベントループごとに SDK 側で管理される"""
+    from google import genai
+
+    client = genai.Client(api_key=get_settings().google_api_key)
+    logger.info("Gemini API client created.")
+    return client
+
+
+@lru_cache(maxsize=1)
+def get_search_client() -> "discoveryengine_v1.SearchServiceClient":
+    """Vertex AI Search クライアント。gRPC チャネルはスレッド間で共有できる"""
+    from google.cloud import discoveryengine_v1
+
+    client = discoveryengine_v1.SearchServiceClient()
+    logger.info("Vertex AI Search client created.")
+    return client
@@ -1,5 +1,6 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Literal, Optional
 
 
 class Settings(BaseSettings):
@@ -29,7 +30,87 @@ class Settings(BaseSettings):
     vertex_ai_project_id: str
     vertex_ai_location: str
     vertex_ai_data_store_id: str
-    
+
+    # 経典検索バックエンド
+    # ("vertex": Vertex AI Search, "local": ローカルBM25索引, "vector": ローカルベクトル索引, "hybrid": 並行検索して統合)
+    sutra_search_backend: Literal["vertex", "local", "vector", "hybrid"] = "vertex"
+    # build_index で作成したローカル索引のディレクトリ（未設定ならローカル検索は無効）
+    sutra_index_dir: Optional[str] = None
+    # 1回の検索で取得する件数（出典の重複を除く前）
+    sutra_search_page_size: int = 10
+    # 1回の経典検索で取得し、法話の下書きに配る引用の数
+    sutra_quotes_per_search: int = 1
+    # ベクトル索引で IVF を使う場合に探索するリスト数
+    sutra_vector_nprobe: int = 8
+    # ハイブリッド検索で並行に問い合わせるバックエンド
+    sutra_hybrid_backends: list[Literal["vertex", "local", "vector"]] = ["vertex", "local", "vector"]
+    # "fuse": 順位を RRF で統合 / "race": 最初に結果を返したバックエンドを採用
+    sutra_hybrid_strategy: Literal["fuse", "race"] = "fuse"
+    # 各バックエンドから取得して統合する件数
+    sutra_hybrid_depth: int = 10
+    # バックエンドごとのタイムアウト（秒）。超えたバックエンドは待たずに切り捨てる
+    sutra_backend_timeout: float = 3.0
+    # Reciprocal Rank Fusion の定数 k
+    sutra_rrf_k: int = 60
+
+    # 時事ネタの最大件数（1件ごとに法話の下書きを1本書く）
+    news_max_topics: int = 5
+    # この類似度（文字 bigram の Jaccard 係数）以上の時事ネタは重複として除く
+    news_topic_similarity: float = 0.6
+
+    # 時事ネタ検索を経典検索の完了を待たずにテーマだけで同時に始める（投機的実行）。
+    # 話題が引用と合わなければ検索し直すので、その分だけ LLM の呼び出しが増える。既定では使わない
+    news_speculative: bool = False
+    # 投機的に得た時事ネタのうち、テーマ・検索キーワードとの関連度（rank_topics_by_relevance）がこれ未満のものは
+    # 使わない。0.5 は活用違いの語を残し、熟語の1文字だけが共通する語を除く。1件も残らなければ引用付きで検索し直す
+    news_min_relevance: float = 0.5
+
+    # 起動直後にバックグラウンドで SDK の読み込みとクライアント生成を済ませる（False なら最初のリクエスト時）
+    warmup_on_startup: bool = True
+
+    # 本番起動（python -m app.core.server）の設定
+    # ワーカープロセス数（未設定ならコンテナで使える CPU 数）
+    web_concurrency: Optional[int] = None
+    # 1ワーカーがこの件数のリクエストを処理したら入れ替える（0 なら入れ替えない）
+    max_requests: int = 0
+    # ワーカーが一斉に入れ替わらないよう max_requests に足す乱数の上限
+    max_requests_jitter: int = 0
+    # 停止・再起動時、実行中の法話生成の完了を待つ秒数。過ぎたものはチェックポイントを残してキャンセルする
+    drain_timeout: float = 20
+    # ドレインの後、残った接続の終了を待つ秒数
+    # （drain_timeout + graceful_timeout を Pod の terminationGracePeriodSeconds（既定 30 秒）より短くする）
+    graceful_timeout: int = 5
+    # 打ち切った生成のチェックポイントを保持する秒数（共有キャッシュに保存し、同じリクエストの再試行で再開する）
+    checkpoint_ttl: float = 3600
+
+    # 対話型 API のセッション（ステップ間で引き継ぐコンテキスト）を最後の呼び出しから保持する秒数
+    session_ttl: float = 1800
+
+    # 共有キャッシュ（"memory": ワーカーごと, "sqlite": 同じノードのワーカーで共有, "redis": 全レプリカで共有）
+    cache_backend: Literal["memory", "sqlite", "redis"] = "memory"
+    # SQLite バックエンドのファイル
+    cache_path: str = "data/cache.sqlite3"
+    # Redis バックエンドの接続先（redis://[:password@]host:port/db）
+    cache_url: Optional[str] = None
+    # Redis への1回の問い合わせのタイムアウト（秒）
+    cache_timeout: float = 1.0
+    # 既定の有効期限（秒、未設定なら無期限）
+    cache_default_ttl: Optional[float] = 3600
+    # memory / sqlite のエントリ数と合計バイト数の上限（redis はサーバーの maxmemory で決める）
+    cache_max_entries: int = 10000
+    cache_max_bytes: Optional[int] = 256 * 1024 * 1024
+    # このバイト数以上の値は zlib で圧縮して保存する
+    cache_compress_min_bytes: int = 1024
+
+    # 生成した法話の保存先（SQLite。空にすると保存しない）。相対パスは backend ディレクトリから。
+    # コンテナのファイルシステムやボリュームが消えれば記録も消えるキャッシュとして扱う
+    howa_store_path: Optional[str] = "data/howa.sqlite3"
+    # 同じリクエストに保存済みの法話を返す期間（秒）。既定の 0 では再利用せず、毎回生成する
+    howa_reuse_max_age: float = 0
+    # まとめて書き込む最大件数と、最初の1件から書き込むまでに待つ秒数
+    howa_store_batch_size: int = 32
+    howa_store_flush_interval: float = 1.0
+
     # データベース設定（将来使用）
     database_url: Optional[str] = None
     
@@ -40,5 +121,14 @@ class Settings(BaseSettings):
         env_file = ".env"
 
 
-# グローバル設定インスタンス
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """設定を初めて参照したときに環境変数と .env から読み込む"""
+    return Settings()
+
+
+def __getattr__(name: str):
+    # 従来の `from app.core.config import settings` もそのまま使えるよう、参照時に生成する
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
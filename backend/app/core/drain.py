@@ -0,0 +1,81 @@
+"""
+ローリングデプロイ時の穏やかな停止（ドレイン）。
+
+法話の生成は 30〜60 秒かかるため、停止の合図を受けてもすぐには止めない。
+ドレインを始めると /healthz が 503 を返して新しいリクエストが振り分けられなくなり、新しい生成は
+503 で断る。実行中の生成は期限（DRAIN_TIMEOUT）まで待ち、終わらなかったものはキャンセルする
+（生成側はキャンセル時に途中経過をチェックポイントとして保存する）。
+
+MAX_REQUESTS によるワーカーの入れ替えでは、ワーカーが待ち受けをやめるだけで Pod は残るので、
+/healthz も新しい生成も断らずに、実行中の生成だけを待つ（reject_new=False）。
+"""
+
+import asyncio
+from typing import Awaitable, Set, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# ドレイン中に断った生成の 503 応答に付ける Retry-After（別の Pod に振り分けられるまでの目安）
+RETRY_AFTER_SECONDS = 5
+
+
+class DrainingError(Exception):
+    """ドレイン中のため生成を受け付けない、またはドレインの期限で生成を打ち切った"""
+
+
+class Drain:
+    """実行中の生成を追跡し、停止時にそれらの完了を待つ"""
+
+    def __init__(self) -> None:
+        self.draining = False
+        self._tasks: Set["asyncio.Task"] = set()
+        self._cancelled: Set["asyncio.Task"] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def run(self, coro: Awaitable[T]) -> T:
+        """coro を追跡しながら実行する。ドレイン中、またはドレインで打ち切られたら DrainingError"""
+        if self.draining:
+            if asyncio.iscoroutine(coro):
+                coro.close()
+            raise DrainingError("Server is shutting down")
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # 呼び出し側（リクエスト自体）のキャンセルはそのまま伝え、ドレインによる打ち切りだけを変換する
+            current = asyncio.current_task()
+            if task in self._cancelled and not (current and current.cancelling()):
+                raise DrainingError("Generation was interrupted by shutdown") from None
+            raise
+        finally:
+            self._tasks.discard(task)
+            self._cancelled.discard(task)
+
+    async def drain(self, timeout: float, *, reject_new: bool = True) -> Tuple[int, int]:
+        """
+        新しい生成を断り（reject_new=False なら断らずに）、実行中の生成を timeout 秒まで待つ。
+        (完了した数, キャンセルした数) を返す
+        """
+        if reject_new:
+            self.draining = True
+        pending = set(self._tasks)
+        done: Set["asyncio.Task"] = set()
+        not_done: Set["asyncio.Task"] = set()
+        if pending:
+            done, not_done = await asyncio.wait(pending, timeout=timeout)
+        for task in not_done:
+            self._cancelled.add(task)
+            task.cancel()
+        if not_done:
+            # キャンセルされた生成がチェックポイントを書き終えるまで待つ
+            await asyncio.gather(*not_done, return_exceptions=True)
+        return len(done), len(not_done)
+
+
+# プロセス内で1つ。エンドポイントとサーバーの停止処理で共有する
+drain = Drain()
+
@@ -0,0 +1,353 @@
+"""
+本番用のマルチワーカー起動。
+
+    python -m app.core.server [--workers N]
+
+親プロセスがアプリと読み取り専用のローカル索引を読み込んでからソケットを開き、ワーカーを fork する。
+各ワーカーは同じソケットで uvicorn を動かす（uvloop / httptools があれば使う）。索引のメモリは
+copy-on-write でワーカー間に共有される。親はワーカーを監視し、次を受け持つ。
+
+- 終了したワーカー（MAX_REQUESTS に達して入れ替わったものを含む）を作り直す
+- SIGHUP: 新しいワーカーを起動してから古いワーカーを1つずつ穏やかに止める（無停止の入れ替え）。
+  止めているワーカーの終了も監視のループで回収するので、入れ替え中に落ちたワーカーもすぐに作り直される
+- SIGTERM / SIGINT: 全ワーカーをドレインし（app.core.drain）、処理中のリクエストを終えさせてから終了する
+
+SIGHUP では親が読み込んだコードを使い続けるため、コードの更新にはプロセスの再起動が必要。
+"""
+
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import pathlib
+import random
+import signal
+import socket
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+
+from .config import get_settings
+from .drain import drain
+
+logger = logging.getLogger("uvicorn.error")
+
+APP = "main:app"
+# ワーカーが起動直後に落ち続けるときに作り直しを待つ秒数
+RESPAWN_BACKOFF = 1.0
+# 起動からこの秒数以内にエラーで終了したワーカーは起動失敗とみなす
+MIN_WORKER_LIFETIME = 5.0
+# アプリの起動（lifespan startup）に失敗したワーカーの終了コード（uvicorn と同じ）
+STARTUP_FAILURE = 3
+
+
+def _cgroup_cpu_limit(root: pathlib.Path) -> Optional[float]:
+    """cgroup で制限されている CPU 数（cgroup v2 / v1）。制限が無ければ None"""
+    try:
+        quota, period = (root / "cpu.max").read_text().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int((root / "cpu" / "cpu.cfs_quota_us").read_text())
+        period = int((root / "cpu" / "cpu.cfs_period_us").read_text())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def available_cpus(cgroup_root: pathlib.Path = pathlib.Path("/sys/fs/cgroup")) -> int:
+    """このプロセスが使える CPU 数。コンテナの CPU 制限があればそれに合わせる"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit(cgroup_root)
+    if limit is not None:
+        cpus = min(cpus, max(1, int(limit)))
+    return max(1, cpus)
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    最初の停止シグナルでドレインを始め、実行中の生成が終わる（または期限が来る）まで待ってから
+    uvicorn の通常の停止に進む。ドレイン中も /healthz などには応答し続ける。2回目のシグナルではドレインを待たない。
+
+    max_requests に達したときと SIGHUP の再起動（親からの SIGUSR1）による入れ替えも同じドレインを通す
+    （uvicorn の limit_max_requests はドレインせずに止まるので使わない）。入れ替えでは先に待ち受けをやめて新しい接続を他のワーカーに回し、
+    Pod としては停止しないので /healthz は 503 にせず、既に受けた接続の生成も断らない。
+    """
+
+    def __init__(self, config: uvicorn.Config, drain_timeout: float, max_requests: Optional[int] = None) -> None:
+        super().__init__(config)
+        self.drain_timeout = drain_timeout
+        self.max_requests = max_requests
+        self._draining = False
+
+    def handle_exit(self, sig: int, frame) -> None:
+        if self._draining or self.should_exit:
+            super().handle_exit(sig, frame)
+            return
+        self._draining = True
+        # シグナルハンドラからはイベントループを起こしてドレインを始めるだけにする
+        asyncio.get_event_loop().call_soon_threadsafe(lambda: asyncio.ensure_future(self._drain_then_exit(sig)))
+
+    async def on_tick(self, counter: int) -> bool:
+        if (
+            self.max_requests is not None
+            and not self._draining
+            and self.server_state.total_requests >= self.max_requests
+        ):
+            logger.info(f"Maximum request limit of {self.max_requests} exceeded. Recycling worker.")
+            self.retire()
+        return await super().on_tick(counter)
+
+    def retire(self) -> None:
+        """入れ替えのために待ち受けをやめ、実行中の生成を終えてから止まる"""
+        if self._draining or self.should_exit:
+            return
+        self._draining = True
+        for server in self.servers:
+            server.close()
+        asyncio.ensure_future(self._drain_then_exit(signal.SIGTERM, recycle=True))
+
+    def handle_retire(self, sig: int, frame) -> None:
+        asyncio.get_event_loop().call_soon_threadsafe(self.retire)
+
+    async def _drain_then_exit(self, sig: int, recycle: bool = False) -> None:
+        logger.info(f"Draining {drain.in_flight} in-flight generations (up to {self.drain_timeout:g}s)")
+        try:
+            completed, cancelled = await drain.drain(self.drain_timeout, reject_new=not recycle)
+            logger.info(f"Drained: {completed} generations completed, {cancelled} cancelled and checkpointed")
+        finally:
+            super().handle_exit(sig, None)
+
+
+class Supervisor:
+    """fork したワーカーを監視し、入れ替えと穏やかな停止を行う"""
+
+    def __init__(
+        self,
+        config: uvicorn.Config,
+        sock: socket.socket,
+        workers: int,
+        *,
+        max_requests: Optional[int],
+        max_requests_jitter: int,
+        drain_timeout: float,
+    ) -> None:
+        self.config = config
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.drain_timeout = drain_timeout
+        # ドレインと残った接続の終了を待ち、それでも終わらないワーカーは強制終了する
+        self.stop_timeout = drain_timeout + config.timeout_graceful_shutdown + 5
+        self.children: Dict[int, float] = {}  # pid -> 起動時刻
+        self.retiring: Dict[int, float] = {}  # 停止を指示したワーカーの pid -> 強制終了する時刻
+        self._replace: List[int] = []  # SIGHUP で入れ替えを待っているワーカー
+        self._stopping = False
+        self._reload = False
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        logger.info(f"Started supervisor [{os.getpid()}] with {self.workers} workers")
+        # 読み込み済みのオブジェクトを GC の対象から外し、fork 後に参照カウント以外でページが書き換わらないようにする
+        gc.freeze()
+        for _ in range(self.workers):
+            self._spawn()
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                logger.info("Reloading workers")
+                self._replace = list(self.children)
+            self._reap()
+            self._rolling_restart()
+            time.sleep(0.2)
+        self._shutdown()
+
+    def _handle_stop(self, signum: int, frame) -> None:
+        self._stopping = True
+
+    def _handle_reload(self, signum: int, frame) -> None:
+        self._reload = True
+
+    def _spawn(self) -> int:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return pid
+        # ワーカー側。親のシグナルハンドラを外し、uvicorn に SIGTERM / SIGINT を任せる
+        status = 0
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            max_requests = self.max_requests
+            if max_requests and self.max_requests_jitter:
+                max_requests += random.randint(0, self.max_requests_jitter)
+            server = DrainingServer(self.config, self.drain_timeout, max_requests)
+            signal.signal(signal.SIGUSR1, server.handle_retire)
+            server.run(sockets=[self.sock])
+            if not server.started:
+                status = STARTUP_FAILURE
+        except BaseException:
+            logger.exception(f"Worker [{os.getpid()}] failed")
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _reap(self) -> None:
+        """
+        終了したワーカーを回収し、停止中でなければ作り直す。停止を指示したワーカーは作り直さず、
+        期限を過ぎても終わらなければ強制終了する
+        """
+        now = time.monotonic()
+        for pid, deadline in self.retiring.items():
+            if now >= deadline:
+                logger.warning(f"Worker [{pid}] did not stop in time; killing it")
+                self._kill(pid)
+                # 回収されるまで何度も強制終了しない
+                self.retiring[pid] = float("inf")
+        while self.children or self.retiring:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self.retiring.pop(pid, None) is not None:
+                logger.info(f"Worker [{pid}] stopped")
+                continue
+            started = self.children.pop(pid, None)
+            if started is None or self._stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code > 0 and time.monotonic() - started < MIN_WORKER_LIFETIME:
+                logger.error(f"Worker [{pid}] failed to start (status {code}); respawning in {RESPAWN_BACKOFF:g}s")
+                time.sleep(RESPAWN_BACKOFF)
+            else:
+                logger.info(f"Worker [{pid}] exited; respawning")
+            self._spawn()
+
+    def _rolling_restart(self) -> None:
+        """
+        入れ替えを待っているワーカーを1つ進める。新しいワーカーを先に起動してから古いワーカーに停止を指示し、
+        それが終了してから次に進むので、受け付け数は減らず、同時に増えるワーカーも1つだけになる
+        """
+        if self.retiring:
+            return
+        while self._replace:
+            pid = self._replace.pop(0)
+            # 入れ替えを待つ間に終了して作り直されたワーカーは飛ばす
+            if pid in self.children:
+                self._spawn()
+                self._terminate(pid)
+                return
+
+    def _terminate(self, pid: int) -> None:
+        """
+        ワーカーに処理中のリクエストを終えさせて止めるよう指示する。終了は _reap で回収する。
+        Pod は止まらないので SIGTERM ではなく SIGUSR1 で送り、/healthz を 503 にさせない
+        """
+        self.children.pop(pid, None)
+        try:
+            os.kill(pid, signal.SIGUSR1)
+        except ProcessLookupError:
+            return
+        self.retiring[pid] = time.monotonic() + self.stop_timeout
+
+    @staticmethod
+    def _kill(pid: int) -> None:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _shutdown(self) -> None:
+        logger.info(f"Stopping {len(self.children)} workers")
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        # 入れ替えで停止を指示済みのワーカーも一緒に待つ
+        self.children.update(self.retiring)
+        self.retiring.clear()
+        deadline = time.monotonic() + self.stop_timeout
+        while self.children and time.monotonic() < deadline:
+            for pid in list(self.children):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    self.children.pop(pid)
+            time.sleep(0.1)
+        for pid in self.children:
+            logger.warning(f"Worker [{pid}] did not stop in time; killing it")
+            self._kill(pid)
+        self.sock.close()
+        logger.info("Supervisor stopped")
+
+
+def build_config() -> uvicorn.Config:
+    settings = get_settings()
+    return uvicorn.Config(
+        APP,
+        host=settings.host,
+        port=settings.port,
+        loop="auto",  # uvloop があれば使う
+        http="auto",  # httptools があれば使う
+        log_level="debug" if settings.debug else "info",
+        timeout_graceful_shutdown=settings.graceful_timeout,
+    )
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, help="ワーカー数（既定: WEB_CONCURRENCY、未設定なら使える CPU 数。CACHE_BACKEND=memory では 1）")
+    args = parser.parse_args(argv)
+
+    settings = get_settings()
+    workers = args.workers or settings.web_concurrency
+    if settings.cache_backend == "memory":
+        # 対話型 API のセッションやチェックポイントがワーカーごとに分かれ、別のワーカーに届いた続きのリクエストが失敗する
+        if not workers:
+            logger.warning("CACHE_BACKEND=memory is not shared between workers; running a single worker")
+            workers = 1
+        elif workers > 1:
+            logger.warning(
+                f"CACHE_BACKEND=memory is not shared between {workers} workers; "
+                "sessions and checkpoints only resume on the worker that created them"
+            )
+    workers = workers or available_cpus()
+    config = build_config()
+    # fork 前にアプリと索引を読み込み、ワーカーに引き継ぐ
+    config.load()
+    from app.services.warmup import preload_indexes
+
+    preload_indexes()
+    sock = config.bind_socket()
+
+    max_requests = settings.max_requests or None
+    if workers == 1:
+        DrainingServer(config, settings.drain_timeout, max_requests).run(sockets=[sock])
+        return
+    Supervisor(
+        config,
+        sock,
+        workers,
+        max_requests=max_requests,
+        max_requests_jitter=settings.max_requests_jitter,
+        drain_timeout=settings.drain_timeout,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Gemini API のトークン使用量の集計。
+
+track_usage() の中で呼ばれた generate_content の usage_metadata を record_usage() で足し合わせる。
+集計先は contextvars で渡すので、asyncio.gather で並行に実行したエージェントの分もまとめて数えられる。
+track_usage() を入れ子にすると、内側の集計は抜けるときに外側にも足される。
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+
+
+@dataclass
+class TokenUsage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+
+
+_current: ContextVar[Optional[TokenUsage]] = ContextVar("token_usage", default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[TokenUsage]:
+    parent = _current.get()
+    usage = TokenUsage()
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+        if parent is not None:
+            parent.calls += usage.calls
+            parent.prompt_tokens += usage.prompt_tokens
+            parent.output_tokens += usage.output_tokens
+            parent.total_tokens += usage.total_tokens
+
+
+def record_usage(response: Any) -> None:
+    """generate_content のレスポンスの使用量を、集計中であれば加算する"""
+    usage = _current.get()
+    if usage is None:
+        return
+    metadata = getattr(response, "usage_metadata", None)
+    usage.calls += 1
+    if metadata is None:
+        return
+    usage.prompt_tokens += getattr(metadata, "prompt_token_count", None) or 0
+    usage.output_tokens += getattr(metadata, "candidates_token_count", None) or 0
+    usage.total_tokens += getattr(metadata, "total_token_count", None) or 0
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Literal
+from typing import List, Dict, Any, Literal, Optional
 from enum import Enum
 
 
@@ -32,17 +32,39 @@ class HowaResponse(BaseModel):
     sutra_quote: SutraQuote = Field(..., description="法話の根拠となる、経典からの引用")
     modern_example: str = Field(..., description="教えを現代のシーンで解説する、具体的な例え話")
     conclusion: str = Field(..., description="聴衆が持ち帰れる、物語の締めくくりと実践のヒント")
+    id: Optional[str] = Field(None, description="保存された法話の ID（GET /v1/howa/{id} で再取得できる）")
     #candidates: List[str] = Field(..., description="[デバッグ用] 生成された法話の候補一覧")
     
+class StoredHowaResponse(BaseModel):
+    """保存された法話とその生成記録"""
+    id: str
+    theme: str
+    audiences: List[str]
+    created_at: float = Field(..., description="生成日時（UNIX 時刻）")
+    howa: HowaResponse
+    candidates: List[Any] = Field(default=[], description="評価前の法話の候補")
+    timings: Dict[str, float] = Field(default={}, description="ステップごとの所要時間（秒）")
+    llm_calls: int
+    prompt_tokens: int
+    output_tokens: int
+    total_tokens: int
+
+InteractiveStep = Literal["create_prompts", "run_news_search", "run_sutra_search","write_howa", "evaluate_howa"]
+
 class InteractiveStepRequest(BaseModel):
     """対話型APIのリクエスト"""
-    step: Literal["create_prompts", "run_news_search", "run_sutra_search","write_howa", "evaluate_howa"]
-    theme: str
-    audiences: List[str] = Field(default=[], description="対象となる聴衆の種類", example=["若者", "ビジネスパーソン"])
-    context: Dict[str, Any] = {} # 前のステップからの情報を引き継ぐためのコンテキスト
+    step: InteractiveStep
+    until: Optional[InteractiveStep] = Field(None, description="step からこのステップまでを順に実行する")
+    session_id: Optional[str] = Field(None, description="前のステップのレスポンスで返されたセッション ID")
+    theme: Optional[str] = Field(None, description="法話のテーマ（セッションを新しく始めるときは必須）")
+    audiences: Optional[List[str]] = Field(default=None, description="対象となる聴衆の種類", example=["若者", "ビジネスパーソン"])
+    context: Dict[str, Any] = {} # セッションのコンテキストに追加・上書きする情報（セッションを使わない従来の呼び出し方）
+    keep_session: bool = Field(False, description="新しいセッションを始めてサーバー側に結果を保存し、session_id を返す")
 
 class InteractiveStepResponse(BaseModel):
     """対話型APIのレスポンス"""
     step: str
     result: Dict[str, Any]
-    message: str
\ No newline at end of file
+    message: str
+    session_id: Optional[str] = Field(None, description="セッションを使う呼び出しのセッション ID")
+    steps: List[str] = Field(default=[], description="実行したステップ")
\ No newline at end of file
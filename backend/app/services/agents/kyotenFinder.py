@@ -1,14 +1,23 @@
 import asyncio
 import json
+import logging
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Awaitable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
 
-from google.protobuf.struct_pb2 import ListValue, Struct, Value
+from app.core.clients import get_search_client
+from app.core.config import get_settings
+from app.services.corpus.loader import load_local_index, load_vector_index
+from app.services.corpus.segments import Segment
 
-from google.cloud import discoveryengine_v1 as discoveryengine
-from google.protobuf.json_format import MessageToDict
+if TYPE_CHECKING:
+    from google.cloud import discoveryengine_v1 as discoveryengine
+    from google.protobuf.struct_pb2 import Value
 
-from app.core.config import settings
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
 
 
 @dataclass
@@ -24,18 +33,215 @@ class KyotenSearchResponse:
     related_themes: List[str] = field(default_factory=list)
 
 
+# Vertex AI Search のレスポンスのうち、_parse_search_results が読むフィールド
+SEARCH_RESPONSE_FIELD_MASK = ",".join([
+    "results.id",
+    "results.document.id",
+    "results.document.struct_data",
+    "results.document.derived_struct_data",
+    "results.document.json_data",
+])
+
+# _build_response_from_payload が参照するキー。高速デコーダはこれ以外のフィールドを読まない
+SUTRA_TEXT_KEYS = ("sutra_text", "sutraText", "quote", "title")
+SOURCE_KEYS = ("source", "sutra_source", "sutraSource", "book")
+CONTEXT_KEYS = ("context", "summary", "explanation", "description")
+RELATED_THEMES_KEYS = ("related_themes", "relatedThemes", "themes", "keywords")
+PAYLOAD_KEYS = SUTRA_TEXT_KEYS + SOURCE_KEYS + CONTEXT_KEYS + RELATED_THEMES_KEYS
+
+# (ドキュメントID, レスポンス) の組。ID は Vertex とローカル索引で共通のセグメントID
+RankedResult = Tuple[str, KyotenSearchResponse]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[RankedResult]], k: int = 60) -> List[RankedResult]:
+    """複数の順位リストを Reciprocal Rank Fusion で1つに統合する"""
+    scores: Dict[str, float] = {}
+    responses: Dict[str, KyotenSearchResponse] = {}
+    for ranked in rankings:
+        for rank, (key, response) in enumerate(ranked, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            responses.setdefault(key, response)
+    ordered = sorted(scores, key=scores.__getitem__, reverse=True)
+    return [(key, responses[key]) for key in ordered]
+
+
+def _run_sync(coro: Awaitable[T]) -> T:
+    """
+    コルーチンを同期的に実行する。イベントループ上から呼ばれたときは asyncio.run が使えないので、
+    別スレッドの新しいループで実行して完了を待つ
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    logger.warning("Synchronous sutra search called from a running event loop; use search_top_k_async instead")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
 class KyotenFinder:
-    """Vertex AI Search を使って拠点情報を検索するクラス"""
+    """Vertex AI Search またはローカル索引を使って拠点情報を検索するクラス"""
 
     def __init__(self) -> None:
+        settings = get_settings()
         self.project_id = settings.vertex_ai_project_id
         self.location = settings.vertex_ai_location
         self.data_store_id = settings.vertex_ai_data_store_id
+        self.backend = settings.sutra_search_backend
+        self.local_index_dir = settings.sutra_index_dir
+        self.vector_nprobe = settings.sutra_vector_nprobe
+        self.hybrid_backends = settings.sutra_hybrid_backends
+        self.hybrid_strategy = settings.sutra_hybrid_strategy
+        self.hybrid_depth = settings.sutra_hybrid_depth
+        self.backend_timeout = settings.sutra_backend_timeout
+        self.rrf_k = settings.sutra_rrf_k
+        self.page_size = settings.sutra_search_page_size
 
     def search(self, search_query: str) -> KyotenSearchResponse:
+        """設定されたバックエンドで検索し、KyotenSearchResponse形式で返す"""
+        results = self.search_top_k(search_query, k=1)
+        return results[0] if results else self._build_fallback_response(search_query)
+
+    async def search_async(self, search_query: str) -> KyotenSearchResponse:
+        """イベントループ上から呼ぶための検索。ブロッキングなバックエンドは別スレッドで実行する"""
+        results = await self.search_top_k_async(search_query, k=1)
+        return results[0] if results else self._build_fallback_response(search_query)
+
+    def search_top_k(self, search_query: str, k: int = 3) -> List[KyotenSearchResponse]:
+        """
+        1回の検索で上位 k 件の引用を返す。出典が同じ結果は1件にまとめる。
+        ヒットしない場合は空リストを返す（固定レスポンスでは埋めない）。
+        イベントループ上からは search_top_k_async を使う（この同期版は検索が終わるまでループを止める）。
+        """
+        if self.backend == "hybrid":
+            ranked = _run_sync(self._rank_hybrid(search_query))
+        else:
+            ranked = self._rank(self.backend, search_query, self._fetch_size(k))
+        return self._shape_results(ranked, k)
+
+    async def search_top_k_async(self, search_query: str, k: int = 3) -> List[KyotenSearchResponse]:
+        """search_top_k のイベントループ用"""
+        if self.backend == "hybrid":
+            return self._shape_results(await self._rank_hybrid(search_query), k)
+        # 結果のデコードも含めて別スレッドで行い、イベントループを塞がない
+        return await asyncio.to_thread(self.search_top_k, search_query, k)
+
+    def _fetch_size(self, k: int) -> int:
+        # 出典の重複を除いた後でも k 件残るよう、多めに取得する
+        return max(self.page_size, k * 2)
+
+    def _shape_results(self, ranked: Iterable["RankedResult"], k: int) -> List[KyotenSearchResponse]:
+        """順位を保ったまま出典で重複を除き、先頭 k 件に絞る"""
+        shaped: List[KyotenSearchResponse] = []
+        seen = set()
+        for _, response in ranked:
+            dedupe_key = " ".join(response.source.split()) or response.sutra_text
+            if dedupe_key in seen:
+                continue
+            seen.add(dedupe_key)
+            shaped.append(response)
+            if len(shaped) >= k:
+                break
+        return shaped
+
+    def search_vertex(self, search_query: str) -> KyotenSearchResponse:
         """データストアを検索し、KyotenSearchResponse形式で返す"""
+        first = next(self._rank_vertex(search_query, self.page_size), None)
+        return first[1] if first else self._build_fallback_response(search_query)
+
+    def search_local(self, search_query: str) -> Optional[KyotenSearchResponse]:
+        """ローカルBM25索引をプロセス内で検索する。索引が無い・ヒットしない場合は None"""
+        ranked = self._rank_local(search_query, limit=1)
+        return ranked[0][1] if ranked else None
+
+    def search_vector(self, search_query: str) -> Optional[KyotenSearchResponse]:
+        """ローカルのベクトル索引で意味的に近い一節を検索する。索引が無い・ヒットしない場合は None"""
+        ranked = self._rank_vector(search_query, limit=1)
+        return ranked[0][1] if ranked else None
+
+    async def search_hybrid(self, search_query: str, *, race: Optional[bool] = None) -> KyotenSearchResponse:
+        """
+        Vertex AI Search と設定済みのローカル索引を並行に検索する。
+        既定では各バックエンドの順位を Reciprocal Rank Fusion で統合し、
+        race=True（または sutra_hybrid_strategy="race"）では最初に結果を返したバックエンドを採用する。
+        タイムアウトまでに応答しなかったバックエンドは待たずに切り捨てる。
+        """
+        ranked = await self._rank_hybrid(search_query, race=race)
+        return ranked[0][1] if ranked else self._build_fallback_response(search_query)
+
+    async def _rank_hybrid(self, search_query: str, *, race: Optional[bool] = None) -> List["RankedResult"]:
+        if race is None:
+            race = self.hybrid_strategy == "race"
+
+        backends = self._available_backends()
+        tasks = {
+            asyncio.create_task(asyncio.to_thread(self._rank_list, name, search_query, self.hybrid_depth)): name
+            for name in backends
+        }
+        if not tasks:
+            return []
 
-        client = discoveryengine.SearchServiceClient()
+        rankings: Dict[str, List[RankedResult]] = {}
+        pending = set(tasks)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.backend_timeout
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = tasks[task]
+                    try:
+                        ranked = task.result()
+                    except Exception as e:
+                        logger.warning(f"Sutra search backend '{name}' failed: {e}")
+                        continue
+                    if ranked:
+                        rankings[name] = ranked
+                if race and rankings:
+                    break
+        finally:
+            for task in pending:
+                logger.warning(f"Sutra search backend '{tasks[task]}' dropped after {self.backend_timeout}s")
+                task.cancel()
+
+        # 順位の統合ではバックエンドの設定順を優先し、同点時の結果を安定させる
+        ordered = [rankings[name] for name in backends if name in rankings]
+        return reciprocal_rank_fusion(ordered, k=self.rrf_k)
+
+    def _available_backends(self) -> List[str]:
+        """ハイブリッド検索に参加できるバックエンド（索引が用意されていないものは除く）"""
+        available = []
+        for name in self.hybrid_backends:
+            if name in ("local", "vector") and not self.local_index_dir:
+                continue
+            if name == "vector":
+                from app.services.corpus.vector_index import VECTOR_META_FILENAME
+
+                if not (pathlib.Path(self.local_index_dir) / VECTOR_META_FILENAME).exists():
+                    continue
+            available.append(name)
+        return available
+
+    def _rank(self, backend: str, search_query: str, limit: int) -> Iterable["RankedResult"]:
+        if backend == "vertex":
+            return self._rank_vertex(search_query, limit)
+        if backend == "local":
+            return self._rank_local(search_query, limit)
+        if backend == "vector":
+            return self._rank_vector(search_query, limit)
+        raise ValueError(f"Unknown sutra search backend: {backend}")
+
+    def _rank_list(self, backend: str, search_query: str, limit: int) -> List["RankedResult"]:
+        return list(self._rank(backend, search_query, limit))
+
+    def _rank_vertex(self, search_query: str, page_size: int) -> Iterator["RankedResult"]:
+        # SDK は Vertex AI Search を使うときにだけ読み込む
+        from google.cloud import discoveryengine_v1 as discoveryengine
+
+        client = get_search_client()
         serving_config = client.serving_config_path(
             project=self.project_id,
             location=self.location,
@@ -46,37 +252,130 @@ class KyotenFinder:
         request = discoveryengine.SearchRequest(
             serving_config=serving_config,
             query=search_query,
-            page_size=10,
+            page_size=page_size,
+            # スニペットや要約は使わないので生成させない
+            content_search_spec=discoveryengine.SearchRequest.ContentSearchSpec(
+                snippet_spec=discoveryengine.SearchRequest.ContentSearchSpec.SnippetSpec(return_snippet=False),
+            ),
         )
 
-        response = client.search(request)
-        parsed = self._parse_search_response(response, search_query)
-        return parsed or self._build_fallback_response(search_query)
+        # レスポンスをパースに使うフィールドだけに絞り、転送量とデコード量を減らす
+        response = client.search(
+            request,
+            timeout=self.backend_timeout,
+            metadata=[("x-goog-fieldmask", SEARCH_RESPONSE_FIELD_MASK)],
+        )
+        return self._iter_search_results(response, search_query)
+
+    def _rank_local(self, search_query: str, limit: int) -> List["RankedResult"]:
+        if not self.local_index_dir:
+            return []
+        index = load_local_index(self.local_index_dir)
+        return [
+            (hit.segment.id, self._build_response_from_segment(hit.segment, search_query))
+            for hit in index.search(search_query, top_k=limit)
+        ]
+
+    def _rank_vector(self, search_query: str, limit: int) -> List["RankedResult"]:
+        if not self.local_index_dir:
+            return []
+        index = load_vector_index(self.local_index_dir, self.vector_nprobe)
+        return [
+            (hit.segment.id, self._build_response_from_segment(hit.segment, search_query))
+            for hit in index.search(search_query, top_k=limit)
+        ]
 
     async def search_sutra_placeholder(self, request: KyotenSearchRequest) -> KyotenSearchResponse:
-        """スタンドアロン動作用のダミー検索。検索テーマを受け取り固定レスポンスを返す"""
+        """スタンドアロン動作用の検索。ローカル索引があればそれを引き、無ければ固定レスポンスを返す"""
 
         await asyncio.sleep(0)
-        return self._build_fallback_response(request.theme)
+        try:
+            response = self.search_local(request.theme)
+        except Exception as e:
+            logger.warning(f"Local sutra index search failed: {e}. Using fixed response.")
+            response = None
+        return response or self._build_fallback_response(request.theme)
 
     def _parse_search_response(
         self,
-        response: discoveryengine.SearchResponse,
+        response: "discoveryengine.SearchResponse",
         search_query: str,
     ) -> Optional[KyotenSearchResponse]:
-        for result in getattr(response, "results", []):
+        ranked = self._parse_search_results(response, search_query)
+        return ranked[0][1] if ranked else None
+
+    def _parse_search_results(
+        self,
+        response: "discoveryengine.SearchResponse",
+        search_query: str,
+    ) -> List["RankedResult"]:
+        return list(self._iter_search_results(response, search_query))
+
+    def _iter_search_results(
+        self,
+        response: "discoveryengine.SearchResponse",
+        search_query: str,
+    ) -> Iterator["RankedResult"]:
+        """検索結果を必要になった分だけデコードする。上位1件しか使わない場合は残りを読まない"""
+        for index, result in enumerate(getattr(response, "results", [])):
             document = getattr(result, "document", None)
             if not document:
                 continue
 
-            payload = self._document_to_payload(document)
+            payload = self._decode_document(document)
             if not payload:
                 continue
 
-            return self._build_response_from_payload(payload, search_query)
+            key = getattr(document, "id", "") or getattr(result, "id", "") or str(index)
+            yield key, self._build_response_from_payload(payload, search_query)
+
+    def _decode_document(self, document: "discoveryengine.Document") -> Dict[str, Any]:
+        """
+        _build_response_from_payload が使うキー（PAYLOAD_KEYS）だけを1パスで取り出す高速デコーダ。
+        Struct 全体を再帰的に変換せず、生の protobuf の fields マップを直接引く。
+        proto-plus のメッセージでない場合や、PAYLOAD_KEYS を1つも含まない結果は、
+        従来の _document_to_payload で全体をデコードして返す（結果を落とさない）。
+        """
+        try:
+            pb = type(document).pb(document)
+        except (AttributeError, TypeError):
+            payload = self._document_to_payload(document)
+            return {key: payload[key] for key in PAYLOAD_KEYS if key in payload} or payload
+
+        for attr in ("struct_data", "derived_struct_data"):
+            fields = getattr(pb, attr).fields
+            if fields:
+                decode = self._decode_value
+                payload = {key: decode(fields[key]) for key in PAYLOAD_KEYS if key in fields}
+                return payload or self._document_to_payload(document)
+
+        if pb.json_data:
+            try:
+                parsed = json.loads(pb.json_data)
+            except json.JSONDecodeError:
+                return {}
+            if isinstance(parsed, dict):
+                return {key: parsed[key] for key in PAYLOAD_KEYS if key in parsed} or parsed
+
+        return {}
+
+    def _decode_value(self, value: "Value") -> Any:
+        kind = value.WhichOneof("kind")
+        if kind == "string_value":
+            return value.string_value
+        if kind == "list_value":
+            return [self._decode_value(item) for item in value.list_value.values]
+        if kind == "number_value":
+            return value.number_value
+        if kind == "bool_value":
+            return value.bool_value
+        if kind == "struct_value":
+            from google.protobuf.json_format import MessageToDict
+
+            return MessageToDict(value.struct_value, preserving_proto_field_name=True)
         return None
 
-    def _document_to_payload(self, document: discoveryengine.Document) -> Dict[str, Any]:
+    def _document_to_payload(self, document: "discoveryengine.Document") -> Dict[str, Any]:
         for attr in ("struct_data", "derived_struct_data"):
             payload = self._struct_to_dict(getattr(document, attr, None))
             if payload:
@@ -107,6 +406,8 @@ class KyotenFinder:
             except Exception:
                 pass
 
+        from google.protobuf.json_format import MessageToDict
+
         try:
             return MessageToDict(struct_obj, preserving_proto_field_name=True)
         except (TypeError, AttributeError):
@@ -118,6 +419,8 @@ class KyotenFinder:
             return {}
 
     def _convert_struct_value(self, value: Any) -> Any:
+        from google.protobuf.struct_pb2 import ListValue, Struct, Value
+
         if isinstance(value, dict):
             return {key: self._convert_struct_value(val) for key, val in value.items()}
 
@@ -152,27 +455,10 @@ class KyotenFinder:
         payload: Dict[str, Any],
         search_query: str,
     ) -> KyotenSearchResponse:
-        sutra_text = self._extract_text(
-            payload,
-            ["sutra_text", "sutraText", "quote", "title"],
-            search_query,
-        )
-        source = self._extract_text(
-            payload,
-            ["source", "sutra_source", "sutraSource", "book"],
-            "",
-        )
-        context = self._extract_text(
-            payload,
-            ["context", "summary", "explanation", "description"],
-            "",
-        )
-        related = (
-            payload.get("related_themes")
-            or payload.get("relatedThemes")
-            or payload.get("themes")
-            or payload.get("keywords")
-        )
+        sutra_text = self._extract_text(payload, SUTRA_TEXT_KEYS, search_query)
+        source = self._extract_text(payload, SOURCE_KEYS, "")
+        context = self._extract_text(payload, CONTEXT_KEYS, "")
+        related = next((payload[key] for key in RELATED_THEMES_KEYS if payload.get(key)), None)
         related_themes = self._normalize_related_themes(related)
 
         return KyotenSearchResponse(
@@ -182,7 +468,14 @@ class KyotenFinder:
             related_themes=related_themes,
         )
 
-    def _extract_text(self, payload: Dict[str, Any], keys: List[str], default_value: str) -> str:
+    def _build_response_from_segment(self, segment: Segment, search_query: str) -> KyotenSearchResponse:
+        payload = {
+            "sutra_text": segment.content,
+            "source": segment.title or segment.uri,
+        }
+        return self._build_response_from_payload(payload, search_query)
+
+    def _extract_text(self, payload: Dict[str, Any], keys: Sequence[str], default_value: str) -> str:
         for key in keys:
             value = payload.get(key)
             if isinstance(value, str):
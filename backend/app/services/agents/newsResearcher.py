@@ -1,16 +1,140 @@
-from google import genai
-from ...core.config import settings
-from typing import List, Dict, Any, Optional
+from ...core.clients import get_genai_client
+from ...core.config import get_settings
+from ...core.usage import record_usage
+from ..corpus.tokenizer import normalize_text, tokenize
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
+import json
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
+# 時事ネタを JSON の文字列配列で返させる（構造化出力）
+TOPICS_RESPONSE_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {"type": "ARRAY", "items": {"type": "STRING"}},
+}
+
+# 箇条書きの行頭（-, *, ・, 1. など）
+_BULLET = re.compile(r"^(\s*)(?:[-*+・•●]|\d+[.)．、]|[（(]?\d+[）)])\s+")
+# 見出し・前置きとみなす行（# 見出し、「：」で終わる行）
+_HEADER = re.compile(r"^\s*#|[:：]\s*$")
+# 話題として短すぎる・長すぎるもの（文字数）
+MIN_TOPIC_LENGTH = 8
+MAX_TOPIC_LENGTH = 400
+
+
+def _clean_topic(text: str) -> str:
+    text = re.sub(r"\*\*|__|`", "", text)
+    return text.strip().strip("\"'「」").strip()
+
+
+def _json_topics(text: str) -> Optional[List[str]]:
+    """文字列の JSON 配列（コードブロックで囲まれていてもよい）ならその要素を返す"""
+    match = re.search(r"\[.*\]", text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, list):
+        return None
+    topics = []
+    for item in data:
+        if isinstance(item, dict):
+            # {"topic": ..., "summary": ...} のような形で返ってきた場合は、文字列の値をつなげる
+            item = "。".join(str(value) for value in item.values() if isinstance(value, str))
+        if isinstance(item, str):
+            topics.append(item)
+    return topics
+
+
+def _bullet_topics(text: str) -> List[str]:
+    """最上位の箇条書きだけを話題とし、見出し・前置き・入れ子の箇条書きは捨てる"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    bullets = [(match, line) for line in lines if (match := _BULLET.match(line))]
+    if not bullets:
+        # 箇条書きが無ければ、見出し以外の各行を話題とみなす
+        return [line for line in lines if not _HEADER.search(line)]
+    top_indent = min(len(match.group(1).expandtabs()) for match, _ in bullets)
+    return [
+        line[match.end():]
+        for match, line in bullets
+        if len(match.group(1).expandtabs()) == top_indent
+    ]
+
+
+def _shingles(text: str) -> Set[str]:
+    chars = re.sub(r"[\W_]+", "", normalize_text(text))
+    if len(chars) < 2:
+        return {chars}
+    return {chars[i:i + 2] for i in range(len(chars) - 1)}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def topic_similarity(a: str, b: str) -> float:
+    """文字 bigram の Jaccard 係数"""
+    return _jaccard(_shingles(a), _shingles(b))
+
+
+def dedupe_topics(topics: List[str], threshold: float) -> List[str]:
+    """先に出た話題と似ている（類似度が threshold 以上の）話題を除く"""
+    kept: List[str] = []
+    kept_shingles: List[Set[str]] = []
+    for topic in topics:
+        shingles = _shingles(topic)
+        if any(_jaccard(shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(topic)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def _content_tokens(text: str) -> Set[str]:
+    """文字 unigram・bigram のうち、ひらがなだけのもの（助詞など）を除いたもの"""
+    return {token for token in tokenize(text) if not all("ぁ" <= char <= "ゟ" for char in token)}
+
+
+def rank_topics_by_relevance(topics: List[str], keywords: Iterable[str]) -> List[Tuple[float, str]]:
+    """
+    話題を keywords（テーマと経典検索のキーワード）との関連度の高い順に並べ、(関連度, 話題) のリストを返す。
+    関連度は、キーワードごとの内容語（文字 unigram・bigram）のうち話題に現れるものの割合の最大値。
+    「怒り」に対する「怒って」のような活用の違いは 0.5、「感謝」に対する「感動」のように
+    熟語の1文字だけが共通する語は 1/3 になる。
+    """
+    keyword_tokens = [tokens for tokens in map(_content_tokens, set(keywords)) if tokens]
+    scored = []
+    for topic in topics:
+        tokens = _content_tokens(topic)
+        score = max((len(keyword & tokens) / len(keyword) for keyword in keyword_tokens), default=0.0)
+        scored.append((score, topic))
+    return sorted(scored, key=lambda item: -item[0])
+
+
+def parse_topics(text: str, max_topics: int, similarity_threshold: float = 0.6) -> List[str]:
+    """
+    モデルの出力から時事ネタを取り出す。JSON 配列を優先し、だめなら箇条書きとして読む。
+    短すぎる・長すぎるもの、見出し、重複を除き、先頭から max_topics 件までを返す。
+    """
+    candidates = _json_topics(text)
+    if candidates is None:
+        candidates = _bullet_topics(text)
+    topics = [
+        topic for topic in map(_clean_topic, candidates)
+        if MIN_TOPIC_LENGTH <= len(topic) <= MAX_TOPIC_LENGTH and not _HEADER.search(topic)
+    ]
+    return dedupe_topics(topics, similarity_threshold)[:max_topics]
+
 class NewsResearcher:
     """時事ニュースを調査する遊行僧エージェント (News Researcher)"""
 
     def __init__(self):
         try:
-            self.client = genai.Client(api_key=settings.google_api_key)
+            self.client = get_genai_client()
             logger.info("NewsResearcher initialized successfully with Google Search.")
         except Exception as e:
             logger.error(f"Failed to initialize NewsResearcher: {e}")
@@ -23,8 +147,10 @@ class NewsResearcher:
     ) -> List[str]:
         """
         司令塔から与えられた基本プロンプトと、オプションの経典データに基づき
-        時事ニュースを調査し、結果を箇条書きリストで返す。
+        時事ニュースを調査し、結果をリストで返す。
+        話題は検証・重複除去のうえ NEWS_MAX_TOPICS 件までに絞る（1件につき執筆の呼び出しが1回増えるため）。
         """
+        settings = get_settings()
         final_prompt = base_prompt
         
         # もし経典データがあれば、それを参考情報としてプロンプトに追記する
@@ -45,12 +171,16 @@ class NewsResearcher:
         try:
             response = await self.client.aio.models.generate_content(
                 model='gemini-2.5-flash',
-                contents=final_prompt
+                contents=final_prompt,
+                config=TOPICS_RESPONSE_CONFIG,
             )
-            
-            # レスポンスを箇条書きのリストに分割
-            topics = [line.strip().lstrip('- ').strip() for line in response.text.strip().split('\n') if line.strip()]
-            
+            record_usage(response)
+
+            # レスポンスから話題を取り出し、重複を除いて上限までに絞る
+            topics = parse_topics(
+                response.text or "", settings.news_max_topics, settings.news_topic_similarity
+            )
+
             logger.info(f"YugyusoAgent found {len(topics)} topics.")
             return topics
         except Exception as e:
@@ -1,6 +1,10 @@
+import asyncio
 import logging
-from google import genai
-from ...core.config import settings
+from ...core.clients import get_genai_client
+from ...core.config import get_settings
+from ..corpus.query_builder import build_sutra_query
+from ..corpus.bm25_index import BM25Index
+from ..corpus.loader import load_local_index
 from typing import Dict, Any, Optional, List
 
 logger = logging.getLogger(__name__)
@@ -12,81 +16,47 @@ class QueryMaker:
 
     def __init__(self):
         try:
-            self.client = genai.Client(api_key=settings.google_api_key)
+            self.client = get_genai_client()
             logger.info("HobenAgent (Query Maker) initialized.")
         except Exception as e:
             logger.error(f"Failed to initialize HobenAgent: {e}")
             raise
 
-    async def _summarize_theme(self, long_text: str) -> str:
-        """長い入力文から中心的なテーマを抽出する"""
-        prompt = f"""
-以下の文章を、法話のテーマとして適切なフレーズに要約してください。元の文章の意味を損なわないように注意してください。
-十分に短い場合は、そのまま使用してください。
-# 元の文章
-{long_text}
-
-# 抽出したテーマ:
-"""
-        try:
-            response = await self.client.aio.models.generate_content(model='gemini-2.5-flash', contents=prompt)
-            summarized_theme = response.text.strip()
-            logger.info(f"Summarized theme: '{long_text}' -> '{summarized_theme}'")
-            return summarized_theme
-        except Exception as e:
-            logger.error(f"Failed to summarize theme: {e}")
-            # エラー時は元のテキストの先頭部分を安全に使う
-            return long_text[:50]
-
     async def create_sutra_search_prompt(self, theme_input: str, audiences: List[str]) -> str:
         """
-        与えられたテーマに基づき、蔵主エージェントが仏教原典を検索するための
-        詳細なプロンプトを生成する。
+        与えられたテーマと対象者から、蔵主エージェントが仏教原典を検索するための
+        短いキーワードクエリ（例: 「感謝 報恩 恩」）を組み立てる。
+        LLM は使わず、仏教語の辞書とローカル索引の IDF で語を選ぶ。
         """
-        
-        # 入力文が長い場合（例: 50文字以上）は、要約処理を挟む
-        if len(theme_input) > 50:
-            core_theme = await self._summarize_theme(theme_input)
-        else:
-            core_theme = theme_input
-
-        # 要約・抽出されたクリーンなテーマを使ってプロンプトを生成
-        prompt = f"""
-以下のテーマに関連する経典を検索するために、キーワードを抜き出して読点で区切って出力してください。
-# 検索テーマ
-{core_theme}
+        # 索引の読み込みはファイル I/O なので、ウォームアップ前の最初の呼び出しでもイベントループを止めない
+        index = await asyncio.to_thread(self._local_index)
+        query = build_sutra_query(theme_input, audiences, index=index)
+        logger.debug(f"Created sutra search query for theme '{theme_input}': {query.terms}")
+        return query.text
 
-# 対象聴衆
-{"、".join(audiences) if audiences else "一般の人々"}
-
-# 指示
-1.  テーマに直接関連するキーワードを選んでください。
-2.  キーワードは、できるだけ具体的で、かつ一般的な言葉を選んでください。
-3.  キーワードは、読点「、」で区切って出力してください。
-# 出力例
-- 慈悲、無常、執着、若者、子供
-"""
-        logger.debug(f"Created sutra search prompt for core theme: {core_theme}")
-        return prompt
+    def _local_index(self) -> Optional[BM25Index]:
+        """IDF の重み付けに使うローカル索引（設定されていなければ None）。読み込み済みならすぐに返る"""
+        index_dir = get_settings().sutra_index_dir
+        if not index_dir:
+            return None
+        try:
+            return load_local_index(index_dir)
+        except Exception as e:
+            logger.warning(f"Could not load local sutra index for query weighting: {e}")
+            return None
 
     async def create_current_topics_search_prompt(self, theme_input: str, audiences: List[str]) -> str:
         """
         与えられたテーマに基づき、遊行僧エージェント（News Researcher）が
         時事ネタを検索するためのプロンプトを生成する。
         """
-        # こちらも同様に、長い入力は要約する
-        if len(theme_input) > 50:
-            core_theme = await self._summarize_theme(theme_input)
-        else:
-            core_theme = theme_input
-
-        # 要約されたクリーンなテーマを使って、時事ネタ検索用のプロンプトを生成
+        # 長い入力も要約せずにそのまま渡す（検索する LLM がテーマを読み取れるので、要約の呼び出しを省く）
         prompt = f"""
 あなたは、現代社会の動向に詳しいジャーナリスト（遊行僧）です。
 Google検索ツールを駆使して、以下のテーマに関連する最近の具体的なニュース、社会的な出来事、または一般的な話題を調査してください。
 
 # 調査テーマ
-{core_theme}
+{theme_input}
 
 # 対象聴衆
 {"、".join(audiences) if audiences else "一般の人々"}
@@ -98,10 +68,10 @@ Google検索ツールを駆使して、以下のテーマに関連する最近
 4.  ニュースは一年以内のものに限定してください。
 
 # 出力形式
-- 箇条書きのリスト形式で、調査結果のみを出力してください。説明や前置きは不要です。
+- 調査結果のみを、1件を1つの項目とするリストで出力してください。説明や前置き、見出し、入れ子の項目は不要です。
 - 例:
   - 最近の調査で、若者の間でのボランティア活動への関心が高まっていることが示された。
   - 新しいテクノロジーの登場により、人々のコミュニケーション方法が変化しつつある。
 """
-        logger.debug(f"Created current topics search prompt for core theme: {core_theme}")
+        logger.debug(f"Created current topics search prompt for theme: {theme_input}")
         return prompt
@@ -2,8 +2,8 @@ import logging
 import re
 import json
 from typing import List, Dict, Any
-from google import genai
-from ...core.config import settings
+from ...core.clients import get_genai_client
+from ...core.usage import record_usage
 
 logger = logging.getLogger(__name__)
 
@@ -13,8 +13,8 @@ class Reviewer:
     """
 
     def __init__(self):
-        logger.info("Reviewer initialized with its own Gemini model instance.")
-        self.client = genai.Client(api_key=settings.google_api_key)
+        logger.info("Reviewer initialized with the shared Gemini client.")
+        self.client = get_genai_client()
 
     # --- ▼▼▼ 戻り値の型ヒントを Dict[str, Any] に変更 ▼▼▼ ---
     async def evaluate_and_select(self, theme: str, howa_candidates: List[str]) -> Dict[str, Any]:
@@ -36,6 +36,7 @@ class Reviewer:
 
         try:
             response = await self.client.aio.models.generate_content(model='gemini-2.5-flash', contents=prompt)
+            record_usage(response)
             response_text = response.text
             
             json_match = re.search(r'```json\n({.*?})\n```', response_text, re.DOTALL)
@@ -1,5 +1,5 @@
-from google import genai
-from ...core.config import settings
+from ...core.clients import get_genai_client
+from ...core.usage import record_usage
 import logging
 from typing import List, Dict, Any
 
@@ -13,7 +13,7 @@ class Writer:
 
     def __init__(self):
         try:
-            self.client = genai.Client(api_key=settings.google_api_key)
+            self.client = get_genai_client()
             logger.info("SakkaAgent (Writer) initialized.")
         except Exception as e:
             logger.error(f"Failed to initialize SakkaAgent: {e}")
@@ -65,6 +65,7 @@ class Writer:
         logger.info("Generating final howa text...")
         try:
             response = await self.client.aio.models.generate_content(model='gemini-2.5-flash', contents=prompt)
+            record_usage(response)
             final_text = response.text.strip()
             logger.info("Successfully generated final howa text.")
             #print(final_text)  # デバッグ用に生成された法話を出力
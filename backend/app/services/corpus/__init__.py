@@ -0,0 +1 @@
+# 経典コーパスのローカル索引
\ No newline at end of file
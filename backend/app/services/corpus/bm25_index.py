@@ -0,0 +1,284 @@
+"""
+文字 n-gram による BM25 転置索引。
+
+索引ファイルは SegmentStore と同じく mmap で開き、ポスティング（doc 番号と出現回数の配列）は
+ファイル上の配列をそのまま memoryview として読む。Python のリストや辞書に展開しないので、
+uvicorn のワーカーを増やしても索引はページキャッシュで共有され、ワーカーごとの常駐メモリはほぼ増えない。
+
+レイアウト（リトルエンディアン、各セクションは8バイト境界に揃える）:
+    ヘッダ           : _HEADER 参照
+    doc_lengths     : uint32[count]          セグメントごとの n-gram 数
+    term_offsets    : uint64[n_terms + 1]    語ブロブ内の開始位置（語は UTF-8 のバイト列で昇順）
+    posting_offsets : uint64[n_terms + 1]    docs / tfs 内の開始位置
+    docs            : uint32[n_postings]     語ごとに昇順の doc 番号
+    tfs             : uint32[n_postings]     docs と同じ並びの出現回数
+    語ブロブ          : UTF-8
+"""
+
+import heapq
+import math
+import mmap
+import pathlib
+import struct
+from array import array
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Protocol, Sequence, Tuple
+
+from .segment_store import STORE_FILENAME, SegmentStore
+from .segments import SearchHit, Segment
+from .tokenizer import DEFAULT_NGRAM_SIZE, tokenize
+
+INDEX_FILENAME = "bm25.bin"
+INDEX_MAGIC = b"SUTRABM "
+INDEX_FORMAT_VERSION = 3
+
+_HEADER = struct.Struct("<8sIIIIdd6Q")
+
+# 語ごとの (doc 番号の列, 出現回数の列)
+Posting = Tuple[Sequence[int], Sequence[int]]
+
+
+def _align(position: int) -> int:
+    return (position + 7) & ~7
+
+
+class Postings(Protocol):
+    """語からポスティングを引く。構築直後は dict、読み込んだ索引は MappedPostings"""
+
+    def get(self, term: str) -> Optional[Posting]: ...
+
+    def __len__(self) -> int: ...
+
+    def items(self) -> Iterator[Tuple[str, Posting]]: ...
+
+
+class MappedPostings:
+    """mmap した索引ファイル上のポスティング。語は二分探索で引き、配列はコピーせずに返す"""
+
+    def __init__(self, view: memoryview, n_terms: int, positions: Sequence[int]) -> None:
+        term_offsets_pos, posting_offsets_pos, docs_pos, tfs_pos, self._term_blob_pos = positions
+        self._view = view
+        self._n_terms = n_terms
+        self._term_offsets = self._section(term_offsets_pos, n_terms + 1, "Q")
+        self._posting_offsets = self._section(posting_offsets_pos, n_terms + 1, "Q")
+        n_postings = self._posting_offsets[n_terms]
+        self._docs = self._section(docs_pos, n_postings, "I")
+        self._tfs = self._section(tfs_pos, n_postings, "I")
+
+    def _section(self, position: int, length: int, fmt: str) -> memoryview:
+        return self._view[position:position + length * struct.calcsize(fmt)].cast(fmt)
+
+    def __len__(self) -> int:
+        return self._n_terms
+
+    def _term_bytes(self, ref: int) -> bytes:
+        base = self._term_blob_pos
+        return self._view[base + self._term_offsets[ref]:base + self._term_offsets[ref + 1]].tobytes()
+
+    def _posting(self, ref: int) -> Posting:
+        start, end = self._posting_offsets[ref], self._posting_offsets[ref + 1]
+        return self._docs[start:end], self._tfs[start:end]
+
+    def get(self, term: str) -> Optional[Posting]:
+        target = term.encode("utf-8")
+        low, high = 0, self._n_terms
+        while low < high:
+            middle = (low + high) // 2
+            current = self._term_bytes(middle)
+            if current < target:
+                low = middle + 1
+            elif current > target:
+                high = middle
+            else:
+                return self._posting(middle)
+        return None
+
+    def items(self) -> Iterator[Tuple[str, Posting]]:
+        for ref in range(self._n_terms):
+            yield self._term_bytes(ref).decode("utf-8"), self._posting(ref)
+
+    def release(self) -> None:
+        for view in (self._term_offsets, self._posting_offsets, self._docs, self._tfs):
+            view.release()
+
+
+class BM25Index:
+    """
+    文字 n-gram による BM25 転置索引。
+    本文は索引ファイルに持たず、同じディレクトリの SegmentStore から必要な分だけ読み出す。
+    """
+
+    def __init__(
+        self,
+        segments: Sequence[Segment],
+        doc_lengths: Sequence[int],
+        postings: Postings,
+        *,
+        k1: float = 1.2,
+        b: float = 0.75,
+        ngram_size: int = DEFAULT_NGRAM_SIZE,
+    ) -> None:
+        self.segments = segments
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.ngram_size = ngram_size
+        self.avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if len(doc_lengths) else 0.0
+        self._mapping: Optional[Tuple[mmap.mmap, memoryview]] = None
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    @classmethod
+    def build(
+        cls,
+        segments: Sequence[Segment],
+        *,
+        k1: float = 1.2,
+        b: float = 0.75,
+        ngram_size: int = DEFAULT_NGRAM_SIZE,
+    ) -> "BM25Index":
+        """セグメント列（通常は SegmentStore）から索引を構築する。並び順がそのまま doc 番号になる"""
+        doc_lengths: List[int] = []
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for doc, segment in enumerate(segments):
+            counts = Counter(tokenize(segment.content, ngram_size))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                docs, tfs = postings.setdefault(term, ([], []))
+                docs.append(doc)
+                tfs.append(tf)
+        return cls(segments, doc_lengths, postings, k1=k1, b=b, ngram_size=ngram_size)
+
+    def idf(self, term: str) -> float:
+        entry = self.postings.get(term)
+        if entry is None:
+            return 0.0
+        df = len(entry[0])
+        n = len(self.segments)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def score_terms(self, term_weights: Dict[str, float], top_k: int = 10) -> List[Tuple[int, float]]:
+        """重み付きの語からスコアを計算し、上位 top_k 件の (doc, score) を返す"""
+        if not self.segments or top_k <= 0:
+            return []
+
+        scores: Dict[int, float] = {}
+        k1 = self.k1
+        norm_base = k1 * (1.0 - self.b)
+        norm_scale = (k1 * self.b / self.avg_doc_length) if self.avg_doc_length else 0.0
+        doc_lengths = self.doc_lengths
+        for term, weight in term_weights.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            term_idf = self.idf(term) * weight
+            docs, tfs = entry
+            for doc, tf in zip(docs, tfs):
+                denom = tf + norm_base + norm_scale * doc_lengths[doc]
+                scores[doc] = scores.get(doc, 0.0) + term_idf * tf * (k1 + 1.0) / denom
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def search(self, query: str, top_k: int = 10) -> List[SearchHit]:
+        """クエリ文字列を n-gram に分解して検索する"""
+        term_weights = {term: float(count) for term, count in Counter(tokenize(query, self.ngram_size)).items()}
+        return [
+            SearchHit(doc=doc, score=score, segment=self.segments[doc])
+            for doc, score in self.score_terms(term_weights, top_k)
+        ]
+
+    def save(self, directory: pathlib.Path) -> pathlib.Path:
+        """転置索引をディレクトリに書き出す（本文は write_segment_store() で別途書き出す）"""
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / INDEX_FILENAME
+        entries = sorted((term.encode("utf-8"), posting) for term, posting in self.postings.items())
+        doc_lengths = array("I", self.doc_lengths)
+        term_offsets = array("Q", [0])
+        posting_offsets = array("Q", [0])
+        docs = array("I")
+        tfs = array("I")
+        for encoded, (term_docs, term_tfs) in entries:
+            term_offsets.append(term_offsets[-1] + len(encoded))
+            docs.extend(term_docs)
+            tfs.extend(term_tfs)
+            posting_offsets.append(len(docs))
+
+        sections = [doc_lengths, term_offsets, posting_offsets, docs, tfs]
+        positions = []
+        cursor = _HEADER.size
+        for section in sections:
+            cursor = _align(cursor)
+            positions.append(cursor)
+            cursor += len(section) * section.itemsize
+        term_blob_pos = _align(cursor)
+
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("wb") as fh:
+            fh.write(_HEADER.pack(
+                INDEX_MAGIC,
+                INDEX_FORMAT_VERSION,
+                len(doc_lengths),
+                len(entries),
+                self.ngram_size,
+                self.k1,
+                self.b,
+                *positions,
+                term_blob_pos,
+            ))
+            for position, section in zip(positions, sections):
+                fh.write(b"\0" * (position - fh.tell()))
+                section.tofile(fh)
+            fh.write(b"\0" * (term_blob_pos - fh.tell()))
+            for encoded, _ in entries:
+                fh.write(encoded)
+        tmp_path.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, directory: pathlib.Path) -> "BM25Index":
+        """save() で書き出した索引を mmap で開き、同じディレクトリのセグメントストアと組み合わせる"""
+        path = directory / INDEX_FILENAME
+        if not path.exists() and (directory / "bm25.json").exists():
+            raise ValueError(f"{directory} has an index in an older format; rebuild it with build_index")
+        with path.open("rb") as fh:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        magic, version, count, n_terms, ngram_size, k1, b, doc_lengths_pos, *positions = _HEADER.unpack_from(view)
+        if magic != INDEX_MAGIC or version != INDEX_FORMAT_VERSION:
+            view.release()
+            mapped.close()
+            raise ValueError(f"Unsupported BM25 index version in {path}: {version}")
+        segments = SegmentStore(directory / STORE_FILENAME)
+        if len(segments) != count:
+            segments.close()
+            view.release()
+            mapped.close()
+            raise ValueError(f"Segment store in {directory} does not match {INDEX_FILENAME}")
+        doc_lengths = view[doc_lengths_pos:doc_lengths_pos + count * 4].cast("I")
+        index = cls(
+            segments,
+            doc_lengths,
+            MappedPostings(view, n_terms, positions),
+            k1=k1,
+            b=b,
+            ngram_size=ngram_size,
+        )
+        index._mapping = (mapped, view)
+        return index
+
+    def close(self) -> None:
+        """load() で開いた索引のマッピングとセグメントストアを閉じる"""
+        if self._mapping is None:
+            return
+        mapped, view = self._mapping
+        self._mapping = None
+        if isinstance(self.postings, MappedPostings):
+            self.postings.release()
+        if isinstance(self.doc_lengths, memoryview):
+            self.doc_lengths.release()
+        view.release()
+        mapped.close()
+        if isinstance(self.segments, SegmentStore):
+            self.segments.close()
@@ -0,0 +1,113 @@
+"""
+経典コーパスのローカル検索索引を構築するオフラインツール。
+
+使い方:
+    # 1. tools 側で TEI XML からセグメントを書き出す
+    python tools/upload_xml_documents.py --download-dir tools/download --export-segments segments.jsonl
+    # 2. backend 側で索引を構築する
+    python -m app.services.corpus.build_index segments.jsonl --output data/sutra_index
+    # ベクトル検索用の行列も作る場合（numpy が必要）
+    python -m app.services.corpus.build_index segments.jsonl --output data/sutra_index --vectors --ivf-lists 256
+"""
+
+import argparse
+import pathlib
+import sys
+import time
+from typing import Iterable
+
+from .bm25_index import BM25Index
+from .segment_store import STORE_FILENAME, SegmentStore, write_segment_store
+from .segments import Segment, read_segments_jsonl
+from .tokenizer import DEFAULT_NGRAM_SIZE
+
+
+def build_local_index(
+    segments: Iterable[Segment],
+    output: pathlib.Path,
+    *,
+    k1: float = 1.2,
+    b: float = 0.75,
+    ngram_size: int = DEFAULT_NGRAM_SIZE,
+) -> BM25Index:
+    """セグメントストアを書き出し、それを読み直しながら BM25 索引を構築・保存する"""
+    write_segment_store(segments, output / STORE_FILENAME)
+    store = SegmentStore(output / STORE_FILENAME)
+    index = BM25Index.build(store, k1=k1, b=b, ngram_size=ngram_size)
+    index.save(output)
+    return index
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build the local BM25 index for KyotenFinder")
+    parser.add_argument("segments", type=pathlib.Path, help="JSON Lines file exported by upload_xml_documents.py")
+    parser.add_argument(
+        "--output",
+        type=pathlib.Path,
+        default=pathlib.Path("data/sutra_index"),
+        help="Directory to write the index into (default: data/sutra_index)",
+    )
+    parser.add_argument("--k1", type=float, default=1.2, help="BM25 k1 parameter (default: 1.2)")
+    parser.add_argument("--b", type=float, default=0.75, help="BM25 b parameter (default: 0.75)")
+    parser.add_argument(
+        "--ngram-size",
+        type=int,
+        default=DEFAULT_NGRAM_SIZE,
+        help=f"Character n-gram size (default: {DEFAULT_NGRAM_SIZE})",
+    )
+    parser.add_argument(
+        "--vectors",
+        action="store_true",
+        help="Also build the NumPy vector index used by SUTRA_SEARCH_BACKEND=vector",
+    )
+    parser.add_argument(
+        "--encoder",
+        help="Local encoder given as 'package.module:factory' (default: hashed character n-gram TF-IDF)",
+    )
+    parser.add_argument(
+        "--ivf-lists",
+        type=int,
+        default=0,
+        help="Number of IVF coarse-quantizer lists; 0 disables IVF (default: 0)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    if not args.segments.exists():
+        print(f"Segments file not found: {args.segments}", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    index = build_local_index(
+        read_segments_jsonl(args.segments),
+        args.output,
+        k1=args.k1,
+        b=args.b,
+        ngram_size=args.ngram_size,
+    )
+    if not len(index):
+        print(f"No segments found in {args.segments}", file=sys.stderr)
+        return 1
+
+    elapsed = time.perf_counter() - started
+    print(f"Indexed {len(index)} segments ({len(index.postings)} terms) into {args.output} in {elapsed:.1f}s")
+
+    if args.vectors:
+        from .vector_index import VectorIndex
+
+        started = time.perf_counter()
+        vectors = VectorIndex.build(
+            index.segments,
+            args.output,
+            encoder_spec=args.encoder,
+            n_lists=args.ivf_lists,
+        )
+        elapsed = time.perf_counter() - started
+        print(f"Embedded {len(vectors)} segments ({vectors.encoder.dim} dims) into {args.output} in {elapsed:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,36 @@
+"""
+プロセス内で共有する索引の読み込み。
+
+索引の読み込みはファイル I/O を伴うので、イベントループ上からは asyncio.to_thread で呼ぶか、
+起動時のウォームアップ（app.services.warmup）で読み込んでおく。
+"""
+
+import logging
+import pathlib
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from .bm25_index import BM25Index
+
+if TYPE_CHECKING:
+    from .vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=4)
+def load_local_index(index_dir: str) -> BM25Index:
+    """ローカル索引を読み込む。リクエストごとに読み直さないようプロセス内でキャッシュする"""
+    index = BM25Index.load(pathlib.Path(index_dir))
+    logger.info(f"Loaded local sutra index from {index_dir} ({len(index)} segments)")
+    return index
+
+
+@lru_cache(maxsize=4)
+def load_vector_index(index_dir: str, nprobe: int) -> "VectorIndex":
+    """ベクトル索引を読み込む。numpy はベクトル検索を使うときだけ読み込む"""
+    from .vector_index import VectorIndex
+
+    index = VectorIndex.load(pathlib.Path(index_dir), nprobe=nprobe)
+    logger.info(f"Loaded sutra vector index from {index_dir} ({len(index)} segments)")
+    return index
@@ -0,0 +1,242 @@
+"""
+テーマと対象者から、経典検索用の短いキーワードクエリを LLM を使わずに組み立てる。
+
+テーマを仏教語の辞書で最長一致させ、辞書に無い部分は漢字・カタカナ・英数字の連続（送り仮名を1文字まで含む）
+を語として取り出す。現代語のテーマには経典で使われる語（感謝 → 報恩 など）を補い、ローカル索引があれば
+コーパスでの IDF で重み付けして、重みの大きい順に上位の語だけを空白区切りで並べる。
+新字体の語には、経典の本文に合わせて正字の形（仏性 → 佛性）も並べる。
+
+重みは語の繰り返しで表す（最も軽い語の約2倍なら2回、3倍以上なら3回）。ローカル索引の BM25 も
+ベクトル検索もクエリ中の出現回数を語の重みとして使う。
+テーマの半分以上が語にならなかったとき（1文字の語や辞書に無いひらがなの語など）や、語が1つも残らなかったとき
+（助詞や検索に不要な語だけのテーマ）は、テーマそのものも検索する。
+照合は英字を小文字にそろえて行うが、検索する語は元のテーマの大文字・小文字のまま（SNS疲れ）にする。
+"""
+
+import math
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .bm25_index import BM25Index
+from .tokenizer import normalize_text, tokenize
+
+# 経典の検索語として使う仏教語
+BUDDHIST_TERMS = frozenset({
+    "無常", "諸行無常", "無我", "諸法無我", "涅槃", "涅槃寂静", "一切皆苦", "苦", "四苦八苦", "生老病死",
+    "愛別離苦", "怨憎会苦", "求不得苦", "縁起", "因縁", "因果", "業", "輪廻", "空", "色即是空", "中道",
+    "八正道", "四諦", "慈悲", "慈", "悲", "喜捨", "布施", "持戒", "忍辱", "精進", "禅定", "智慧", "般若",
+    "六波羅蜜", "煩悩", "貪欲", "瞋恚", "愚痴", "三毒", "執着", "我執", "怨", "忿怒", "嫉妬", "懺悔",
+    "少欲知足", "知足", "報恩", "恩", "利他", "自利利他", "和合", "和", "菩提", "菩薩", "仏性", "悉有仏性",
+    "成仏", "悟り", "覚", "信", "念仏", "功徳", "供養", "善", "悪", "善悪", "不殺生", "放逸", "不放逸",
+    "生死", "老", "病", "死", "心", "法", "戒", "定", "慧", "無明", "渇愛", "安楽", "寂静", "正見", "忍",
+})
+
+# 現代語のテーマに補う、経典で使われる語
+TERM_EXPANSIONS: Dict[str, Tuple[str, ...]] = {
+    "感謝": ("報恩", "恩"),
+    "ありがとう": ("報恩", "恩"),
+    "怒り": ("瞋恚", "忿怒"),
+    "いかり": ("瞋恚", "忿怒"),
+    "怨み": ("怨",),
+    "うらみ": ("怨",),
+    "欲": ("貪欲", "少欲知足"),
+    "欲望": ("貪欲",),
+    "足るを知る": ("少欲知足", "知足"),
+    "思いやり": ("慈悲",),
+    "やさしさ": ("慈悲",),
+    "優しさ": ("慈悲",),
+    "愛": ("慈悲", "渇愛"),
+    "悲しみ": ("悲", "愛別離苦"),
+    "別れ": ("愛別離苦",),
+    "死": ("生死",),
+    "老い": ("老", "生老病死"),
+    "病気": ("病", "生老病死"),
+    "変化": ("無常",),
+    "はかなさ": ("無常",),
+    "我慢": ("忍辱",),
+    "忍耐": ("忍辱",),
+    "努力": ("精進",),
+    "頑張る": ("精進",),
+    "知恵": ("智慧",),
+    "こだわり": ("執着",),
+    "とらわれ": ("執着",),
+    "手放す": ("執着",),
+    "後悔": ("懺悔",),
+    "反省": ("懺悔",),
+    "与える": ("布施",),
+    "分かち合う": ("布施",),
+    "つながり": ("縁起", "因縁"),
+    "縁": ("因縁",),
+    "調和": ("和合",),
+    "平和": ("和合",),
+    "許し": ("忍辱",),
+    "ゆるし": ("忍辱",),
+    "命": ("不殺生", "生死"),
+    "いのち": ("不殺生", "生死"),
+    "心の平穏": ("寂静", "安楽"),
+    "迷い": ("煩悩", "無明"),
+    "嫉妬": ("嫉妬",),
+}
+
+# 対象者ごとに補う語。テーマから語を取り出せなかったときだけ使う
+AUDIENCE_TERMS: Dict[str, Tuple[str, ...]] = {
+    "子供": ("童子",),
+    "若者": ("少年",),
+    "ビジネスパーソン": ("精進",),
+    "高齢者": ("老",),
+}
+
+# テーマから取り出しても検索の役に立たない語
+STOP_TERMS = frozenset({
+    "人生", "関係", "大切", "意味", "方法", "場合", "現代", "社会", "生活", "日常", "問題", "自分", "人間",
+    "テーマ", "法話", "話", "今", "時", "事", "物", "方", "者", "中", "的",
+})
+
+# 経典（CBETA などの正字）の表記。新字体の語には正字の形も加えて検索する
+_TRADITIONAL = str.maketrans({
+    "仏": "佛", "経": "經", "悪": "惡", "恵": "惠", "実": "實", "与": "與", "来": "來", "変": "變", "覚": "覺",
+    "楽": "樂", "静": "靜", "発": "發", "尽": "盡", "帰": "歸", "痴": "癡", "着": "著", "戦": "戰", "声": "聲",
+    "断": "斷", "継": "繼", "浄": "淨", "真": "眞", "観": "觀", "礼": "禮", "気": "氣", "説": "說", "体": "體",
+    "会": "會", "両": "兩", "読": "讀", "学": "學", "伝": "傳", "転": "轉", "悩": "惱", "縁": "緣",
+})
+
+
+def traditional_form(term: str) -> str:
+    return term.translate(_TRADITIONAL)
+
+
+# 語の出どころごとの基本の重み
+_WEIGHTS = {"term": 1.0, "word": 0.7, "expansion": 0.6, "audience": 0.3}
+
+# 語を繰り返す最大の回数
+_MAX_REPEAT = 3
+
+# テーマの文字（漢字・カタカナ・英数字）のうち、語として取り出せた割合がこれ以下ならテーマそのものも検索する
+_MIN_COVERAGE = 0.5
+
+# 漢字・カタカナ・英数字の連続と、助詞でなければ続くひらがな1文字（送り仮名。SNS疲れ、忘れ など）
+_WORD = re.compile(r"[一-鿿々゠-ヿa-z0-9]+(?:(?![のをにはがとでもへや])[ぁ-ゖ])?")
+_CONTENT = re.compile(r"[一-鿿々゠-ヿa-z0-9]")
+
+# 辞書を最長一致で引くための、長い順の見出し語
+_DICTIONARY = sorted(BUDDHIST_TERMS | set(TERM_EXPANSIONS), key=len, reverse=True)
+
+
+@dataclass
+class WeightedQuery:
+    """重み付きのキーワード。text が検索に渡す文字列で、repeats の回数だけ語を繰り返す"""
+    terms: List[Tuple[str, float]] = field(default_factory=list)
+    repeats: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def text(self) -> str:
+        return " ".join(" ".join([term] * self.repeats.get(term, 1)) for term, _ in self.terms)
+
+    def term_weights(self) -> Dict[str, float]:
+        return dict(self.terms)
+
+
+def _scan(text: str) -> Iterable[Tuple[str, str, int, int]]:
+    """辞書の最長一致と、辞書に無い部分の語を (語, 種類, 開始位置, 終了位置) として返す"""
+    rest = []
+    position = 0
+    while position < len(text):
+        for entry in _DICTIONARY:
+            if text.startswith(entry, position):
+                # 仏教語はそのまま、補う語を持つ現代語は一般の語として扱う
+                yield entry, "term" if entry in BUDDHIST_TERMS else "word", position, position + len(entry)
+                rest.append(" " * len(entry))
+                position += len(entry)
+                break
+        else:
+            rest.append(text[position])
+            position += 1
+    for match in _WORD.finditer("".join(rest)):
+        word = match.group()
+        if len(word) > 1 or word in BUDDHIST_TERMS:
+            yield word, "word", match.start(), match.end()
+
+
+def _coverage(text: str, covered: Set[int]) -> float:
+    """テーマの文字（漢字・カタカナ・英数字。無ければ空白以外）のうち、語として取り出せた割合"""
+    content = [i for i, char in enumerate(text) if _CONTENT.match(char)]
+    content = content or [i for i, char in enumerate(text) if not char.isspace()]
+    if not content:
+        return 1.0
+    return sum(1 for i in content if i in covered) / len(content)
+
+
+def _idf_factor(term: str, index: BM25Index, max_idf: float) -> float:
+    """コーパスでの語の珍しさ（0〜1）。コーパスに現れない語は小さくする"""
+    grams = [gram for gram in tokenize(term, index.ngram_size) if len(gram) == min(len(term), index.ngram_size)]
+    idfs = [index.idf(gram) for gram in grams]
+    if not idfs or not any(idfs):
+        return 0.1
+    return max(0.1, sum(idfs) / len(idfs) / max_idf)
+
+
+def build_sutra_query(
+    theme: str,
+    audiences: Optional[Iterable[str]] = None,
+    *,
+    index: Optional[BM25Index] = None,
+    max_terms: int = 8,
+) -> WeightedQuery:
+    """
+    テーマと対象者から経典検索のキーワードを選び、重みの大きい順に（正字の形も数えて）max_terms 語までを返す。
+    対象者の語は、テーマから語を取り出せなかったときだけ、テーマより軽い重みで加える。
+    """
+    text = normalize_text(theme)
+    # 検索する語は大文字・小文字を元のまま取り出す（小文字にすると長さが変わる文字があれば小文字のまま）
+    original = unicodedata.normalize("NFKC", theme)
+    if len(original) != len(text):
+        original = text
+    weights: Dict[str, float] = {}
+    # 語として取り出せた（または検索に不要として除いた）テーマの文字の位置
+    covered: Set[int] = set()
+
+    def add(term: str, kind: str, surface: Optional[str] = None) -> None:
+        if term in STOP_TERMS:
+            return
+        surface = surface or term
+        weights[surface] = max(weights.get(surface, 0.0), _WEIGHTS[kind])
+
+    for term, kind, start, end in _scan(text):
+        covered.update(range(start, end))
+        add(term, kind, original[start:end])
+        for expansion in TERM_EXPANSIONS.get(term, ()):
+            add(expansion, "expansion")
+
+    if index is not None and len(index):
+        # 1つの文書にしか現れない語の IDF を上限として正規化する
+        max_idf = math.log(1.0 + (len(index) - 0.5) / 1.5)
+        weights = {
+            term: weight * max(_idf_factor(form, index, max_idf) for form in {term, traditional_form(term)})
+            for term, weight in weights.items()
+        }
+
+    terms: List[Tuple[str, float]] = []
+    for term, weight in sorted(weights.items(), key=lambda item: -item[1]):
+        terms.append((term, round(weight, 3)))
+        if traditional_form(term) != term:
+            terms.append((traditional_form(term), round(weight, 3)))
+    # 最も軽い語を1回として、重みの比の回数だけ繰り返す
+    lightest = min((weight for _, weight in terms), default=1.0)
+    repeats = {term: min(_MAX_REPEAT, max(1, round(weight / lightest))) for term, weight in terms}
+
+    whole = original.strip()
+    if whole and (not terms or _coverage(text, covered) <= _MIN_COVERAGE):
+        # 語が残らないテーマや、辞書にも語にもならない部分が多いテーマは、テーマそのもの（1回だけ）を先頭に加える
+        top = terms[0][1] if terms else 1.0
+        if not terms:
+            for audience in audiences or ():
+                for term in AUDIENCE_TERMS.get(audience, ()):
+                    if term not in repeats:
+                        terms.append((term, round(top * _WEIGHTS["audience"], 3)))
+                        repeats[term] = 1
+        terms = [(whole, top)] + [(term, weight) for term, weight in terms if term != whole]
+        repeats[whole] = 1
+    terms = terms[:max_terms]
+    return WeightedQuery(terms, {term: repeats[term] for term, _ in terms})
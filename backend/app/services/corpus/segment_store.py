@@ -0,0 +1,219 @@
+"""
+経典セグメントをまとめて格納するコンパクトなバイナリファイル。
+
+XML を再解析したり、全セグメントを Python の文字列として読み込んだりせずに済むよう、
+読み込み側はファイルを mmap し、要求されたセグメントだけをその場でデコードする。
+ページキャッシュは OS が共有するため、uvicorn のワーカーを増やしても常駐メモリはほぼ増えない。
+
+レイアウト（リトルエンディアン、各セクションは8バイト境界に揃える）:
+    ヘッダ           : _HEADER 参照
+    text_offsets    : uint64[count + 1]   本文ブロブ内の開始位置
+    id_offsets      : uint64[count + 1]   ID ブロブ内の開始位置
+    meta            : uint32[count * 2]   (title, uri) の文字列表インデックス。_NO_STRING は無し
+    id_order        : uint32[count]       ID のバイト列で昇順に並べたセグメント番号
+    string_offsets  : uint64[n_strings + 1]
+    本文ブロブ / ID ブロブ / 文字列ブロブ : UTF-8
+"""
+
+import mmap
+import pathlib
+import shutil
+import struct
+import tempfile
+from array import array
+from typing import Dict, Iterable, Iterator, Optional
+
+from .segments import Segment
+
+STORE_FILENAME = "segments.bin"
+STORE_MAGIC = b"SUTRASEG"
+STORE_FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sIII4x8Q")
+_NO_STRING = 0xFFFFFFFF
+
+
+def _align(position: int) -> int:
+    return (position + 7) & ~7
+
+
+def write_segment_store(segments: Iterable[Segment], path: pathlib.Path) -> int:
+    """
+    セグメント列をストアファイルに書き出し、書き込んだ件数を返す。
+    本文は一時ファイルへ逐次書き出すため、コーパス全体をメモリに載せない。
+    """
+    text_offsets = array("Q", [0])
+    id_offsets = array("Q", [0])
+    meta = array("I")
+    ids: list[bytes] = []
+    string_index: Dict[str, int] = {}
+    strings: list[bytes] = []
+
+    def intern(value: Optional[str]) -> int:
+        if not value:
+            return _NO_STRING
+        ref = string_index.get(value)
+        if ref is None:
+            ref = string_index[value] = len(strings)
+            strings.append(value.encode("utf-8"))
+        return ref
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryFile(dir=path.parent) as text_blob:
+        for segment in segments:
+            encoded = segment.content.encode("utf-8")
+            text_blob.write(encoded)
+            text_offsets.append(text_offsets[-1] + len(encoded))
+            encoded_id = segment.id.encode("utf-8")
+            ids.append(encoded_id)
+            id_offsets.append(id_offsets[-1] + len(encoded_id))
+            meta.append(intern(segment.title))
+            meta.append(intern(segment.uri))
+
+        count = len(ids)
+        id_order = array("I", sorted(range(count), key=ids.__getitem__))
+        string_offsets = array("Q", [0])
+        for value in strings:
+            string_offsets.append(string_offsets[-1] + len(value))
+
+        sections = [text_offsets, id_offsets, meta, id_order, string_offsets]
+        positions = []
+        cursor = _HEADER.size
+        for section in sections:
+            cursor = _align(cursor)
+            positions.append(cursor)
+            cursor += len(section) * section.itemsize
+        text_blob_pos = _align(cursor)
+        id_blob_pos = text_blob_pos + text_offsets[-1]
+        string_blob_pos = id_blob_pos + id_offsets[-1]
+
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("wb") as fh:
+            fh.write(_HEADER.pack(
+                STORE_MAGIC,
+                STORE_FORMAT_VERSION,
+                count,
+                len(strings),
+                *positions,
+                text_blob_pos,
+                id_blob_pos,
+                string_blob_pos,
+            ))
+            for position, section in zip(positions, sections):
+                fh.write(b"\0" * (position - fh.tell()))
+                section.tofile(fh)
+            fh.write(b"\0" * (text_blob_pos - fh.tell()))
+            text_blob.seek(0)
+            shutil.copyfileobj(text_blob, fh)
+            for encoded_id in ids:
+                fh.write(encoded_id)
+            for value in strings:
+                fh.write(value)
+        tmp_path.replace(path)
+    return count
+
+
+class SegmentStore:
+    """write_segment_store() で作成したファイルを mmap で読み出すリーダー"""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self._file = path.open("rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        (
+            magic,
+            version,
+            self._count,
+            n_strings,
+            text_offsets_pos,
+            id_offsets_pos,
+            meta_pos,
+            id_order_pos,
+            string_offsets_pos,
+            self._text_blob_pos,
+            self._id_blob_pos,
+            self._string_blob_pos,
+        ) = _HEADER.unpack_from(self._view)
+        if magic != STORE_MAGIC or version != STORE_FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported segment store format in {path}")
+
+        count = self._count
+        self._text_offsets = self._section(text_offsets_pos, count + 1, "Q")
+        self._id_offsets = self._section(id_offsets_pos, count + 1, "Q")
+        self._meta = self._section(meta_pos, count * 2, "I")
+        self._id_order = self._section(id_order_pos, count, "I")
+        self._string_offsets = self._section(string_offsets_pos, n_strings + 1, "Q")
+
+    def _section(self, position: int, length: int, fmt: str) -> memoryview:
+        size = struct.calcsize(fmt)
+        return self._view[position:position + length * size].cast(fmt)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, doc: int) -> Segment:
+        if not 0 <= doc < self._count:
+            raise IndexError(doc)
+        return Segment(
+            id=self.document_id(doc),
+            content=self.text(doc),
+            title=self.title(doc),
+            uri=self.uri(doc),
+        )
+
+    def __iter__(self) -> Iterator[Segment]:
+        for doc in range(self._count):
+            yield self[doc]
+
+    def text_bytes(self, doc: int) -> memoryview:
+        """本文の UTF-8 バイト列をコピーせずに返す"""
+        base = self._text_blob_pos
+        return self._view[base + self._text_offsets[doc]:base + self._text_offsets[doc + 1]]
+
+    def text(self, doc: int) -> str:
+        return str(self.text_bytes(doc), "utf-8")
+
+    def document_id(self, doc: int) -> str:
+        base = self._id_blob_pos
+        return str(self._view[base + self._id_offsets[doc]:base + self._id_offsets[doc + 1]], "utf-8")
+
+    def title(self, doc: int) -> Optional[str]:
+        return self._string(self._meta[doc * 2])
+
+    def uri(self, doc: int) -> Optional[str]:
+        return self._string(self._meta[doc * 2 + 1])
+
+    def _string(self, ref: int) -> Optional[str]:
+        if ref == _NO_STRING:
+            return None
+        base = self._string_blob_pos
+        return str(self._view[base + self._string_offsets[ref]:base + self._string_offsets[ref + 1]], "utf-8")
+
+    def find(self, document_id: str) -> Optional[int]:
+        """ドキュメント ID からセグメント番号を二分探索で引く"""
+        target = document_id.encode("utf-8")
+        base = self._id_blob_pos
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            doc = self._id_order[middle]
+            current = self._view[base + self._id_offsets[doc]:base + self._id_offsets[doc + 1]].tobytes()
+            if current < target:
+                low = middle + 1
+            elif current > target:
+                high = middle
+            else:
+                return doc
+        return None
+
+    def close(self) -> None:
+        for name in ("_text_offsets", "_id_offsets", "_meta", "_id_order", "_string_offsets"):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
@@ -0,0 +1,43 @@
+import json
+import pathlib
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+
+@dataclass
+class Segment:
+    """索引の単位となる経典の一節（tools/upload_xml_documents.py の出力と同じ形）"""
+    id: str
+    content: str
+    title: Optional[str] = None
+    uri: Optional[str] = None
+
+
+@dataclass
+class SearchHit:
+    """検索結果1件分。doc は索引内の連番"""
+    doc: int
+    score: float
+    segment: Segment
+
+
+def read_segments_jsonl(path: pathlib.Path) -> Iterator[Segment]:
+    """`upload_xml_documents.py --export-segments` が書き出した JSON Lines を読み込む"""
+    with path.open(encoding="utf-8") as fh:
+        for line_number, line in enumerate(fh, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})") from e
+            content = str(record.get("content") or "").strip()
+            if not content:
+                continue
+            yield Segment(
+                id=str(record["id"]),
+                content=content,
+                title=record.get("title"),
+                uri=record.get("uri"),
+            )
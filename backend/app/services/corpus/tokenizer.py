@@ -0,0 +1,36 @@
+import re
+import unicodedata
+from typing import Iterable, List
+
+# 英数字の連続と、それ以外の文字（漢字・かな等）の連続をそれぞれ1つのランとして切り出す。
+# 句読点や括弧は \w に含まれないため、ここで自然に区切りとして扱われる。
+_RUN_PATTERN = re.compile(r"[0-9A-Za-z]+|[^\W_0-9A-Za-z]+")
+
+DEFAULT_NGRAM_SIZE = 2
+
+
+def normalize_text(text: str) -> str:
+    """全角英数字などを NFKC で正規化し、英字を小文字にそろえる"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def iter_runs(text: str) -> Iterable[str]:
+    """正規化済みテキストを英数字ランと非英数字ランに分割する"""
+    return _RUN_PATTERN.findall(normalize_text(text))
+
+
+def tokenize(text: str, ngram_size: int = DEFAULT_NGRAM_SIZE) -> List[str]:
+    """
+    日本語・漢文向けの文字 n-gram トークナイザ。
+    英数字のランは単語として、それ以外のランは1文字と n-gram の両方として扱う。
+    漢文では「心」「空」のような1文字の語が多いため、1文字トークンも索引に含める。
+    """
+    tokens: List[str] = []
+    for run in iter_runs(text):
+        if run.isascii():
+            tokens.append(run)
+            continue
+        tokens.extend(run)
+        if ngram_size > 1:
+            tokens.extend(run[i:i + ngram_size] for i in range(len(run) - ngram_size + 1))
+    return tokens
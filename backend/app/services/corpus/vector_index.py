@@ -0,0 +1,310 @@
+"""
+経典セグメントのベクトル検索索引（ネットワーク・GPU 不要）。
+
+オフラインで各セグメントをベクトル化して float32 行列としてディスクに保存し、
+検索時は NumPy の行列積と top-k 選択だけで類似セグメントを求める。
+コーパスが大きくなっても遅延が線形に伸びないよう、IVF（粗量子化）も任意で使える。
+
+ベクトル化は既定で文字 n-gram の TF-IDF を特徴ハッシュで固定次元に畳み込む。
+`--encoder package.module:factory` を指定すれば任意のローカルエンコーダに差し替えられる。
+"""
+
+import importlib
+import json
+import math
+import pathlib
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from .segment_store import STORE_FILENAME, SegmentStore
+from .segments import SearchHit, Segment
+from .tokenizer import DEFAULT_NGRAM_SIZE, tokenize
+
+VECTOR_META_FILENAME = "vectors.json"
+VECTOR_MATRIX_FILENAME = "vectors.npy"
+VECTOR_IDF_FILENAME = "vector_idf.npy"
+IVF_CENTROIDS_FILENAME = "ivf_centroids.npy"
+IVF_LISTS_FILENAME = "ivf_lists.npy"
+IVF_OFFSETS_FILENAME = "ivf_offsets.npy"
+VECTOR_FORMAT_VERSION = 1
+
+DEFAULT_DIM = 512
+_BLOCK_ROWS = 65536
+
+
+class Encoder(Protocol):
+    """テキストを L2 正規化済みの float32 ベクトルに変換するエンコーダ"""
+
+    dim: int
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), dim) の float32 行列を返す"""
+        ...
+
+
+class HashedNgramEncoder:
+    """文字 n-gram の TF-IDF を符号付き特徴ハッシュで dim 次元に畳み込むエンコーダ"""
+
+    def __init__(
+        self,
+        dim: int = DEFAULT_DIM,
+        ngram_size: int = DEFAULT_NGRAM_SIZE,
+        idf: Optional[np.ndarray] = None,
+    ) -> None:
+        self.dim = dim
+        self.ngram_size = ngram_size
+        self.idf = idf if idf is not None else np.ones(dim, dtype=np.float32)
+
+    def _buckets(self, text: str) -> Dict[int, float]:
+        weights: Dict[int, float] = {}
+        for token, tf in Counter(tokenize(text, self.ngram_size)).items():
+            h = zlib.crc32(token.encode("utf-8"))
+            bucket = h % self.dim
+            sign = 1.0 if h & 0x80000000 else -1.0
+            weights[bucket] = weights.get(bucket, 0.0) + sign * (1.0 + math.log(tf))
+        return weights
+
+    def fit(self, texts: Iterable[str]) -> "HashedNgramEncoder":
+        """コーパス全体からバケットごとの IDF を求める"""
+        df = np.zeros(self.dim, dtype=np.float64)
+        n = 0
+        for text in texts:
+            n += 1
+            buckets = list(self._buckets(text))
+            if buckets:
+                df[buckets] += 1.0
+        self.idf = np.log((1.0 + n) / (1.0 + df)).astype(np.float32) + 1.0
+        return self
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for bucket, weight in self._buckets(text).items():
+                matrix[row, bucket] = weight
+        matrix *= self.idf
+        return _normalize_rows(matrix)
+
+
+def load_encoder(spec: str) -> Encoder:
+    """`package.module:factory` 形式の指定からローカルエンコーダを生成する"""
+    module_name, _, attr = spec.partition(":")
+    if not module_name or not attr:
+        raise ValueError(f"Encoder must be given as 'package.module:factory', got '{spec}'")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory()
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    matrix /= norms
+    return matrix
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """scores の上位 k 件のインデックスを降順で返す"""
+    if k >= scores.shape[0]:
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def train_ivf(
+    matrix: np.ndarray,
+    n_lists: int,
+    *,
+    iterations: int = 10,
+    sample_size: int = 65536,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    球面 k-means で粗量子化器を学習し、(centroids, assignments) を返す。
+    学習はサンプルで行い、割り当ては全行をブロック単位で計算する。
+    """
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    n_lists = max(1, min(n_lists, n))
+    sample = np.asarray(matrix[np.sort(rng.choice(n, size=min(sample_size, n), replace=False))])
+    centroids = sample[rng.choice(sample.shape[0], size=n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=n_lists)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample.shape[0], size=int(empty.sum()))]
+        centroids = _normalize_rows(sums)
+
+    assignments = np.empty(n, dtype=np.int32)
+    for start in range(0, n, _BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + _BLOCK_ROWS])
+        assignments[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return centroids.astype(np.float32), assignments
+
+
+class VectorIndex:
+    """float32 行列と（任意の）IVF リストによるベクトル検索索引"""
+
+    def __init__(
+        self,
+        segments: Sequence[Segment],
+        matrix: np.ndarray,
+        encoder: Encoder,
+        *,
+        centroids: Optional[np.ndarray] = None,
+        ivf_lists: Optional[np.ndarray] = None,
+        ivf_offsets: Optional[np.ndarray] = None,
+        nprobe: int = 8,
+    ) -> None:
+        self.segments = segments
+        self.matrix = matrix
+        self.encoder = encoder
+        self.centroids = centroids
+        self.ivf_lists = ivf_lists
+        self.ivf_offsets = ivf_offsets
+        self.nprobe = nprobe
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def search_vectors(self, queries: np.ndarray, top_k: int = 10) -> List[List[Tuple[int, float]]]:
+        """(Q, dim) のクエリ行列をまとめて検索し、クエリごとに (doc, score) の上位 top_k 件を返す"""
+        if not len(self) or top_k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        if self.centroids is None:
+            scores = self.matrix @ queries.T
+            return [self._select(np.arange(len(self)), scores[:, column], top_k) for column in range(queries.shape[0])]
+
+        results = []
+        probe = min(self.nprobe, self.centroids.shape[0])
+        centroid_scores = queries @ self.centroids.T
+        for row, query in enumerate(queries):
+            lists = _top_k(centroid_scores[row], probe)
+            candidates = np.concatenate(
+                [self.ivf_lists[self.ivf_offsets[i]:self.ivf_offsets[i + 1]] for i in lists]
+            )
+            results.append(self._select(candidates, self.matrix[candidates] @ query, top_k))
+        return results
+
+    def _select(self, docs: np.ndarray, scores: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        order = _top_k(scores, top_k)
+        return [(int(docs[i]), float(scores[i])) for i in order if scores[i] > 0.0]
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 10) -> List[List[SearchHit]]:
+        """複数のクエリを1回の行列積でまとめて検索する"""
+        return [
+            [SearchHit(doc=doc, score=score, segment=self.segments[doc]) for doc, score in hits]
+            for hits in self.search_vectors(self.encoder.encode(queries), top_k)
+        ]
+
+    def search(self, query: str, top_k: int = 10) -> List[SearchHit]:
+        return self.search_batch([query], top_k)[0]
+
+    @classmethod
+    def build(
+        cls,
+        segments: Sequence[Segment],
+        directory: pathlib.Path,
+        *,
+        encoder: Optional[Encoder] = None,
+        encoder_spec: Optional[str] = None,
+        n_lists: int = 0,
+        batch_size: int = 1024,
+    ) -> "VectorIndex":
+        """
+        セグメントをベクトル化して directory に保存する。
+        行列は open_memmap で直接ディスクへ書き出すため、コーパスサイズ分のメモリを必要としない。
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        if encoder is None:
+            if encoder_spec:
+                encoder = load_encoder(encoder_spec)
+            else:
+                encoder = HashedNgramEncoder().fit(segment.content for segment in segments)
+
+        n = len(segments)
+        matrix = np.lib.format.open_memmap(
+            directory / VECTOR_MATRIX_FILENAME, mode="w+", dtype=np.float32, shape=(n, encoder.dim)
+        )
+        for start in range(0, n, batch_size):
+            texts = [segments[doc].content for doc in range(start, min(start + batch_size, n))]
+            matrix[start:start + len(texts)] = encoder.encode(texts)
+        matrix.flush()
+
+        meta: Dict[str, Any] = {"version": VECTOR_FORMAT_VERSION, "count": n, "dim": encoder.dim}
+        if isinstance(encoder, HashedNgramEncoder):
+            meta["encoder"] = {"type": "hashed", "ngram_size": encoder.ngram_size}
+            np.save(directory / VECTOR_IDF_FILENAME, encoder.idf)
+        else:
+            if not encoder_spec:
+                raise ValueError("encoder_spec is required to reload a custom encoder")
+            meta["encoder"] = {"type": "custom", "spec": encoder_spec}
+
+        centroids = ivf_lists = ivf_offsets = None
+        if n_lists > 0 and n:
+            centroids, assignments = train_ivf(matrix, n_lists)
+            ivf_lists = np.argsort(assignments, kind="stable").astype(np.int32)
+            ivf_offsets = np.zeros(centroids.shape[0] + 1, dtype=np.int64)
+            np.cumsum(np.bincount(assignments, minlength=centroids.shape[0]), out=ivf_offsets[1:])
+            np.save(directory / IVF_CENTROIDS_FILENAME, centroids)
+            np.save(directory / IVF_LISTS_FILENAME, ivf_lists)
+            np.save(directory / IVF_OFFSETS_FILENAME, ivf_offsets)
+            meta["ivf"] = {"n_lists": int(centroids.shape[0])}
+
+        with (directory / VECTOR_META_FILENAME).open("w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+
+        return cls(
+            segments,
+            matrix,
+            encoder,
+            centroids=centroids,
+            ivf_lists=ivf_lists,
+            ivf_offsets=ivf_offsets,
+        )
+
+    @classmethod
+    def load(cls, directory: pathlib.Path, *, nprobe: int = 8) -> "VectorIndex":
+        """build() で保存した索引を mmap で開く"""
+        with (directory / VECTOR_META_FILENAME).open(encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta.get("version") != VECTOR_FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector index version in {directory}: {meta.get('version')}")
+
+        encoder_meta = meta["encoder"]
+        if encoder_meta["type"] == "hashed":
+            encoder: Encoder = HashedNgramEncoder(
+                dim=meta["dim"],
+                ngram_size=encoder_meta["ngram_size"],
+                idf=np.load(directory / VECTOR_IDF_FILENAME),
+            )
+        else:
+            encoder = load_encoder(encoder_meta["spec"])
+
+        matrix = np.load(directory / VECTOR_MATRIX_FILENAME, mmap_mode="r")
+        segments = SegmentStore(directory / STORE_FILENAME)
+        if len(segments) != matrix.shape[0]:
+            segments.close()
+            raise ValueError(f"Segment store in {directory} does not match {VECTOR_MATRIX_FILENAME}")
+
+        centroids = ivf_lists = ivf_offsets = None
+        if "ivf" in meta:
+            centroids = np.load(directory / IVF_CENTROIDS_FILENAME)
+            ivf_lists = np.load(directory / IVF_LISTS_FILENAME, mmap_mode="r")
+            ivf_offsets = np.load(directory / IVF_OFFSETS_FILENAME)
+
+        return cls(
+            segments,
+            matrix,
+            encoder,
+            centroids=centroids,
+            ivf_lists=ivf_lists,
+            ivf_offsets=ivf_offsets,
+            nprobe=nprobe,
+        )
@@ -1,5 +1,5 @@
-from google import genai
-from ..core.config import settings
+from ..core.clients import get_genai_client
+from ..core.usage import record_usage
 from ..models.howa import GenerateHowaRequest, HowaResponse
 import json
 import logging
@@ -11,7 +11,7 @@ class GeminiService:
 
     def __init__(self):
         try:
-            self.client = genai.Client(api_key=settings.google_api_key)
+            self.client = get_genai_client()
             logger.info("Gemini Service initialized successfully.")
         except Exception as e:
             logger.error(f"Failed to initialize Gemini Service: {e}")
@@ -52,6 +52,7 @@ class GeminiService:
                 model='gemini-2.5-flash',
                 contents=prompt
             )
+            record_usage(response)
             
             # マークダウンの```json ... ```を削除
             cleaned_text = response.text.strip().replace("```json", "").replace("```", "").strip()
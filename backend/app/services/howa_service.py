@@ -1,19 +1,43 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from fastapi import HTTPException
 import random
 import asyncio
+import time
+import uuid
 from ..models.howa import GenerateHowaRequest, HowaResponse, SutraQuote
+from ..core.cache import get_cache, make_key
+from ..core.config import get_settings
+from ..core.usage import track_usage
 from .gemini_service import GeminiService
 from .agents.queryMaker import QueryMaker
-from .agents.newsResearcher import NewsResearcher
+from .agents.newsResearcher import NewsResearcher, rank_topics_by_relevance
 from .agents.writer import Writer
 from .agents.reviewer import Reviewer
 from .agents.kyotenFinder import KyotenFinder, KyotenSearchRequest
+from .howa_store import HowaRecord, get_howa_store
 import logging
 import json
 
 logger = logging.getLogger(__name__)
 
+# 一括生成と同じステップの順序。対話型 API で範囲を指定したときもこの順に実行する
+STEP_ORDER = ["create_prompts", "run_sutra_search", "run_news_search", "write_howa", "evaluate_howa"]
+
+
+class SessionNotFoundError(Exception):
+    """対話型 API のセッションが存在しない、または期限切れ"""
+
+
+def _merge_step_result(step: str, context: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """ステップの結果を、次のステップが読むキーでコンテキストに加える"""
+    if step == "write_howa":
+        context["howa_candidates"] = result["final_howa"]
+    elif step == "evaluate_howa":
+        context["selected_howa"] = result
+    else:
+        context.update(result)
+
+
 class HowaGenerationService:
     """法話生成サービス"""
     
@@ -42,41 +66,98 @@ class HowaGenerationService:
                 detail=f"法話の生成に失敗しました (外部サービスエラー): {str(e)}"
             )
     
-    async def generate_full_howa(self, request: GenerateHowaRequest) -> HowaResponse:
+    async def generate_full_howa(self, request: GenerateHowaRequest, reuse_stored: bool = True) -> HowaResponse:
         """
         一括生成リクエストを受け取り、経典検索から評価までの一連の処理を実行する。
+        reuse_stored=False なら保存済みの法話があっても生成し直す（事前生成で記録を新しくするときなど）。
         """
         theme = request.theme
         audiences = request.audiences
-        context = {}
-        logger.info(f"Starting full howa generation for theme: '{theme}'")
+        settings = get_settings()
+        request_key = make_key(theme, audiences)
 
-        # --- ステップを順番に実行 ---
+        # 同じリクエストの法話が保存されていれば、生成し直さずにそれを返す
+        store = get_howa_store()
+        if reuse_stored and store is not None and settings.howa_reuse_max_age > 0:
+            try:
+                record = await store.afind_by_request_key(request_key, settings.howa_reuse_max_age)
+            except Exception as e:
+                logger.warning(f"Failed to look up stored howa for theme '{theme}': {e}")
+                record = None
+            if record is not None:
+                logger.info(f"Reusing stored howa {record.id} for theme '{theme}'")
+                return HowaResponse(**record.response, id=record.id)
 
-        # 1. プロンプト生成 (内部的に実行)
-        prompts_result = await self.execute_step("create_prompts", theme, audiences, context)
-        context.update(prompts_result)
+        # ドレインで打ち切られた同じリクエストがあれば、その途中経過から再開する。
+        # 打ち切ったプロセスは終了するので、プロセス内のキャッシュ（CACHE_BACKEND=memory）には残さない
+        checkpoints = get_cache("howa-checkpoints")
+        checkpoint_key = request_key
+        context = (await checkpoints.aget(checkpoint_key) or {}) if checkpoints.shared else {}
+        resumed = bool(context)
+        if resumed:
+            logger.info(f"Resuming howa generation for theme '{theme}' from checkpoint ({', '.join(context)})")
+        else:
+            logger.info(f"Starting full howa generation for theme: '{theme}'")
 
-        # 2. 経典検索
-        sutra_result = await self.execute_step("run_sutra_search", theme, audiences, context)
-        context.update(sutra_result)
+        # ステップごとの所要時間（秒）
+        timings: Dict[str, float] = {}
 
-        # 3. ニュース検索
-        news_result = await self.execute_step("run_news_search", theme, audiences, context)
-        context.update(news_result)
+        async def run_step(
+            step: str, step_context: Optional[Dict[str, Any]] = None, label: Optional[str] = None
+        ) -> Dict[str, Any]:
+            started = time.perf_counter()
+            result = await self.execute_step(step, theme, audiences, context if step_context is None else step_context)
+            timings[label or step] = round(time.perf_counter() - started, 3)
+            return result
+
+        with track_usage() as usage:
+            try:
+                # --- ステップを順番に実行（チェックポイントに結果があるステップは飛ばす） ---
+
+                # 1. プロンプト生成 (内部的に実行)
+                if "sutra_search_prompt" not in context:
+                    prompts_result = await run_step("create_prompts")
+                    context.update(prompts_result)
+
+                # 2-3. 経典検索と同時に、引用を使わないニュース検索を投機的に始める
+                if settings.news_speculative and "found_quote" not in context and "found_topics" not in context:
+                    await self._search_news_speculatively(run_step, theme, context)
+
+                # 2. 経典検索
+                if "found_quote" not in context:
+                    sutra_result = await run_step("run_sutra_search")
+                    context.update(sutra_result)
+
+                # 3. ニュース検索（投機的に得た話題がテーマと合わなかった場合は、ここで引用付きで検索し直す）
+                if "found_topics" not in context:
+                    news_result = await run_step("run_news_search")
+                    context.update(news_result)
+
+                # 4. 法話執筆
+                if "howa_candidates" not in context:
+                    write_result = await run_step("write_howa")
+                    context["howa_candidates"] = write_result["final_howa"] # キー名を評価ステップ用に変更
+
+                # evaluate_and_selectは、パース済みの辞書(dict)を返す
+                final_howa_data = await run_step("evaluate_howa")
+            except asyncio.CancelledError:
+                # 停止時のドレインなどで打ち切られた。完了したステップの結果を残し、再試行で続きから実行できるようにする
+                if not checkpoints.shared:
+                    logger.warning(
+                        f"Howa generation for theme '{theme}' was interrupted but not checkpointed: "
+                        f"CACHE_BACKEND={settings.cache_backend} is local to this process"
+                    )
+                    raise
+                await checkpoints.aset(checkpoint_key, context, ttl=settings.checkpoint_ttl)
+                logger.info(f"Checkpointed howa generation for theme '{theme}' ({', '.join(context) or 'no steps'})")
+                raise
+        if resumed:
+            await checkpoints.adelete(checkpoint_key)
 
-        # 4. 法話執筆
-        write_result = await self.execute_step("write_howa", theme, audiences, context)
-        context["howa_candidates"] = write_result["final_howa"] # キー名を評価ステップ用に変更
-        
-        # 最終的なレスポンスを組み立てる
-        # evaluate_and_selectは、パース済みの辞書(dict)を返す
-        final_howa_data = await self.execute_step("evaluate_howa", theme, audiences, context)
-        
         # 最終的なレスポンスを組み立てる
         try:
             # 辞書をそのままHowaResponseモデルに渡す
-            return HowaResponse(**final_howa_data)
+            response = HowaResponse(**final_howa_data)
         except Exception as e:
             # モデルへの変換に失敗した場合 (キーが足りないなど)
             logger.error(f"Failed to create HowaResponse from final data: {e}\nData was: {final_howa_data}")
@@ -90,6 +171,56 @@ class HowaGenerationService:
                 conclusion=""
             )
 
+        # 生成結果を保存する（書き込みは別スレッドでまとめて行われ、ここでは待たない）
+        if store is not None:
+            steps = {key: value for key, value in context.items() if key != "howa_candidates"}
+            record = HowaRecord(
+                request_key=request_key,
+                theme=theme,
+                audiences=list(audiences),
+                response=response.model_dump(exclude={"id"}),
+                candidates=context.get("howa_candidates", []),
+                steps=steps,
+                timings=timings,
+                llm_calls=usage.calls,
+                prompt_tokens=usage.prompt_tokens,
+                output_tokens=usage.output_tokens,
+                total_tokens=usage.total_tokens,
+            )
+            try:
+                response.id = store.save(record)
+            except Exception as e:
+                logger.warning(f"Failed to store howa for theme '{theme}': {e}")
+        return response
+
+    async def _search_news_speculatively(self, run_step, theme: str, context: Dict[str, Any]) -> None:
+        """
+        経典検索と、引用を使わない（テーマだけの）ニュース検索を同時に実行する。
+        ニュース検索の話題は、テーマと経典検索のキーワードとの関連度で並べ替えて関連の薄いものを除く
+        （漢文の引用とは表記が違いすぎて、文字の重なりでは比べられない）。
+        1件も残らなければ found_topics を設定せず、続くニュース検索のステップに引用付きで検索し直させる。
+        """
+        settings = get_settings()
+        news_context = {key: value for key, value in context.items() if key != "found_quote"}
+
+        async def search_sutra() -> None:
+            # 先に終わった経典検索の結果は、打ち切られてもチェックポイントに残るようすぐに反映する
+            context.update(await run_step("run_sutra_search"))
+
+        _, news_result = await asyncio.gather(
+            search_sutra(),
+            run_step("run_news_search", news_context, label="run_news_search_speculative"),
+        )
+
+        keywords = [theme, *context.get("sutra_search_prompt", "").split()]
+        ranked = rank_topics_by_relevance(news_result.get("found_topics", []), keywords)
+        relevant = [topic for score, topic in ranked if score >= settings.news_min_relevance]
+        if relevant:
+            logger.info(f"Using {len(relevant)} of {len(ranked)} speculative news topics")
+            context["found_topics"] = relevant
+        else:
+            logger.info("Speculative news topics do not match the theme; searching again with the quote")
+
     async def execute_step(self, step: str, theme: str, audiences: List[str], context: Dict[str, Any]) -> Dict[str, Any]:
         """
         単一の対話ステップを実行する内部ヘルパーメソッド。
@@ -109,16 +240,24 @@ class HowaGenerationService:
             search_request = KyotenSearchRequest(theme=search_prompt)
 
             try:
-                # Vertex AI Search の同期クライアントはブロッキングなので別スレッドで実行
-                response = await asyncio.to_thread(self.kyoten_finder.search, search_request.theme)
+                # 1回の検索で複数の引用を取得する。ブロッキングなバックエンドは別スレッドで実行される
+                responses = await self.kyoten_finder.search_top_k_async(
+                    search_request.theme, k=get_settings().sutra_quotes_per_search
+                )
             except Exception as e:
                 logger.error(f"Failed to execute Vertex AI search: {e}. Falling back to placeholder response.")
-                response = await self.kyoten_finder.search_sutra_placeholder(search_request)
-            return {"found_quote": {
-                "quote": response.sutra_text,
-                "source": response.source,
-                "interpretation": response.context
-            }}
+                responses = []
+            if not responses:
+                responses = [await self.kyoten_finder.search_sutra_placeholder(search_request)]
+            found_quotes = [
+                {
+                    "quote": response.sutra_text,
+                    "source": response.source,
+                    "interpretation": response.context
+                }
+                for response in responses
+            ]
+            return {"found_quote": found_quotes[0], "found_quotes": found_quotes}
 
         elif step == "run_news_search":
             prompt = context.get("news_search_prompt", "")
@@ -128,11 +267,17 @@ class HowaGenerationService:
 
         elif step == "write_howa":
             sutra_data = context.get("found_quote")
-            topics = context.get("found_topics", [])
+            # 対話型 API などで渡された話題が多すぎても、執筆の呼び出しは上限までにする
+            topics = context.get("found_topics", [])[:get_settings().news_max_topics]
             if not sutra_data or not topics:
                 raise ValueError("Context must contain 'found_quote' and 'found_topics'.")
             
-            howa_tasks = [self.writer.write_howa(theme, topic, sutra_data,audiences) for topic in topics]
+            # 複数の引用がある場合は、時事ネタごとに順番に割り当てて下書きを書き分ける
+            quotes = context.get("found_quotes") or [sutra_data]
+            howa_tasks = [
+                self.writer.write_howa(theme, topic, quotes[i % len(quotes)], audiences)
+                for i, topic in enumerate(topics)
+            ]
             howa_candidates = await asyncio.gather(*howa_tasks)
             return {"final_howa": howa_candidates}
 
@@ -152,3 +297,54 @@ class HowaGenerationService:
         [対話型API用] 単一のステップを実行し、結果を返す。
         """
         return await self.execute_step(step, theme, audiences, context)
+
+    async def execute_interactive_steps(
+        self,
+        step: str,
+        until: Optional[str] = None,
+        session_id: Optional[str] = None,
+        theme: Optional[str] = None,
+        audiences: Optional[List[str]] = None,
+        context: Optional[Dict[str, Any]] = None,
+        keep_session: bool = False,
+    ) -> Tuple[Optional[str], List[str], Dict[str, Any]]:
+        """
+        [対話型API用] step から until までのステップを順に実行し、(セッション ID, 実行したステップ, 結果) を返す。
+        keep_session=True で始めたセッションのコンテキストはサーバー側（共有キャッシュ、SESSION_TTL 秒で失効）に
+        保存するので、クライアントは2回目以降セッション ID だけを送ればよい。
+        セッション ID も keep_session も無い呼び出しは何も保存せず、セッション ID は None になる。
+        """
+        sessions = get_cache("howa-sessions")
+        ttl = get_settings().session_ttl
+        if session_id:
+            session = await sessions.aget(session_id)
+            if session is None:
+                raise SessionNotFoundError(f"Session '{session_id}' was not found or has expired.")
+        else:
+            if not theme:
+                raise ValueError("'theme' is required to start a session.")
+            session_id = uuid.uuid4().hex if keep_session else None
+            session = {"theme": theme, "audiences": [], "context": {}}
+        # リクエストで渡された値は、セッションに保存された値より優先する
+        if theme:
+            session["theme"] = theme
+        if audiences is not None:
+            session["audiences"] = audiences
+        session["context"].update(context or {})
+
+        start = STEP_ORDER.index(step)
+        end = STEP_ORDER.index(until) if until else start
+        if end < start:
+            raise ValueError(f"'until' ({until}) must not come before 'step' ({step}).")
+
+        executed: List[str] = []
+        results: Dict[str, Any] = {}
+        for name in STEP_ORDER[start:end + 1]:
+            result = await self.execute_step(name, session["theme"], session["audiences"], session["context"])
+            _merge_step_result(name, session["context"], result)
+            results.update(result)
+            executed.append(name)
+            # 途中のステップで失敗しても、完了したステップまではセッションに残す
+            if session_id:
+                await sessions.aset(session_id, session, ttl=ttl)
+        return session_id, executed, results
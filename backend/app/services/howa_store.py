@@ -0,0 +1,260 @@
+"""
+生成した法話の保存先（SQLite）。
+
+生成のたびにリクエストキー、最終的な法話、候補、各ステップの出力、所要時間、トークン数を1行として記録する。
+書き込みは専用スレッドがキューからまとめて取り出し、1トランザクションで書くので、リクエストの応答を待たせない。
+書き込み待ちの記録もメモリ上で参照できるため、保存した直後から ID やリクエストキーで引ける。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# 相対パスの HOWA_STORE_PATH の基準（backend ディレクトリ。起動したディレクトリによらない）
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS howa (
+    id TEXT PRIMARY KEY,
+    request_key TEXT NOT NULL,
+    theme TEXT NOT NULL,
+    audiences TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    response TEXT NOT NULL,
+    candidates TEXT NOT NULL,
+    steps TEXT NOT NULL,
+    timings TEXT NOT NULL,
+    llm_calls INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    total_tokens INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS howa_request_key ON howa (request_key, created_at);
+"""
+
+_COLUMNS = (
+    "id", "request_key", "theme", "audiences", "created_at", "response", "candidates", "steps", "timings",
+    "llm_calls", "prompt_tokens", "output_tokens", "total_tokens",
+)
+_JSON_COLUMNS = ("audiences", "response", "candidates", "steps", "timings")
+
+# 書き込みスレッドに終了を伝える番兵
+_STOP = object()
+
+
+@dataclass
+class HowaRecord:
+    """1回の生成の記録"""
+    request_key: str
+    theme: str
+    audiences: List[str]
+    response: Dict[str, Any]
+    candidates: List[Any] = field(default_factory=list)
+    steps: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created_at: float = field(default_factory=time.time)
+
+    def _row(self) -> tuple:
+        values = asdict(self)
+        return tuple(
+            json.dumps(values[name], ensure_ascii=False) if name in _JSON_COLUMNS else values[name]
+            for name in _COLUMNS
+        )
+
+    @classmethod
+    def _from_row(cls, row: sqlite3.Row) -> "HowaRecord":
+        return cls(**{name: json.loads(row[name]) if name in _JSON_COLUMNS else row[name] for name in _COLUMNS})
+
+
+class HowaStore:
+    """法話の記録を SQLite に非同期・一括で書き込み、ID とリクエストキーで引く"""
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 32,
+        flush_interval: float = 1.0,
+        max_pending: int = 1000,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._pending: Dict[str, HowaRecord] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writer: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        self.batches = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        # 接続はスレッドごと。fork 後の子プロセスでは親の接続を使わない
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    # --- 書き込み ---
+
+    def save(self, record: HowaRecord) -> str:
+        """記録を書き込み待ちに入れてすぐに返る。キューが一杯なら記録を諦める"""
+        self._ensure_writer()
+        with self._lock:
+            self._pending[record.id] = record
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._pending.pop(record.id, None)
+            logger.warning(f"Howa store queue is full; dropped record {record.id}")
+        return record.id
+
+    def _ensure_writer(self) -> None:
+        if self._pid != os.getpid():
+            # fork 前に作られたストア。親のスレッドとキューは引き継がない
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pending = {}
+            self._lock = threading.Lock()
+            self._writer = None
+            self._pid = os.getpid()
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="howa-store-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            # 最初の1件から flush_interval の間に届いたものをまとめて書く
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(conn, batch)
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, batch: List[HowaRecord]) -> None:
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO howa ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+                    [record._row() for record in batch],
+                )
+            self.batches += 1
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} howa records: {e}")
+        with self._lock:
+            for record in batch:
+                self._pending.pop(record.id, None)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """書き込み待ちの記録を書き終えてから書き込みスレッドを止める"""
+        writer = self._writer
+        if writer is None or not writer.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        writer.join(timeout)
+        self._writer = None
+
+    # --- 読み出し ---
+
+    def get(self, howa_id: str) -> Optional[HowaRecord]:
+        with self._lock:
+            record = self._pending.get(howa_id)
+        if record is not None:
+            return record
+        row = self._reader().execute("SELECT * FROM howa WHERE id = ?", (howa_id,)).fetchone()
+        return HowaRecord._from_row(row) if row else None
+
+    def find_by_request_key(self, request_key: str, max_age: Optional[float] = None) -> Optional[HowaRecord]:
+        """同じリクエストの最新の記録を返す。max_age 秒より古いものは使わない"""
+        oldest = time.time() - max_age if max_age else 0.0
+        with self._lock:
+            pending = [
+                record for record in self._pending.values()
+                if record.request_key == request_key and record.created_at >= oldest
+            ]
+        if pending:
+            return max(pending, key=lambda record: record.created_at)
+        row = self._reader().execute(
+            "SELECT * FROM howa WHERE request_key = ? AND created_at >= ? ORDER BY created_at DESC LIMIT 1",
+            (request_key, oldest),
+        ).fetchone()
+        return HowaRecord._from_row(row) if row else None
+
+    async def aget(self, howa_id: str) -> Optional[HowaRecord]:
+        return await asyncio.to_thread(self.get, howa_id)
+
+    async def afind_by_request_key(self, request_key: str, max_age: Optional[float] = None) -> Optional[HowaRecord]:
+        return await asyncio.to_thread(self.find_by_request_key, request_key, max_age)
+
+    def count(self) -> int:
+        return self._reader().execute("SELECT COUNT(*) FROM howa").fetchone()[0]
+
+
+@lru_cache(maxsize=1)
+def get_howa_store() -> Optional[HowaStore]:
+    """
+    設定に応じたストアを返す（HOWA_STORE_PATH が空なら保存しない）。
+    最初の呼び出しはディレクトリとスキーマを作るので、サーバーでは起動時にスレッドで呼んでおく
+    """
+    settings = get_settings()
+    if not settings.howa_store_path:
+        return None
+    return HowaStore(
+        str(BASE_DIR / settings.howa_store_path),
+        batch_size=settings.howa_store_batch_size,
+        flush_interval=settings.howa_store_flush_interval,
+    )
+
+
+def close_howa_store() -> None:
+    if get_howa_store.cache_info().currsize:
+        store = get_howa_store()
+        if store is not None:
+            store.close()
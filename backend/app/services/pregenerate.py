@@ -0,0 +1,273 @@
+"""
+よく使われるテーマと対象者の組み合わせについて、ピークの前に法話を生成しておくツール。
+
+テーマ一覧と利用実績（CSV）から組み合わせを人気順に並べ、上位から generate_full_howa を実行して
+結果を保存する（HOWA_STORE_PATH）。サーバーで再利用を有効にしていれば（HOWA_REUSE_MAX_AGE）、
+ピーク時の同じリクエストは保存済みの法話で即座に返る。
+本番のリクエストと競合しないよう、低い優先度（nice）・少ない並行数・トークン数の上限・時間帯の制限の中で動く。
+
+使い方:
+    # サーバーと同じ HOWA_STORE_PATH を参照できる環境（同じコンテナなど）で実行する
+    python -m app.services.pregenerate themes.txt --stats stats.csv --top 30 --window 2-6 --token-budget 500000
+
+テーマ一覧は1行に1テーマ（# 以降はコメント）。利用実績の CSV は theme,audience,count の列を持つ。
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import pathlib
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from ..core.cache import make_key
+from ..core.config import get_settings
+from ..core.usage import track_usage
+from ..models.howa import AudienceType, GenerateHowaRequest
+
+logger = logging.getLogger(__name__)
+
+# 既定で組み合わせる対象者
+DEFAULT_AUDIENCES: Tuple[str, ...] = tuple(audience.value for audience in AudienceType)
+
+
+@dataclass(frozen=True)
+class Combination:
+    """事前生成するテーマと対象者の組み合わせ"""
+    theme: str
+    audience: str
+    count: int = 0
+
+    @property
+    def request(self) -> GenerateHowaRequest:
+        return GenerateHowaRequest(theme=self.theme, audiences=[self.audience])
+
+
+@dataclass
+class PregenerateResult:
+    generated: int = 0
+    skipped: int = 0
+    failed: int = 0
+    tokens: int = 0
+    # 全件を処理する前に止めた理由（"token budget" / "window"）
+    stopped: Optional[str] = None
+    elapsed: float = 0.0
+
+
+def read_themes(path: pathlib.Path) -> List[str]:
+    themes = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        theme = line.split("#", 1)[0].strip()
+        if theme and theme not in themes:
+            themes.append(theme)
+    return themes
+
+
+def read_stats(path: pathlib.Path) -> Dict[Tuple[str, str], int]:
+    """theme,audience,count の CSV を読み、(テーマ, 対象者) ごとの件数を返す"""
+    stats: Dict[Tuple[str, str], int] = {}
+    with path.open(encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            try:
+                key = (row["theme"].strip(), row["audience"].strip())
+                stats[key] = stats.get(key, 0) + int(row["count"])
+            except (KeyError, ValueError, AttributeError):
+                logger.warning(f"Skipping malformed stats row: {row}")
+    return stats
+
+
+def rank_combinations(
+    themes: List[str],
+    stats: Dict[Tuple[str, str], int],
+    audiences: Iterable[str] = DEFAULT_AUDIENCES,
+    top: Optional[int] = None,
+) -> List[Combination]:
+    """テーマ一覧と対象者のすべての組み合わせを、利用実績の多い順に並べる（同数ならテーマ一覧の順）"""
+    audiences = list(audiences)
+    combinations = [
+        Combination(theme, audience, stats.get((theme, audience), 0))
+        for theme in themes
+        for audience in audiences
+    ]
+    combinations.sort(key=lambda combination: -combination.count)
+    return combinations[:top] if top else combinations
+
+
+def parse_window(value: str) -> Tuple[int, int]:
+    """"2-6" のような時間帯（開始時 以上、終了時 未満）。"22-4" のように日をまたいでもよい"""
+    start, _, end = value.partition("-")
+    window = (int(start), int(end))
+    if not all(0 <= hour <= 24 for hour in window) or window[0] == window[1]:
+        raise ValueError(f"Invalid window: {value}")
+    return window
+
+
+def in_window(hour: int, window: Optional[Tuple[int, int]]) -> bool:
+    if window is None:
+        return True
+    start, end = window
+    if start < end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+async def pregenerate(
+    combinations: List[Combination],
+    service,
+    store=None,
+    *,
+    concurrency: int = 1,
+    token_budget: int = 0,
+    refresh_after: Optional[float] = None,
+    window: Optional[Tuple[int, int]] = None,
+    current_hour: Callable[[], int] = lambda: datetime.now().hour,
+) -> PregenerateResult:
+    """
+    組み合わせを順に生成する。refresh_after 秒以内に生成済みの組み合わせは飛ばす。
+    token_budget（0 なら無制限）を使い切りそう、または時間帯を外れたら、新しい生成を始めずに止める。
+    """
+    result = PregenerateResult()
+    pending = list(combinations)
+    in_flight = 0
+    started = time.perf_counter()
+
+    def should_stop() -> Optional[str]:
+        if not in_window(current_hour(), window):
+            return "window"
+        if token_budget:
+            # 実行中の生成も、これまでの平均と同じだけ使うと見込む
+            attempts = result.generated + result.failed
+            average = result.tokens / attempts if attempts else 0
+            if result.tokens + average * (in_flight + 1) > token_budget:
+                return "token budget"
+        return None
+
+    async def worker() -> None:
+        nonlocal in_flight
+        while pending and result.stopped is None:
+            combination = pending.pop(0)
+            if store is not None and refresh_after:
+                record = await store.afind_by_request_key(
+                    make_key(combination.theme, [combination.audience]), refresh_after
+                )
+                if record is not None:
+                    result.skipped += 1
+                    continue
+            result.stopped = should_stop()
+            if result.stopped:
+                break
+            in_flight += 1
+            label = f"'{combination.theme}' / {combination.audience}"
+            with track_usage() as usage:
+                try:
+                    await service.generate_full_howa(combination.request, reuse_stored=False)
+                    result.generated += 1
+                    logger.info(f"Pregenerated howa for {label} ({usage.total_tokens} tokens)")
+                except Exception as e:
+                    result.failed += 1
+                    logger.error(f"Failed to pregenerate howa for {label}: {e}")
+            in_flight -= 1
+            result.tokens += usage.total_tokens
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Pregenerate howa for popular theme/audience combinations")
+    parser.add_argument("themes", type=pathlib.Path, help="Text file with one theme per line")
+    parser.add_argument("--stats", type=pathlib.Path, help="CSV with theme,audience,count columns used for ranking")
+    parser.add_argument(
+        "--audiences",
+        nargs="+",
+        default=list(DEFAULT_AUDIENCES),
+        help="Audiences to combine with each theme (default: every AudienceType)",
+    )
+    parser.add_argument("--top", type=int, default=30, help="Number of combinations to pregenerate (default: 30)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Generations run at once (default: 1)")
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=0,
+        help="Stop before the Gemini tokens used exceed this many; 0 means unlimited (default: 0)",
+    )
+    parser.add_argument(
+        "--refresh-after",
+        type=float,
+        help="Skip combinations generated within this many seconds (default: half of HOWA_REUSE_MAX_AGE)",
+    )
+    parser.add_argument(
+        "--window",
+        type=parse_window,
+        help="Only start generations between these local hours, e.g. 2-6 or 22-4",
+    )
+    parser.add_argument("--wait", action="store_true", help="Sleep until the window opens instead of exiting")
+    parser.add_argument("--nice", type=int, default=10, help="Niceness added to this process (default: 10)")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the ranked combinations")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if not args.themes.exists():
+        print(f"Theme list not found: {args.themes}", file=sys.stderr)
+        return 1
+    stats = read_stats(args.stats) if args.stats else {}
+    combinations = rank_combinations(read_themes(args.themes), stats, args.audiences, args.top)
+    if args.dry_run:
+        for combination in combinations:
+            print(f"{combination.count}\t{combination.theme}\t{combination.audience}")
+        return 0
+
+    while args.window and not in_window(datetime.now().hour, args.window):
+        if not args.wait:
+            print(f"Outside the window {args.window[0]}-{args.window[1]}; nothing to do")
+            return 0
+        time.sleep(60)
+
+    if args.nice and hasattr(os, "nice"):
+        os.nice(args.nice)
+
+    from .howa_service import HowaGenerationService
+    from .howa_store import close_howa_store, get_howa_store
+
+    settings = get_settings()
+    store = get_howa_store()
+    if store is None:
+        print("HOWA_STORE_PATH is empty; pregenerated howa would not be kept", file=sys.stderr)
+        return 1
+    if settings.howa_reuse_max_age <= 0:
+        print("HOWA_REUSE_MAX_AGE is 0; the server would not reuse pregenerated howa", file=sys.stderr)
+        return 1
+    refresh_after = args.refresh_after if args.refresh_after is not None else settings.howa_reuse_max_age / 2
+    try:
+        result = asyncio.run(
+            pregenerate(
+                combinations,
+                HowaGenerationService(),
+                store,
+                concurrency=args.concurrency,
+                token_budget=args.token_budget,
+                refresh_after=refresh_after,
+                window=args.window,
+            )
+        )
+    finally:
+        close_howa_store()
+    print(
+        f"Pregenerated {result.generated} howa ({result.skipped} fresh, {result.failed} failed) "
+        f"using {result.tokens} tokens in {result.elapsed:.1f}s"
+        + (f"; stopped early ({result.stopped})" if result.stopped else "")
+    )
+    return 1 if result.failed and not result.generated else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
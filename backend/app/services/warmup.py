@@ -0,0 +1,72 @@
+"""
+起動直後のウォームアップ。
+
+重い SDK の読み込みとクライアント生成、ローカル索引の読み込みを、リクエストを受け付け始めた後に
+バックグラウンドで済ませる。/healthz は起動後すぐに応答でき、最初の法話生成リクエストも
+読み込み待ちにならない。
+"""
+
+import logging
+import threading
+import time
+
+from app.core.clients import get_genai_client, get_search_client
+from app.core.config import get_settings
+from app.services.corpus.loader import load_local_index, load_vector_index
+
+logger = logging.getLogger(__name__)
+
+
+def _backends() -> set:
+    settings = get_settings()
+    if settings.sutra_search_backend == "hybrid":
+        return set(settings.sutra_hybrid_backends)
+    return {settings.sutra_search_backend}
+
+
+def _index_tasks() -> list:
+    settings = get_settings()
+    backends = _backends()
+    tasks = []
+    if settings.sutra_index_dir and "local" in backends:
+        tasks.append(("local sutra index", lambda: load_local_index(settings.sutra_index_dir)))
+    if settings.sutra_index_dir and "vector" in backends:
+        tasks.append(
+            ("sutra vector index", lambda: load_vector_index(settings.sutra_index_dir, settings.sutra_vector_nprobe))
+        )
+    return tasks
+
+
+def _run(tasks: list) -> None:
+    for name, task in tasks:
+        started = time.perf_counter()
+        try:
+            task()
+        except Exception as e:
+            logger.warning(f"Warm-up of {name} failed: {e}")
+            continue
+        logger.info(f"Warmed up {name} in {time.perf_counter() - started:.2f}s")
+
+
+def preload_indexes() -> None:
+    """
+    読み取り専用のローカル索引だけを読み込む。スレッドもソケットも作らないので、
+    ワーカーを fork する前の親プロセスで呼んで索引のメモリを共有させられる
+    """
+    _run(_index_tasks())
+
+
+def warm_up() -> None:
+    """最初のリクエストで必要になるものを先に読み込む。失敗しても最初の利用時に作り直される"""
+    tasks = [("gemini client", get_genai_client)]
+    if "vertex" in _backends():
+        tasks.append(("vertex search client", get_search_client))
+    # preload_indexes 済みなら読み込み済みの索引が返るだけ
+    _run(tasks + _index_tasks())
+
+
+def start_warm_up() -> threading.Thread:
+    """ウォームアップをデーモンスレッドで開始する。イベントループは止めない"""
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,66 @@
+"""
+Vertex AI Search の検索結果デコードのマイクロベンチマーク。
+
+記録した SearchResponse（JSON）を読み込み、従来の _document_to_payload（Struct 全体の変換）と
+高速デコーダ _decode_document、および1件だけ使う場合の遅延デコードを比較する。
+
+使い方（backend ディレクトリで実行）:
+    uv run python benchmarks/bench_payload_decoder.py
+    uv run python benchmarks/bench_payload_decoder.py path/to/response.json --number 2000
+"""
+
+import argparse
+import os
+import pathlib
+import sys
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+# ネットワークには接続しないため、設定の必須項目はダミー値で埋める
+for name in ("GOOGLE_API_KEY", "VERTEX_AI_PROJECT_ID", "VERTEX_AI_LOCATION", "VERTEX_AI_DATA_STORE_ID"):
+    os.environ.setdefault(name, "benchmark")
+
+from google.cloud import discoveryengine_v1 as discoveryengine  # noqa: E402
+
+from app.services.agents.kyotenFinder import PAYLOAD_KEYS, KyotenFinder  # noqa: E402
+
+DEFAULT_RESPONSE = pathlib.Path(__file__).parent / "data" / "search_response.json"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("responses", nargs="*", type=pathlib.Path, default=[DEFAULT_RESPONSE])
+    parser.add_argument("--number", type=int, default=1000, help="1計測あたりの繰り返し回数")
+    args = parser.parse_args()
+
+    finder = KyotenFinder()
+    for path in args.responses:
+        response = discoveryengine.SearchResponse.from_json(
+            path.read_text(encoding="utf-8"), ignore_unknown_fields=True
+        )
+        documents = [result.document for result in response.results]
+
+        for document in documents:
+            full = finder._document_to_payload(document)
+            expected = {key: full[key] for key in PAYLOAD_KEYS if key in full}
+            if finder._decode_document(document) != expected:
+                raise SystemExit(f"{path}: decoder mismatch for document {document.id}")
+
+        cases = {
+            "legacy (all results)": lambda: [
+                finder._build_response_from_payload(finder._document_to_payload(d), "q") for d in documents
+            ],
+            "fast (all results)": lambda: finder._parse_search_results(response, "q"),
+            "fast (first result)": lambda: next(finder._iter_search_results(response, "q")),
+        }
+        print(f"{path.name}: {len(documents)} results")
+        baseline = None
+        for label, case in cases.items():
+            seconds = min(timeit.repeat(case, number=args.number, repeat=5)) / args.number
+            baseline = baseline or seconds
+            print(f"  {label:<22} {seconds * 1e6:9.1f} us/response  x{baseline / seconds:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+バックエンドの起動時間（`import main` にかかる時間）の計測とインポート時間の内訳表示。
+
+新しいプロセスで `python -X importtime -c "import main"` を繰り返し実行し、壁時計時間の最小値と中央値、
+累積インポート時間の大きいモジュール上位を表示する。起動時に読み込まれてはいけない重い SDK が
+読み込まれていれば警告する。--budget を超えた場合は終了コード 1 を返す。
+
+使い方（backend ディレクトリで実行）:
+    uv run python benchmarks/bench_startup.py
+    uv run python benchmarks/bench_startup.py --runs 10 --top 30 --budget 1.0
+"""
+
+import argparse
+import os
+import pathlib
+import re
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+
+# 最初の利用時まで読み込みを遅らせているモジュール
+DEFERRED_MODULES = ("google.genai", "google.cloud.discoveryengine_v1", "google.protobuf")
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+PROBE = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    "import main\n"
+    "print(time.perf_counter() - started)\n"
+    "print(','.join(sorted(sys.modules)))\n"
+)
+
+
+def run_once() -> tuple[float, list[str], list[tuple[int, int, int, str]]]:
+    """(import main の秒数, 読み込まれたモジュール, (自身, 累積, 深さ, 名前) の一覧)"""
+    env = dict(os.environ)
+    # ネットワークには接続しないため、設定の必須項目はダミー値で埋める
+    for name in ("GOOGLE_API_KEY", "VERTEX_AI_PROJECT_ID", "VERTEX_AI_LOCATION", "VERTEX_AI_DATA_STORE_ID"):
+        env.setdefault(name, "benchmark")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, modules = result.stdout.splitlines()[-2:]
+    imports = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            imports.append((int(match[1]), int(match[2]), len(match[3]) // 2, match[4]))
+    return float(elapsed), modules.split(","), imports
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="計測回数")
+    parser.add_argument("--top", type=int, default=20, help="表示するモジュール数")
+    parser.add_argument("--budget", type=float, help="import main の許容秒数（最小値で判定）")
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.runs):
+        elapsed, modules, imports = run_once()
+        timings.append(elapsed)
+
+    print(f"import main: min {min(timings):.3f}s / median {statistics.median(timings):.3f}s ({args.runs} runs)")
+    print(f"\n累積インポート時間の上位 {args.top} モジュール（最後の計測）:")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for self_us, cumulative_us, depth, name in sorted(imports, key=lambda item: item[1], reverse=True)[: args.top]:
+        print(f"{cumulative_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms  {'  ' * depth}{name}")
+
+    loaded = sorted({prefix for prefix in DEFERRED_MODULES for module in modules if module.startswith(prefix)})
+    if loaded:
+        print(f"\n警告: 起動時に遅延読み込みの対象が読み込まれています: {', '.join(loaded)}")
+
+    if args.budget is not None and min(timings) > args.budget:
+        raise SystemExit(f"\nimport main が予算 {args.budget:.3f}s を超えました ({min(timings):.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,57 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp
 import uvicorn
 
-from app.core.config import settings
+from app.core.config import get_settings
 from app.api.router import api_router
+from app.core.drain import drain
+from app.services.howa_store import close_howa_store, get_howa_store
+from app.services.warmup import start_warm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 設定は import 時ではなく起動時に読み込む
+    settings = get_settings()
+    app.title = settings.api_title
+    app.version = settings.api_version
+    app.description = settings.api_description
+    app.debug = settings.debug
+    # debug はミドルウェアの組み立て時に読まれるため、次のリクエストで組み立て直す
+    app.middleware_stack = None
+    # SDK の読み込みはバックグラウンドで行い、起動直後から /healthz に応答できるようにする
+    if settings.warmup_on_startup:
+        start_warm_up()
+    # 法話の記録のファイルとスキーマはイベントループを止めないようスレッドで用意する
+    await asyncio.to_thread(get_howa_store)
+    yield
+    # 書き込み待ちの法話の記録を書き終えてから終了する
+    await asyncio.to_thread(close_howa_store)
+
+
+class SettingsCORSMiddleware(CORSMiddleware):
+    """許可するオリジンを、ミドルウェアの組み立て時（最初の ASGI 呼び出し）に設定から読む CORS 設定"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        super().__init__(
+            app,
+            allow_origins=get_settings().allowed_origins,
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+        )
+
 
-# FastAPIアプリケーションの初期化
-app = FastAPI(
-    title=settings.api_title,
-    version=settings.api_version,
-    description=settings.api_description,
-    debug=settings.debug,
-)
+# FastAPIアプリケーションの初期化（タイトルなどは lifespan で設定から読み込む）
+app = FastAPI(lifespan=lifespan)
 
 # CORS設定
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.allowed_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+app.add_middleware(SettingsCORSMiddleware)
 
 # APIルーターの追加
 app.include_router(api_router, prefix="/v1")
@@ -32,7 +62,7 @@ app.include_router(api_router, prefix="/v1")
 async def root():
     return {
         "message": "FastAPI Backend is running",
-        "version": settings.api_version,
+        "version": get_settings().api_version,
         "status": "healthy"
     }
 
@@ -44,9 +74,13 @@ async def health_check():
 
 @app.get("/healthz", response_class=PlainTextResponse)
 async def healthz_check():
+    # 停止中（ドレイン中）は失敗させ、新しいリクエストが振り分けられないようにする
+    if drain.draining:
+        return PlainTextResponse("draining", status_code=503)
     return "ok"
 
 if __name__ == "__main__":
+    settings = get_settings()
     uvicorn.run(
         app,  # アプリケーションオブジェクトを直接渡す
         host=settings.host,
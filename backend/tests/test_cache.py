@@ -0,0 +1,226 @@
+import asyncio
+import fnmatch
+import shutil
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+
+import pytest
+
+from app.core.cache import MemoryCache, RedisCache, SQLiteCache, make_key
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    """テスト用の Redis プロトコルサーバー（GET / SET [PX] / DEL / SCAN / PING のみ）"""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.wfile.write(self.server.execute(args))
+
+
+class _RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RespHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _bulk(value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def execute(self, args):
+        command = args[0].upper()
+        with self.lock:
+            now = time.monotonic()
+            for key in [key for key, (_, expires) in self.data.items() if expires is not None and expires <= now]:
+                del self.data[key]
+            if command == b"PING":
+                return b"+PONG\r\n"
+            if command == b"GET":
+                entry = self.data.get(args[1])
+                return self._bulk(entry and entry[0])
+            if command == b"SET":
+                expires = now + int(args[4]) / 1000 if len(args) > 3 and args[3].upper() == b"PX" else None
+                self.data[args[1]] = (args[2], expires)
+                return b"+OK\r\n"
+            if command == b"DEL":
+                removed = sum(self.data.pop(key, None) is not None for key in args[1:])
+                return b":%d\r\n" % removed
+            if command == b"SCAN":
+                pattern = args[args.index(b"MATCH") + 1].decode()
+                keys = [key for key in self.data if fnmatch.fnmatchcase(key.decode(), pattern)]
+                return b"*2\r\n" + self._bulk(b"0") + b"*%d\r\n" % len(keys) + b"".join(map(self._bulk, keys))
+            return b"-ERR unknown command\r\n"
+
+
+@pytest.fixture(scope="module")
+def redis_url():
+    """redis-server があればそれを、無ければテスト用の Redis プロトコルサーバーを起動する"""
+    if shutil.which("redis-server"):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        process = subprocess.Popen(
+            ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no"], stdout=subprocess.DEVNULL
+        )
+        try:
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            yield f"redis://127.0.0.1:{port}/0"
+        finally:
+            process.terminate()
+            process.wait()
+        return
+    server = _RespServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def make_cache(request, tmp_path):
+    """名前空間を指定して、同じ保存先を使うキャッシュを作る"""
+    memory = MemoryCache(namespace="shared")
+
+    def make(namespace="test"):
+        if request.param == "memory":
+            cache = MemoryCache(namespace=namespace, compress_min_bytes=64)
+            cache._entries = memory._entries
+            return cache
+        if request.param == "sqlite":
+            return SQLiteCache(str(tmp_path / "cache.sqlite3"), namespace=namespace, compress_min_bytes=64)
+        return RedisCache(request.getfixturevalue("redis_url"), namespace=namespace, compress_min_bytes=64)
+
+    return make
+
+
+@pytest.fixture
+def cache(make_cache):
+    cache = make_cache()
+    cache.clear()
+    return cache
+
+
+def test_round_trip_and_stats(cache):
+    """JSON にできる値をそのまま取り出せ、ヒットとミスが数えられる"""
+    value = {"title": "無常", "quotes": ["諸行無常"] * 50, "score": 0.5}
+    assert cache.get("missing") is None
+    cache.set("howa", value)
+    assert cache.get("howa") == value
+    cache.delete("howa")
+    assert cache.get("howa") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["sets"], stats["errors"]) == (1, 2, 1, 0)
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+
+
+def test_large_values_are_compressed(cache):
+    value = "一切衆生悉有佛性。" * 200
+    assert cache._encode(value)[:1] == b"z"
+    assert cache._encode("短い")[:1] == b"j"
+    cache.set("long", value)
+    assert cache.get("long") == value
+
+
+def test_ttl_expires_entries(cache):
+    cache.set("short", "value", ttl=0.05)
+    cache.set("long", "value", ttl=60)
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    assert cache.get("long") == "value"
+
+
+def test_clear_only_touches_own_namespace(cache, make_cache):
+    other = make_cache("other")
+    cache.set("a", 1)
+    other.set("a", 2)
+    cache.clear()
+    assert cache.get("a") is None
+    assert other.get("a") == 2
+
+
+def test_async_interface(cache):
+    async def run():
+        await cache.aset("key", [1, 2, 3])
+        return await cache.aget("key")
+
+    assert asyncio.run(run()) == [1, 2, 3]
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(namespace="test", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_memory_cache_bounds_total_bytes():
+    cache = MemoryCache(namespace="test", max_entries=100, max_bytes=300, compress_min_bytes=10**6)
+    for index in range(10):
+        cache.set(str(index), "x" * 90)
+    assert cache.stats()["bytes"] <= 300
+    assert cache.get("9") is not None and cache.get("0") is None
+
+
+def test_sqlite_cache_is_shared_and_pruned(tmp_path):
+    """同じファイルを開いた別インスタンス（別ワーカー相当）から読め、上限を超えると古いものから消える"""
+    path = str(tmp_path / "cache.sqlite3")
+    writer = SQLiteCache(path, namespace="test", max_entries=3)
+    reader = SQLiteCache(path, namespace="test")
+    for index in range(5):
+        writer.set(str(index), index)
+        time.sleep(0.01)
+    assert reader.get("4") == 4
+    assert writer.prune() == 2
+    assert writer.get("0") is None and writer.get("4") == 4
+    assert reader.stats()["entries"] == 3
+
+    sized = SQLiteCache(path, namespace="sized", max_bytes=250, compress_min_bytes=10**6)
+    for index in range(5):
+        sized.set(str(index), "x" * 90)
+        time.sleep(0.01)
+    sized.prune()
+    assert sized.stats()["bytes"] <= 250
+    assert sized.get("4") is not None
+
+
+def test_unreachable_redis_counts_errors_as_misses():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    cache = RedisCache(f"redis://127.0.0.1:{port}/0", namespace="test", timeout=0.2)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+    stats = cache.stats()
+    assert (stats["errors"], stats["misses"], stats["sets"]) == (2, 1, 0)
+
+
+def test_make_key_is_stable():
+    assert make_key("無常", ["学生", "社会人"]) == make_key("無常", ["学生", "社会人"])
+    assert make_key("無常", ["学生", "社会人"]) != make_key("無常", ["社会人", "学生"])
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.core import drain as drain_module
+from app.core.cache import MemoryCache, SQLiteCache
+from app.core.drain import Drain, DrainingError
+from app.models.howa import GenerateHowaRequest
+from app.services import howa_service
+from app.services.howa_service import HowaGenerationService
+
+
+def test_drain_waits_for_in_flight_and_cancels_the_rest():
+    """期限内に終わる生成は完了させ、終わらない生成は打ち切って DrainingError にする"""
+
+    async def run():
+        drain = Drain()
+        fast = asyncio.ensure_future(drain.run(asyncio.sleep(0.05, result="fast")))
+        slow = asyncio.ensure_future(drain.run(asyncio.sleep(10, result="slow")))
+        await asyncio.sleep(0)
+        assert drain.in_flight == 2
+
+        completed, cancelled = await drain.drain(timeout=0.2)
+        assert (completed, cancelled) == (1, 1)
+        assert await fast == "fast"
+        with pytest.raises(DrainingError):
+            await slow
+        with pytest.raises(DrainingError):
+            await drain.run(asyncio.sleep(0))
+        assert drain.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_request_cancellation_is_not_reported_as_drain():
+    """クライアント側のキャンセルは CancelledError のまま伝わる"""
+
+    async def run():
+        drain = Drain()
+        request = asyncio.ensure_future(drain.run(asyncio.sleep(10)))
+        await asyncio.sleep(0)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        assert drain.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_healthz_fails_while_draining(monkeypatch):
+    client = TestClient(main.app)
+    assert client.get("/healthz").status_code == 200
+    monkeypatch.setattr(drain_module.drain, "draining", True)
+    response = client.get("/healthz")
+    assert (response.status_code, response.text) == (503, "draining")
+    assert client.get("/health").status_code == 200
+
+    rejected = client.post("/v1/howa", json={"theme": "無常", "audiences": ["学生"]})
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == str(drain_module.RETRY_AFTER_SECONDS)
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "memory"])
+def test_interrupted_generation_resumes_from_checkpoint(monkeypatch, tmp_path, backend):
+    """
+    打ち切られた生成は完了したステップを保存し、同じリクエストの再試行はその続きから実行する。
+    プロセス内のキャッシュは打ち切ったプロセスと一緒に消えるので、保存せずに最初から生成し直す
+    """
+    if backend == "sqlite":
+        checkpoints = SQLiteCache(str(tmp_path / "cache.sqlite3"), namespace="howa-checkpoints")
+    else:
+        checkpoints = MemoryCache(namespace="howa-checkpoints")
+    monkeypatch.setattr(howa_service, "get_cache", lambda namespace: checkpoints)
+    monkeypatch.setattr(howa_service, "get_howa_store", lambda: None)
+    request = GenerateHowaRequest(theme="無常", audiences=["学生"])
+    outputs = {
+        "create_prompts": {"news_search_prompt": "news", "sutra_search_prompt": "sutra"},
+        "run_sutra_search": {"found_quote": {"quote": "諸行無常"}, "found_quotes": [{"quote": "諸行無常"}]},
+        "run_news_search": {"found_topics": ["topic"]},
+        "write_howa": {"final_howa": ["draft"]},
+        "evaluate_howa": {
+            "title": "無常",
+            "introduction": "",
+            "problem_statement": "",
+            "sutra_quote": {"text": "諸行無常", "source": "涅槃経"},
+            "modern_example": "",
+            "conclusion": "",
+        },
+    }
+
+    def make_service(calls, block_on=None):
+        service = HowaGenerationService()
+
+        async def execute_step(step, theme, audiences, context):
+            calls.append(step)
+            if step == block_on:
+                await asyncio.sleep(10)
+            return outputs[step]
+
+        service.execute_step = execute_step
+        return service
+
+    async def run():
+        first_calls = []
+        drain = Drain()
+        task = asyncio.ensure_future(
+            drain.run(make_service(first_calls, block_on="run_news_search").generate_full_howa(request))
+        )
+        await asyncio.sleep(0.05)
+        assert await drain.drain(timeout=0.05) == (0, 1)
+        with pytest.raises(DrainingError):
+            await task
+        assert first_calls == ["create_prompts", "run_sutra_search", "run_news_search"]
+
+        retry_calls = []
+        response = await make_service(retry_calls).generate_full_howa(request)
+        if checkpoints.shared:
+            assert retry_calls == ["run_news_search", "write_howa", "evaluate_howa"]
+        else:
+            assert checkpoints.stats()["sets"] == 0 and retry_calls[0] == "create_prompts"
+        assert response.sutra_quote.text == "諸行無常"
+
+    asyncio.run(run())
+    assert checkpoints.stats()["entries"] == 0
@@ -0,0 +1,157 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import main
+from app.api.endpoints import howa as howa_endpoint
+from app.core.cache import MemoryCache
+from app.core.config import get_settings
+from app.core.usage import record_usage, track_usage
+from app.models.howa import GenerateHowaRequest
+from app.services import howa_service
+from app.services.howa_service import HowaGenerationService
+from app.services import howa_store
+from app.services.howa_store import HowaRecord, HowaStore
+
+HOWA = {
+    "title": "無常",
+    "introduction": "",
+    "problem_statement": "",
+    "sutra_quote": {"text": "諸行無常", "source": "涅槃経"},
+    "modern_example": "",
+    "conclusion": "",
+}
+
+
+def make_record(request_key="key", **fields):
+    return HowaRecord(request_key=request_key, theme="無常", audiences=["学生"], response=HOWA, **fields)
+
+
+def test_records_are_readable_before_and_after_the_batched_write(tmp_path):
+    """書き込み待ちの記録もすぐに引け、まとめて書かれた後は別のインスタンスからも引ける"""
+    path = str(tmp_path / "howa.sqlite3")
+    store = HowaStore(path, batch_size=50, flush_interval=5)
+    ids = [store.save(make_record(f"key-{index}", timings={"write_howa": 1.5})) for index in range(20)]
+    assert store.get(ids[0]).timings == {"write_howa": 1.5}
+    assert store.find_by_request_key("key-3").id == ids[3]
+    assert HowaStore(path).count() == 0
+
+    store.close()
+    assert store.batches == 1
+    reader = HowaStore(path)
+    assert reader.count() == 20
+    record = reader.get(ids[5])
+    assert (record.request_key, record.audiences, record.response) == ("key-5", ["学生"], HOWA)
+    assert reader.get("missing") is None
+
+
+def test_find_by_request_key_returns_the_latest_fresh_record(tmp_path):
+    store = HowaStore(str(tmp_path / "howa.sqlite3"), flush_interval=0)
+    old = store.save(make_record(created_at=time.time() - 100))
+    new = store.save(make_record())
+    store.close()
+    assert store.find_by_request_key("key").id == new
+    assert store.find_by_request_key("key", max_age=10).id == new
+    store.save(make_record("other", created_at=time.time() - 100))
+    store.close()
+    assert store.find_by_request_key("other", max_age=10) is None
+    assert store.get(old) is not None
+
+
+def test_usage_is_summed_across_concurrent_calls():
+    def response(tokens):
+        metadata = SimpleNamespace(prompt_token_count=tokens, candidates_token_count=1, total_token_count=tokens + 1)
+        return SimpleNamespace(usage_metadata=metadata)
+
+    async def call(tokens):
+        await asyncio.sleep(0)
+        record_usage(response(tokens))
+
+    async def run():
+        with track_usage() as usage:
+            await asyncio.gather(call(10), call(20))
+            record_usage(SimpleNamespace(usage_metadata=None))
+        record_usage(response(100))
+        return usage
+
+    usage = asyncio.run(run())
+    assert (usage.calls, usage.prompt_tokens, usage.output_tokens, usage.total_tokens) == (3, 30, 2, 32)
+
+
+def test_generated_howa_is_stored_and_reused(monkeypatch, tmp_path):
+    """
+    生成した法話は記録され、ID で取得できる。
+    同じリクエストに保存済みの法話を返すのは、HOWA_REUSE_MAX_AGE で再利用を有効にしたときだけ
+    """
+    store = HowaStore(str(tmp_path / "howa.sqlite3"), flush_interval=0)
+    monkeypatch.setattr(howa_service, "get_howa_store", lambda: store)
+    monkeypatch.setattr(howa_endpoint, "get_howa_store", lambda: store)
+    monkeypatch.setattr(howa_service, "get_cache", lambda namespace: MemoryCache(namespace=namespace))
+    outputs = {
+        "create_prompts": {"news_search_prompt": "news", "sutra_search_prompt": "sutra"},
+        "run_sutra_search": {"found_quote": {"quote": "諸行無常"}},
+        "run_news_search": {"found_topics": ["諸行無常を感じさせる出来事"]},
+        "write_howa": {"final_howa": ["draft"]},
+        "evaluate_howa": HOWA,
+    }
+    calls = []
+
+    async def execute_step(step, theme, audiences, context):
+        calls.append(step)
+        return outputs[step]
+
+    service = HowaGenerationService()
+    service.execute_step = execute_step
+    request = GenerateHowaRequest(theme="無常", audiences=["学生"])
+
+    first = asyncio.run(service.generate_full_howa(request))
+    assert first.id and len(calls) == 5
+    assert get_settings().howa_reuse_max_age == 0
+    regenerated = asyncio.run(service.generate_full_howa(request))
+    assert regenerated.id != first.id and len(calls) == 10
+
+    monkeypatch.setattr(get_settings(), "howa_reuse_max_age", 3600)
+    second = asyncio.run(service.generate_full_howa(request))
+    assert second == regenerated and len(calls) == 10
+    store.close()
+
+    client = TestClient(main.app)
+    stored = client.get(f"/v1/howa/{first.id}").json()
+    assert stored["howa"]["id"] == first.id and stored["howa"]["title"] == "無常"
+    assert stored["candidates"] == ["draft"]
+    # 既定ではニュース検索を投機的に実行しない
+    assert set(stored["timings"]) == set(outputs)
+    assert client.get("/v1/howa/missing").status_code == 404
+
+
+def test_server_opens_and_closes_the_store_off_the_event_loop(monkeypatch):
+    """ストアの作成（ディレクトリとスキーマ）と終了は起動・停止時にスレッドで行い、相対パスは backend ディレクトリから"""
+    events = []
+
+    def on_loop():
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    class FakeStore:
+        def __init__(self, path, **options):
+            events.append(("open", path, on_loop()))
+
+        def close(self):
+            events.append(("close", on_loop()))
+
+    settings = SimpleNamespace(howa_store_path="data/howa.sqlite3", howa_store_batch_size=32, howa_store_flush_interval=1.0)
+    monkeypatch.setattr(howa_store, "get_settings", lambda: settings)
+    monkeypatch.setattr(howa_store, "HowaStore", FakeStore)
+    monkeypatch.setattr(main, "start_warm_up", lambda: None)
+    howa_store.get_howa_store.cache_clear()
+    try:
+        with TestClient(main.app):
+            assert events == [("open", str(howa_store.BASE_DIR / "data" / "howa.sqlite3"), False)]
+        assert events[-1] == ("close", False)
+    finally:
+        howa_store.get_howa_store.cache_clear()
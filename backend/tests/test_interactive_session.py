@@ -0,0 +1,95 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.api.endpoints.howa import get_howa_service
+from app.core.cache import MemoryCache
+from app.services import howa_service
+from app.services.howa_service import HowaGenerationService
+
+OUTPUTS = {
+    "create_prompts": {"news_search_prompt": "news", "sutra_search_prompt": "sutra"},
+    "run_sutra_search": {"found_quote": {"quote": "諸行無常"}},
+    "run_news_search": {"found_topics": ["topic"]},
+    "write_howa": {"final_howa": ["draft"]},
+    "evaluate_howa": {"title": "無常"},
+}
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    sessions = MemoryCache(namespace="howa-sessions")
+    monkeypatch.setattr(howa_service, "get_cache", lambda namespace: sessions)
+    return sessions
+
+
+@pytest.fixture
+def calls(sessions):
+    """ステップの実行を差し替え、(ステップ, テーマ, 受け取ったコンテキストのキー) を記録する"""
+    calls = []
+    service = HowaGenerationService()
+
+    async def execute_step(step, theme, audiences, context):
+        calls.append((step, theme, audiences, sorted(context)))
+        return OUTPUTS[step]
+
+    service.execute_step = execute_step
+    main.app.dependency_overrides[get_howa_service] = lambda: service
+    yield calls
+    main.app.dependency_overrides.pop(get_howa_service)
+
+
+def test_session_carries_context_between_steps(calls):
+    client = TestClient(main.app)
+    first = client.post(
+        "/v1/howa/interactive-step",
+        json={"step": "create_prompts", "theme": "無常", "audiences": ["学生"], "keep_session": True},
+    ).json()
+    assert first["result"] == OUTPUTS["create_prompts"] and first["steps"] == ["create_prompts"]
+
+    second = client.post(
+        "/v1/howa/interactive-step", json={"session_id": first["session_id"], "step": "run_sutra_search"}
+    ).json()
+    assert second["session_id"] == first["session_id"]
+    assert calls[-1] == ("run_sutra_search", "無常", ["学生"], ["news_search_prompt", "sutra_search_prompt"])
+
+
+def test_one_call_runs_a_range_of_steps(calls):
+    client = TestClient(main.app)
+    response = client.post(
+        "/v1/howa/interactive-step",
+        json={"step": "create_prompts", "until": "write_howa", "theme": "無常", "keep_session": True},
+    ).json()
+    assert response["steps"] == ["create_prompts", "run_sutra_search", "run_news_search", "write_howa"]
+    assert response["step"] == "write_howa" and response["result"]["final_howa"] == ["draft"]
+
+    evaluated = client.post(
+        "/v1/howa/interactive-step", json={"session_id": response["session_id"], "step": "evaluate_howa"}
+    ).json()
+    assert evaluated["result"] == {"title": "無常"}
+    assert "howa_candidates" in calls[-1][3]
+
+
+def test_invalid_sessions_and_ranges_are_client_errors(calls):
+    client = TestClient(main.app)
+    missing = client.post("/v1/howa/interactive-step", json={"session_id": "missing", "step": "write_howa"})
+    assert missing.status_code == 404
+    no_theme = client.post("/v1/howa/interactive-step", json={"step": "create_prompts"})
+    assert no_theme.status_code == 400
+    backwards = client.post(
+        "/v1/howa/interactive-step", json={"step": "write_howa", "until": "create_prompts", "theme": "無常"}
+    )
+    assert backwards.status_code == 400
+    assert calls == []
+
+
+def test_stateless_calls_do_not_create_sessions(calls, sessions):
+    """session_id を使わず、従来どおり context を送る呼び出し方では、セッションを保存しない"""
+    client = TestClient(main.app)
+    response = client.post(
+        "/v1/howa/interactive-step",
+        json={"step": "evaluate_howa", "theme": "無常", "context": {"howa_candidates": ["draft"]}},
+    )
+    assert response.status_code == 200 and response.json()["result"] == {"title": "無常"}
+    assert response.json()["session_id"] is None
+    assert sessions.stats()["sets"] == 0 and sessions.stats()["entries"] == 0
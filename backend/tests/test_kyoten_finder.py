@@ -0,0 +1,184 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.cloud import discoveryengine_v1 as discoveryengine
+
+from app.services.agents import kyotenFinder
+from app.services.agents.kyotenFinder import KyotenFinder, KyotenSearchResponse, reciprocal_rank_fusion
+
+
+def _response(text: str) -> KyotenSearchResponse:
+    return KyotenSearchResponse(sutra_text=text, source=f"{text}経", context="")
+
+
+def _finder(rankings, delays=None, **overrides) -> KyotenFinder:
+    """各バックエンドの順位と応答時間を差し替えた KyotenFinder を作る"""
+    finder = KyotenFinder()
+    finder.backend = "hybrid"
+    finder.hybrid_backends = list(rankings)
+    finder.hybrid_strategy = "fuse"
+    finder.backend_timeout = 0.5
+    finder.local_index_dir = None
+    for key, value in overrides.items():
+        setattr(finder, key, value)
+    delays = delays or {}
+
+    def fake_rank(backend, search_query, limit):
+        time.sleep(delays.get(backend, 0))
+        if isinstance(rankings[backend], Exception):
+            raise rankings[backend]
+        return [(key, _response(key)) for key in rankings[backend]][:limit]
+
+    finder._rank = fake_rank
+    finder._available_backends = lambda: list(rankings)
+    return finder
+
+
+def test_reciprocal_rank_fusion_prefers_consensus():
+    """複数のバックエンドで上位に来た結果が、単独1位より優先される"""
+    fused = reciprocal_rank_fusion([
+        [("a", _response("a")), ("b", _response("b"))],
+        [("c", _response("c")), ("b", _response("b"))],
+    ])
+    assert [key for key, _ in fused] == ["b", "a", "c"]
+
+
+@pytest.mark.asyncio
+async def test_hybrid_fuses_all_backends():
+    finder = _finder({"vertex": ["a", "b"], "local": ["c", "b"]})
+    response = await finder.search_hybrid("query")
+    assert response.sutra_text == "b"
+
+
+@pytest.mark.asyncio
+async def test_hybrid_drops_slow_and_failing_backends():
+    """タイムアウトしたバックエンドは待たずに切り捨て、失敗したものは無視する"""
+    finder = _finder(
+        {"vertex": ["slow"], "local": ["fast"], "vector": RuntimeError("broken")},
+        delays={"vertex": 1.0},
+        backend_timeout=0.2,
+    )
+    started = time.perf_counter()
+    response = await finder.search_hybrid("query")
+
+    assert response.sutra_text == "fast"
+    assert time.perf_counter() - started < 1.0
+
+
+@pytest.mark.asyncio
+async def test_hybrid_race_returns_first_good_answer():
+    """race モードでは、最初に結果を返したバックエンドの1位をそのまま使う"""
+    finder = _finder(
+        {"vertex": ["consensus", "x"], "local": [], "vector": ["quick"]},
+        delays={"vertex": 0.3},
+        backend_timeout=2.0,
+    )
+    started = time.perf_counter()
+    response = await finder.search_hybrid("query", race=True)
+
+    assert response.sutra_text == "quick"
+    assert time.perf_counter() - started < 0.3
+
+
+@pytest.mark.asyncio
+async def test_hybrid_falls_back_when_no_backend_answers():
+    finder = _finder({"vertex": [], "local": RuntimeError("broken")})
+    response = await finder.search_hybrid("query")
+    assert response.source == "涅槃経"
+
+
+def test_search_top_k_dedupes_by_source():
+    """同じ出典の結果は1件にまとめ、順位を保ったまま k 件返す"""
+    finder = _finder({"local": ["a", "b", "c", "d"]}, backend="local")
+    ranked = [("a-1", _response("a")), ("a-2", _response("a")), ("b-1", _response("b")), ("c-1", _response("c"))]
+    finder._rank = lambda backend, search_query, limit: ranked
+
+    results = finder.search_top_k("query", k=2)
+
+    assert [r.sutra_text for r in results] == ["a", "b"]
+
+
+class _FakeSearchClient:
+    calls = []
+
+    def serving_config_path(self, **kwargs):
+        return "serving-config"
+
+    def search(self, request, timeout=None, metadata=()):
+        self.calls.append((request, metadata))
+        documents = [
+            {"id": "t0262-001", "sutra_text": "諸法實相", "source": "妙法蓮華經"},
+            {"id": "t0262-002", "sutra_text": "唯佛與佛", "source": "妙法蓮華經"},
+            {"id": "t0374-001", "sutra_text": "悉有佛性", "source": "大般涅槃經"},
+        ]
+        results = [
+            SimpleNamespace(id=doc["id"], document=SimpleNamespace(id=doc["id"], struct_data=doc))
+            for doc in documents
+        ]
+        return SimpleNamespace(results=results)
+
+
+def test_vertex_top_k_uses_one_request_with_field_mask(monkeypatch):
+    """Vertex への問い合わせは1回で、フィールドマスクとスニペット無効化を付ける"""
+    monkeypatch.setattr(kyotenFinder, "get_search_client", _FakeSearchClient)
+    _FakeSearchClient.calls = []
+    finder = KyotenFinder()
+    finder.backend = "vertex"
+
+    results = finder.search_top_k("佛性", k=3)
+
+    assert [r.source for r in results] == ["妙法蓮華經", "大般涅槃經"]
+    assert len(_FakeSearchClient.calls) == 1
+    request, metadata = _FakeSearchClient.calls[0]
+    assert request.page_size == finder.page_size
+    assert request.content_search_spec.snippet_spec.return_snippet is False
+    assert ("x-goog-fieldmask", kyotenFinder.SEARCH_RESPONSE_FIELD_MASK) in metadata
+
+
+def test_decode_document_matches_full_conversion():
+    """高速デコーダは、Struct 全体を辞書化する従来経路と同じ値を返す"""
+    finder = KyotenFinder()
+    document = discoveryengine.Document(
+        id="t0374-001",
+        struct_data={
+            "title": "大般涅槃經",
+            "source": "大般涅槃經",
+            "content": "一切衆生悉有佛性。" * 50,
+            "keywords": ["佛性", "衆生"],
+            "meta": {"juan": 7},
+        },
+    )
+    json_document = discoveryengine.Document(
+        id="t0262-001",
+        json_data='{"title": "妙法蓮華經", "uri": "https://example.com/T0262.xml"}',
+    )
+
+    for doc in (document, json_document):
+        full = finder._document_to_payload(doc)
+        expected = {key: full[key] for key in kyotenFinder.PAYLOAD_KEYS if key in full}
+        assert finder._decode_document(doc) == expected
+    assert finder._decode_document(document)["keywords"] == ["佛性", "衆生"]
+
+
+
+def test_decode_document_keeps_results_without_known_keys():
+    """PAYLOAD_KEYS を含まない結果も、従来どおり全体をデコードして検索結果に残す"""
+    finder = KyotenFinder()
+    document = discoveryengine.Document(id="t0001-001", struct_data={"body": "諸行無常", "juan": 1})
+    assert finder._decode_document(document) == {"body": "諸行無常", "juan": 1}
+
+    response = SimpleNamespace(results=[SimpleNamespace(id="t0001-001", document=document)])
+    (result,) = finder._parse_search_results(response, "無常")
+    assert result[1].sutra_text == "無常"
+
+def test_sync_hybrid_search_works_with_and_without_a_running_loop():
+    """同期版のハイブリッド検索は、イベントループ上から呼ばれても asyncio.run の RuntimeError にならない"""
+    finder = _finder({"vertex": ["a", "b"], "local": ["b", "c"]})
+    assert [r.sutra_text for r in finder.search_top_k("query", k=3)] == ["b", "a", "c"]
+
+    async def call_from_loop():
+        return finder.search_top_k("query", k=3)
+
+    assert [r.sutra_text for r in asyncio.run(call_from_loop())] == ["b", "a", "c"]
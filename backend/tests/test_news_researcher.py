@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services.agents import newsResearcher
+from app.services.agents.newsResearcher import NewsResearcher, dedupe_topics, parse_topics, topic_similarity
+
+TOPICS = [
+    "大手企業が社員のボランティア休暇制度を新設した。",
+    "若者の間で、地域の清掃活動に参加する人が増えている。",
+    "高齢者の見守りに AI スピーカーを使う自治体が広がっている。",
+    "物価高のなか、子ども食堂への寄付が過去最多となった。",
+    "能登半島の被災地で、全国から集まった人々が炊き出しを続けている。",
+    "プロ野球選手が引退会見で、支えてくれた家族への感謝を語った。",
+    "SNS 上の誹謗中傷を減らすため、新しい法律が施行された。",
+]
+
+
+def test_bullets_skip_headers_preambles_and_nested_items():
+    text = """以下が調査結果です：
+# 最近のニュース
+- **大手企業A社**が、社員のボランティア休暇制度を新設した。
+  - 取得率は初年度で三割を超えた。
+- 若者の間で、地域の清掃活動に参加する人が増えている。
+* 高齢者の見守りに AI スピーカーを使う自治体が広がっている。
+"""
+    assert parse_topics(text, max_topics=5) == [
+        "大手企業A社が、社員のボランティア休暇制度を新設した。",
+        "若者の間で、地域の清掃活動に参加する人が増えている。",
+        "高齢者の見守りに AI スピーカーを使う自治体が広がっている。",
+    ]
+
+
+def test_json_output_is_preferred_and_validated():
+    text = '```json\n["短い", "能登半島の被災地で、全国から集まったボランティアが炊き出しを続けている。", 3]\n```'
+    assert parse_topics(text, max_topics=5) == ["能登半島の被災地で、全国から集まったボランティアが炊き出しを続けている。"]
+
+
+def test_near_duplicates_are_removed_and_topics_are_capped():
+    topics = [
+        "若者の間で、地域の清掃活動に参加する人が増えている。",
+        "若者の間で地域の清掃活動に参加する人が増えている",
+        "大手企業が社員のボランティア休暇制度を新設した。",
+    ]
+    assert topic_similarity(topics[0], topics[1]) > 0.9
+    assert dedupe_topics(topics, threshold=0.6) == [topics[0], topics[2]]
+    lines = "\n".join(f"{index}. {topic}" for index, topic in enumerate(TOPICS, 1))
+    assert parse_topics(lines, max_topics=5) == TOPICS[:5]
+
+
+def test_search_current_topics_requests_structured_output(monkeypatch):
+    """構造化出力を指定して呼び出し、返ってきた話題を上限までに絞る"""
+    calls = []
+    topics = TOPICS
+
+    async def generate_content(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(text=newsResearcher.json.dumps(topics, ensure_ascii=False), usage_metadata=None)
+
+    client = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+    monkeypatch.setattr(newsResearcher, "get_genai_client", lambda: client)
+    monkeypatch.setattr(newsResearcher, "get_settings", lambda: SimpleNamespace(news_max_topics=3, news_topic_similarity=0.6))
+
+    found = asyncio.run(NewsResearcher().search_current_topics("prompt"))
+    assert found == topics[:3]
+    assert calls[0]["config"] == newsResearcher.TOPICS_RESPONSE_CONFIG
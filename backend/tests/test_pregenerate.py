@@ -0,0 +1,92 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.cache import make_key
+from app.core.config import get_settings
+from app.core.usage import record_usage
+from app.services import howa_store
+from app.services.howa_store import HowaRecord, HowaStore
+from app.services.pregenerate import (
+    Combination, in_window, main, parse_window, rank_combinations, read_stats, read_themes, pregenerate
+)
+
+
+class FakeService:
+    """1回の生成で tokens だけトークンを使ったことにする"""
+
+    def __init__(self, tokens=100, fail_on=()):
+        self.tokens = tokens
+        self.fail_on = fail_on
+        self.requests = []
+
+    async def generate_full_howa(self, request, reuse_stored=True):
+        assert reuse_stored is False
+        self.requests.append((request.theme, request.audiences[0]))
+        await asyncio.sleep(0)
+        record_usage(SimpleNamespace(usage_metadata=SimpleNamespace(
+            prompt_token_count=self.tokens, candidates_token_count=0, total_token_count=self.tokens
+        )))
+        if request.theme in self.fail_on:
+            raise RuntimeError("quota")
+
+
+def test_combinations_are_ranked_by_popularity(tmp_path):
+    themes = tmp_path / "themes.txt"
+    themes.write_text("感謝\n# コメント\n無常  # 季節\n感謝\n", encoding="utf-8")
+    stats = tmp_path / "stats.csv"
+    stats.write_text("theme,audience,count\n無常,若者,5\n感謝,高齢者,3\n無常,若者,2\n壊れた行,,x\n", encoding="utf-8")
+
+    assert read_themes(themes) == ["感謝", "無常"]
+    counts = read_stats(stats)
+    assert counts[("無常", "若者")] == 7
+    ranked = rank_combinations(read_themes(themes), counts, ["若者", "高齢者"], top=3)
+    assert ranked == [Combination("無常", "若者", 7), Combination("感謝", "高齢者", 3), Combination("感謝", "若者", 0)]
+
+
+def test_window_wraps_midnight():
+    assert parse_window("22-4") == (22, 4)
+    assert in_window(23, (22, 4)) and in_window(3, (22, 4)) and not in_window(12, (22, 4))
+    assert in_window(2, (2, 6)) and not in_window(6, (2, 6))
+    assert in_window(12, None)
+    with pytest.raises(ValueError):
+        parse_window("3-3")
+
+
+def test_pregenerate_stops_at_the_token_budget():
+    combinations = [Combination(f"テーマ{index}", "若者") for index in range(10)]
+    service = FakeService(tokens=100, fail_on={"テーマ1"})
+    result = asyncio.run(pregenerate(combinations, service, token_budget=450, concurrency=2))
+    assert result.tokens <= 450
+    assert (result.generated, result.failed, result.stopped) == (3, 1, "token budget")
+
+
+def test_pregenerate_skips_fresh_records_and_respects_the_window(tmp_path):
+    store = HowaStore(str(tmp_path / "howa.sqlite3"), flush_interval=0)
+    store.save(HowaRecord(request_key=make_key("無常", ["若者"]), theme="無常", audiences=["若者"], response={}))
+    store.save(HowaRecord(
+        request_key=make_key("感謝", ["若者"]), theme="感謝", audiences=["若者"], response={},
+        created_at=time.time() - 1000,
+    ))
+    combinations = [Combination("無常", "若者"), Combination("感謝", "若者")]
+    service = FakeService()
+    result = asyncio.run(pregenerate(combinations, service, store, refresh_after=100))
+    assert service.requests == [("感謝", "若者")]
+    assert (result.generated, result.skipped) == (1, 1)
+
+    closed = asyncio.run(pregenerate(combinations, FakeService(), window=(2, 6), current_hour=lambda: 12))
+    assert (closed.generated, closed.stopped) == (0, "window")
+    store.close()
+
+
+def test_pregenerate_requires_reuse_to_be_enabled(monkeypatch, tmp_path, capsys):
+    """サーバーが保存済みの法話を再利用しない設定（既定）では、事前生成しても使われないので実行しない"""
+    themes = tmp_path / "themes.txt"
+    themes.write_text("無常\n", encoding="utf-8")
+    store = HowaStore(str(tmp_path / "howa.sqlite3"))
+    monkeypatch.setattr(howa_store, "get_howa_store", lambda: store)
+    monkeypatch.setattr(get_settings(), "howa_reuse_max_age", 0)
+    assert main([str(themes), "--nice", "0"]) == 1
+    assert "HOWA_REUSE_MAX_AGE" in capsys.readouterr().err
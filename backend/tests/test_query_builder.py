@@ -0,0 +1,108 @@
+import asyncio
+import threading
+
+from app.core.config import get_settings
+from app.services.agents import queryMaker
+from app.services.agents.queryMaker import QueryMaker
+from app.services.corpus.bm25_index import BM25Index
+from app.services.corpus.query_builder import build_sutra_query
+from app.services.corpus.segments import Segment
+
+SEGMENTS = [
+    Segment(id="a", content="一切衆生悉有佛性。如來常住無有變易。"),
+    Segment(id="b", content="諸行無常。是生滅法。"),
+    Segment(id="c", content="諸行無常。生滅滅已。寂滅為樂。"),
+    Segment(id="d", content="知恩報恩。是名善人。"),
+]
+
+
+def test_theme_is_reduced_to_weighted_keywords():
+    """テーマから語を取り出せたときは、対象者の語を加えない"""
+    query = build_sutra_query("人生における無常について", ["若者"])
+    assert query.text == "無常"
+    assert query.term_weights() == {"無常": 1.0}
+
+
+def test_modern_words_are_expanded_to_sutra_terms():
+    query = build_sutra_query("感謝の気持ちを忘れないこと", [])
+    # 現代語は一般の語として、補った仏教語はそれより軽く、新字体の語には正字の形も並べる
+    assert query.terms == [
+        ("感謝", 0.7), ("気持ち", 0.7), ("氣持ち", 0.7), ("忘れ", 0.7), ("報恩", 0.6), ("恩", 0.6)
+    ]
+
+
+def test_max_terms_counts_traditional_forms():
+    query = build_sutra_query("感謝の気持ちを忘れないこと", [], max_terms=3)
+    assert query.terms == [("感謝", 0.7), ("気持ち", 0.7), ("氣持ち", 0.7)]
+
+
+def test_words_keep_their_okurigana_but_not_particles():
+    # 照合は小文字で行い、検索する語は元の大文字・小文字のまま
+    assert build_sutra_query("SNS疲れ", []).text == "SNS疲れ"
+    assert build_sutra_query("ＳＮＳ疲れと孤独", []).text == "SNS疲れ 孤独"
+    assert build_sutra_query("孤独と仕事", []).text == "孤独 仕事"
+
+
+def test_weights_are_emitted_as_repetitions():
+    """重い語ほど多く繰り返し、BM25 のクエリ中の出現回数として効かせる"""
+    query = build_sutra_query("無常と感謝", [])
+    assert query.term_weights() == {"無常": 1.0, "感謝": 0.7, "報恩": 0.6, "恩": 0.6}
+    assert query.text == "無常 無常 感謝 報恩 恩"
+    index = BM25Index.build(SEGMENTS)
+
+    def scores(text):
+        return {hit.segment.id: hit.score for hit in index.search(text)}
+
+    weighted, flat = scores(query.text), scores(" ".join(query.term_weights()))
+    assert weighted["b"] / weighted["d"] > flat["b"] / flat["d"]
+
+
+def test_traditional_forms_and_idf_weights():
+    """コーパスに現れる語（正字を含む）は重く、ありふれた語や現れない語は軽くなる"""
+    index = BM25Index.build(SEGMENTS)
+    query = build_sutra_query("仏性と諸行無常とスマホ", [], index=index)
+    weights = query.term_weights()
+    assert "佛性" in weights
+    assert weights["仏性"] > weights["諸行無常"] > weights["スマホ"]
+
+
+def test_unusable_theme_is_searched_as_is():
+    assert build_sutra_query("  あいうえお ", []).text == "あいうえお"
+    # 対象者の語は、テーマから語を取り出せなかったときだけ、テーマより軽く加える
+    assert build_sutra_query("あいうえお", ["子供"]).terms == [("あいうえお", 1.0), ("童子", 0.3)]
+    # 1文字の語が抜けて半分以上が残らないテーマは、テーマそのものも検索する
+    assert build_sutra_query("夢を追う", []).text == "夢を追う 追う"
+
+
+def test_theme_without_usable_terms_is_searched_as_is():
+    """助詞や検索に不要な語しか残らないテーマは、正規化したテーマそのものを検索する"""
+    assert build_sutra_query("人生の意味", []).text == "人生の意味"
+    assert build_sutra_query("のを", ["高齢者"]).terms == [("のを", 1.0), ("老", 0.3)]
+    # 空のテーマでは空のクエリになり、経典検索のステップがテーマも空として断る
+    assert build_sutra_query("  ", []).text == ""
+
+
+def test_query_maker_builds_the_query_without_the_llm(monkeypatch):
+    class NoClient:
+        def __getattr__(self, name):
+            raise AssertionError("the LLM must not be called")
+
+    monkeypatch.setattr(queryMaker, "get_genai_client", NoClient)
+    query = asyncio.run(QueryMaker().create_sutra_search_prompt("長い入力文です。" * 10 + "怒りを手放すには", ["子供"]))
+    assert "\n" not in query and len(query) < 40
+    assert "瞋恚" in query.split()
+
+
+def test_query_maker_loads_the_index_off_the_event_loop(monkeypatch):
+    loop_threads = []
+
+    def load_local_index(index_dir):
+        loop_threads.append(threading.current_thread() is threading.main_thread())
+        return BM25Index.build(SEGMENTS)
+
+    monkeypatch.setattr(queryMaker, "get_genai_client", lambda: None)
+    monkeypatch.setattr(queryMaker, "load_local_index", load_local_index)
+    monkeypatch.setattr(get_settings(), "sutra_index_dir", "index")
+    query = asyncio.run(QueryMaker().create_sutra_search_prompt("仏性", []))
+    assert query.split()[0] == "仏性" and "佛性" in query.split()
+    assert loop_threads == [False]
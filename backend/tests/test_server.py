@@ -0,0 +1,221 @@
+import asyncio
+import os
+import pathlib
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from types import SimpleNamespace
+
+import uvicorn
+
+from app.core import server as server_module
+from app.core.drain import Drain
+from app.core.server import DrainingServer, _cgroup_cpu_limit, available_cpus
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+
+
+def test_cgroup_cpu_limit_v2(tmp_path):
+    (tmp_path / "cpu.max").write_text("150000 100000\n")
+    assert _cgroup_cpu_limit(tmp_path) == 1.5
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert _cgroup_cpu_limit(tmp_path) is None
+
+
+def test_cgroup_cpu_limit_v1(tmp_path):
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("200000\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert _cgroup_cpu_limit(tmp_path) == 2.0
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("-1\n")
+    assert _cgroup_cpu_limit(tmp_path) is None
+
+
+def test_available_cpus_is_capped_by_quota(tmp_path):
+    """1 CPU 未満の制限でもワーカーは1つ起動する"""
+    (tmp_path / "cpu.max").write_text("50000 100000\n")
+    assert available_cpus(tmp_path) == 1
+    assert available_cpus(tmp_path / "missing") == len(os.sched_getaffinity(0))
+
+
+class FakeListener:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_max_requests_recycling_drains_in_flight_generations(monkeypatch):
+    """MAX_REQUESTS に達したワーカーは待ち受けをやめ、実行中の生成を終えてから止まる"""
+    drain = Drain()
+    monkeypatch.setattr(server_module, "drain", drain)
+
+    async def run():
+        server = DrainingServer(uvicorn.Config("main:app"), drain_timeout=5, max_requests=2)
+        listener = FakeListener()
+        server.servers = [listener]
+        finished = asyncio.Event()
+
+        async def generation():
+            await finished.wait()
+            return "done"
+
+        task = asyncio.ensure_future(drain.run(generation()))
+        await asyncio.sleep(0)
+        server.server_state.total_requests = 2
+        assert await server.on_tick(1) is False
+        await asyncio.sleep(0)
+        # Pod は止まらないので、/healthz も新しい生成も断らない
+        assert listener.closed and not drain.draining and not server.should_exit
+
+        finished.set()
+        assert await task == "done"
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert server.should_exit
+        assert await server.on_tick(2) is True
+
+    asyncio.run(run())
+
+
+class FakeOS:
+    """Supervisor が使う os の関数を差し替え、終了したワーカーを exited に積んで回収させる"""
+    WNOHANG = os.WNOHANG
+
+    def __init__(self):
+        self.exited = []
+        self.signals = []
+
+    def kill(self, pid, sig):
+        self.signals.append((pid, sig))
+
+    def waitpid(self, pid, options):
+        return self.exited.pop(0) if self.exited else (0, 0)
+
+    waitstatus_to_exitcode = staticmethod(lambda status: status)
+
+
+def test_rolling_restart_keeps_reaping_crashed_workers(monkeypatch):
+    """入れ替え中も監視のループは止まらず、落ちたワーカーは作り直し、止まらないワーカーは強制終了する"""
+    fake_os = FakeOS()
+    monkeypatch.setattr(server_module, "os", fake_os)
+    supervisor = server_module.Supervisor(
+        uvicorn.Config("main:app", timeout_graceful_shutdown=1), None, 2,
+        max_requests=None, max_requests_jitter=0, drain_timeout=1,
+    )
+    pids = iter(range(10, 100))
+    spawned = []
+
+    def spawn():
+        pid = next(pids)
+        supervisor.children[pid] = time.monotonic() - server_module.MIN_WORKER_LIFETIME
+        spawned.append(pid)
+        return pid
+
+    supervisor._spawn = spawn
+
+    def tick():
+        supervisor._reap()
+        supervisor._rolling_restart()
+
+    spawn(), spawn()
+    supervisor._replace = list(supervisor.children)
+    tick()
+    assert set(supervisor.children) == {11, 12} and set(supervisor.retiring) == {10}
+    assert fake_os.signals == [(10, signal.SIGUSR1)]
+
+    # 止めている途中で別のワーカーが落ちても、すぐに作り直す
+    fake_os.exited.append((11, 1))
+    tick()
+    assert set(supervisor.children) == {12, 13} and set(supervisor.retiring) == {10}
+
+    # 止めたワーカーが終了したら、作り直さずに次へ進む（落ちたワーカーはもう入れ替え済み）
+    fake_os.exited.append((10, 0))
+    tick()
+    assert set(supervisor.children) == {12, 13} and not supervisor.retiring and not supervisor._replace
+
+    # 期限を過ぎても止まらないワーカーは一度だけ強制終了する
+    supervisor._terminate(12)
+    supervisor.retiring[12] = time.monotonic() - 1
+    tick()
+    tick()
+    assert fake_os.signals[-2:] == [(12, signal.SIGUSR1), (12, signal.SIGKILL)]
+    assert spawned == [10, 11, 12, 13]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(port: int) -> int:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=5) as response:
+        return response.status
+
+
+def test_supervisor_recycles_reloads_and_stops_gracefully(tmp_path):
+    """入れ替え（MAX_REQUESTS）・SIGHUP の再起動中もリクエストに応答し、SIGTERM で正常終了する"""
+    port = _free_port()
+    env = dict(os.environ)
+    for name in ("GOOGLE_API_KEY", "VERTEX_AI_PROJECT_ID", "VERTEX_AI_LOCATION", "VERTEX_AI_DATA_STORE_ID"):
+        env.setdefault(name, "test")
+    env.update(HOST="127.0.0.1", PORT=str(port), MAX_REQUESTS="2", WARMUP_ON_STARTUP="false", DEBUG="false")
+    env.update(CACHE_BACKEND="sqlite", CACHE_PATH=str(tmp_path / "cache.sqlite3"))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.core.server", "--workers", "2"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                _get(port)
+                break
+            except OSError:
+                assert time.monotonic() < deadline, "server did not start"
+                time.sleep(0.2)
+
+        assert [_get(port) for _ in range(10)] == [200] * 10
+        process.send_signal(signal.SIGHUP)
+        assert [_get(port) for _ in range(10)] == [200] * 10
+
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def test_process_local_cache_defaults_to_one_worker(monkeypatch, caplog):
+    """セッションを共有できない CACHE_BACKEND=memory では、指定がなければ1ワーカーで起動する"""
+    workers = []
+    settings = SimpleNamespace(cache_backend="memory", web_concurrency=None, drain_timeout=1, max_requests=0, max_requests_jitter=0)
+    monkeypatch.setattr(server_module, "get_settings", lambda: settings)
+    monkeypatch.setattr(server_module, "available_cpus", lambda: 4)
+    monkeypatch.setattr(server_module, "build_config", lambda: SimpleNamespace(load=lambda: None, bind_socket=lambda: None))
+    monkeypatch.setattr("app.services.warmup.preload_indexes", lambda: None)
+    monkeypatch.setattr(server_module, "DrainingServer", lambda config, *args: SimpleNamespace(run=lambda sockets: workers.append(1)))
+    monkeypatch.setattr(server_module, "Supervisor", lambda config, sock, n, **kwargs: SimpleNamespace(run=lambda: workers.append(n)))
+
+    with caplog.at_level("WARNING", logger=server_module.logger.name):
+        server_module.main([])
+    assert workers == [1]
+    assert "running a single worker" in caplog.text
+
+    caplog.clear()
+    with caplog.at_level("WARNING", logger=server_module.logger.name):
+        server_module.main(["--workers", "2"])
+    assert workers == [1, 2]
+    assert "not shared between 2 workers" in caplog.text
+
+    settings.cache_backend = "sqlite"
+    server_module.main([])
+    assert workers == [1, 2, 4]
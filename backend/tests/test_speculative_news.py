@@ -0,0 +1,109 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.core.cache import MemoryCache
+from app.core.config import get_settings
+from app.models.howa import GenerateHowaRequest
+from app.services import howa_service
+from app.services.agents.newsResearcher import rank_topics_by_relevance
+from app.core.usage import record_usage
+from app.services.howa_service import HowaGenerationService
+
+QUOTE = {"quote": "怨不以怨息", "interpretation": "怨みを捨ててこそ怨みは息む"}
+THRESHOLD = get_settings().news_min_relevance
+
+
+def test_topics_are_ranked_by_the_theme_and_search_keywords():
+    ranked = rank_topics_by_relevance(
+        ["新しいスマートフォンが発売された", "長年の怨みを捨てて和解した兄弟の話"],
+        ["怨み", "怨", "忍辱"],
+    )
+    assert ranked[0] == (1.0, "長年の怨みを捨てて和解した兄弟の話")
+    assert ranked[1][0] == 0.0
+
+
+def test_threshold_keeps_inflections_and_drops_shared_single_characters():
+    """既定の閾値 0.5 は、活用の違う語を関連ありとし、熟語と1文字だけ共通する語を関連なしとする"""
+    (inflected, _), = rank_topics_by_relevance(["上司に怒って会社を辞めた"], ["怒り"])
+    (shared_kanji, _), = rank_topics_by_relevance(["映画に感動した観客"], ["感謝"])
+    assert inflected == 0.5 and shared_kanji == 1 / 3
+    assert shared_kanji < THRESHOLD <= inflected
+
+
+def run_generation(monkeypatch, topics, speculative=True):
+    """生成を実行し、(ステップの開始・終了の記録, 呼び出し, 執筆に渡した話題, 記録した LLM の呼び出し数) を返す"""
+    stored = []
+    store = SimpleNamespace(save=lambda record: stored.append(record) or record.id)
+    monkeypatch.setattr(howa_service, "get_howa_store", lambda: store)
+    monkeypatch.setattr(howa_service, "get_cache", lambda namespace: MemoryCache(namespace=namespace))
+    settings = get_settings()
+    monkeypatch.setattr(
+        howa_service,
+        "get_settings",
+        lambda: SimpleNamespace(**{**settings.model_dump(), "news_speculative": speculative}),
+    )
+    events, calls, written = [], [], []
+
+    async def search(step, result):
+        # 別のステップに実行を譲り、同時に動いていれば開始と終了の間に他のステップの記録が入る
+        events.append(f"{step}:start")
+        for _ in range(3):
+            await asyncio.sleep(0)
+        events.append(f"{step}:end")
+        return result
+
+    async def execute_step(step, theme, audiences, context):
+        calls.append((step, "found_quote" in context))
+        # 各ステップは LLM を1回呼ぶ
+        record_usage(SimpleNamespace(usage_metadata=None))
+        if step == "create_prompts":
+            return {"news_search_prompt": "news", "sutra_search_prompt": "怨み 怨"}
+        if step == "run_sutra_search":
+            return await search(step, {"found_quote": QUOTE, "found_quotes": [QUOTE]})
+        if step == "run_news_search":
+            return await search(step, {"found_topics": topics if "found_quote" not in context else ["怨みを手放した人の話"]})
+        if step == "write_howa":
+            written.extend(context["found_topics"])
+            return {"final_howa": ["draft"]}
+        return {"title": "怨み", "introduction": "", "problem_statement": "",
+                "sutra_quote": {"text": QUOTE["quote"], "source": "法句経"}, "modern_example": "", "conclusion": ""}
+
+    service = HowaGenerationService()
+    service.execute_step = execute_step
+    asyncio.run(service.generate_full_howa(GenerateHowaRequest(theme="怨み", audiences=["若者"])))
+    return events, calls, written, stored[0].llm_calls
+
+
+def test_speculative_news_search_overlaps_the_sutra_search(monkeypatch):
+    """引用と合う話題が得られれば、検索し直さず、関連の薄い話題は除かれる"""
+    events, calls, written, _ = run_generation(
+        monkeypatch, ["新しいスマートフォンが発売された", "長年の怨みを捨てて和解した兄弟の話"]
+    )
+    assert events.index("run_news_search:start") < events.index("run_sutra_search:end")
+    assert ("run_news_search", False) in calls and ("run_news_search", True) not in calls
+    assert written == ["長年の怨みを捨てて和解した兄弟の話"]
+
+
+def test_poor_match_falls_back_to_a_search_with_the_quote(monkeypatch):
+    _, calls, written, _ = run_generation(monkeypatch, ["新しいスマートフォンが発売された"])
+    assert [call for call in calls if call[0] == "run_news_search"] == [("run_news_search", False), ("run_news_search", True)]
+    assert written == ["怨みを手放した人の話"]
+
+
+def test_speculation_can_be_disabled(monkeypatch):
+    events, calls, _, _ = run_generation(monkeypatch, ["長年の怨みを捨てて和解した兄弟の話"], speculative=False)
+    assert events == ["run_sutra_search:start", "run_sutra_search:end", "run_news_search:start", "run_news_search:end"]
+    assert [call for call in calls if call[0] == "run_news_search"] == [("run_news_search", True)]
+
+
+def test_fallback_costs_one_more_llm_call(monkeypatch):
+    """投機が当たれば LLM の呼び出しは増えず、外れて検索し直すと1回増える"""
+    *_, sequential = run_generation(monkeypatch, ["長年の怨みを捨てて和解した兄弟の話"], speculative=False)
+    *_, hit = run_generation(monkeypatch, ["長年の怨みを捨てて和解した兄弟の話"])
+    *_, miss = run_generation(monkeypatch, ["新しいスマートフォンが発売された"])
+    assert sequential == hit == 5
+    assert miss == 6
+
+
+def test_speculation_is_off_by_default():
+    assert get_settings().news_speculative is False
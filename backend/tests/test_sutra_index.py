@@ -0,0 +1,137 @@
+import json
+
+import pytest
+
+from app.services.agents.kyotenFinder import KyotenFinder, KyotenSearchRequest
+from app.services.corpus.bm25_index import BM25Index, MappedPostings
+from app.services.corpus.build_index import build_local_index
+from app.services.corpus.segment_store import SegmentStore, write_segment_store
+from app.services.corpus.segments import Segment, read_segments_jsonl
+from app.services.corpus.tokenizer import tokenize
+from app.services.corpus.vector_index import VectorIndex
+
+
+SEGMENTS = [
+    Segment(id="t0262-001", title="妙法蓮華經", uri="https://example.com/T0262.xml", content="諸法實相。唯佛與佛乃能究盡。"),
+    Segment(id="t0374-001", title="大般涅槃經", uri="https://example.com/T0374.xml", content="一切衆生悉有佛性。如來常住無有變易。"),
+    Segment(id="t0210-001", title="法句經", uri="https://example.com/T0210.xml", content="心為法本。心尊心使。中心念惡。即言即行。"),
+]
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    build_local_index(SEGMENTS, tmp_path)
+    return tmp_path
+
+
+def test_tokenize_splits_cjk_into_bigrams_and_keeps_ascii_words():
+    """漢字は1文字と2-gram、英数字は単語単位、句読点は区切りとして扱う"""
+    assert tokenize("SNS疲れ、心") == ["sns", "疲", "れ", "疲れ", "心"]
+    assert tokenize("一切衆生") == ["一", "切", "衆", "生", "一切", "切衆", "衆生"]
+
+
+def test_bm25_ranks_matching_segment_first(index_dir):
+    """保存・読み込みを経ても、クエリに最も合う一節が先頭に来る"""
+    index = BM25Index.load(index_dir)
+    hits = index.search("衆生の仏性", top_k=3)
+
+    assert len(index) == 3
+    assert hits[0].segment.id == "t0374-001"
+    assert all(hits[i].score >= hits[i + 1].score for i in range(len(hits) - 1))
+
+
+def test_bm25_returns_nothing_for_unknown_terms(index_dir):
+    assert BM25Index.load(index_dir).search("インターネット") == []
+
+
+def test_loaded_bm25_postings_are_backed_by_the_mapping(index_dir):
+    """読み込んだ索引のポスティングは Python のリストに展開せず、mmap したファイルをそのまま参照する"""
+    built = BM25Index.build(SegmentStore(index_dir / "segments.bin"))
+    index = BM25Index.load(index_dir)
+    mapped, _ = index._mapping
+    assert isinstance(index.postings, MappedPostings) and len(index.postings) == len(built.postings)
+    docs, tfs = index.postings.get("佛性")
+    assert docs.obj is mapped and tfs.obj is mapped and index.doc_lengths.obj is mapped
+    assert (list(docs), list(tfs)) == tuple(map(list, built.postings.get("佛性")))
+    assert index.postings.get("佛") is not None and index.postings.get("無い語") is None
+    assert dict(index.postings.items()).keys() == built.postings.keys()
+    assert [hit.doc for hit in index.search("心法")] == [hit.doc for hit in built.search("心法")]
+    docs.release(), tfs.release()
+    index.close()
+
+
+def test_read_segments_jsonl_skips_empty_content(tmp_path):
+    path = tmp_path / "segments.jsonl"
+    records = [
+        {"id": "a-001", "title": "A", "uri": "u", "content": "心為法本"},
+        {"id": "a-002", "title": "A", "uri": "u", "content": "   "},
+    ]
+    path.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in records), encoding="utf-8")
+
+    assert [segment.id for segment in read_segments_jsonl(path)] == ["a-001"]
+
+
+def test_segment_store_round_trip(tmp_path):
+    """mmap したストアから、ID・本文・メタデータを遅延で取り出せる"""
+    segments = SEGMENTS + [Segment(id="untitled-001", content="色即是空")]
+    path = tmp_path / "segments.bin"
+    assert write_segment_store(segments, path) == 4
+
+    store = SegmentStore(path)
+    try:
+        assert len(store) == 4
+        assert list(store) == segments
+        assert bytes(store.text_bytes(2)) == SEGMENTS[2].content.encode("utf-8")
+        assert store.find("t0374-001") == 1
+        assert store.find("untitled-001") == 3
+        assert store.find("missing") is None
+        assert store.title(3) is None
+    finally:
+        store.close()
+
+
+def test_kyoten_finder_local_backend(index_dir):
+    """ローカルバックエンドは Vertex と同じ KyotenSearchResponse を返す"""
+    finder = KyotenFinder()
+    finder.backend = "local"
+    finder.local_index_dir = str(index_dir)
+
+    response = finder.search("心の使い方")
+
+    assert response.sutra_text == "心為法本。心尊心使。中心念惡。即言即行。"
+    assert response.source == "法句經"
+
+
+@pytest.mark.parametrize("n_lists", [0, 2])
+def test_vector_index_batch_search(index_dir, n_lists):
+    """行列積による一括検索が、IVF の有無にかかわらず最も近い一節を返す"""
+    built = VectorIndex.build(BM25Index.load(index_dir).segments, index_dir, n_lists=n_lists)
+    index = VectorIndex.load(index_dir, nprobe=2)
+
+    assert index.matrix.shape == (3, built.encoder.dim)
+    results = index.search_batch(["一切衆生悉有佛性", "心為法本"], top_k=2)
+    assert [hits[0].segment.id for hits in results] == ["t0374-001", "t0210-001"]
+    assert index.search("インターネット") == []
+
+
+def test_kyoten_finder_vector_backend(index_dir):
+    VectorIndex.build(BM25Index.load(index_dir).segments, index_dir)
+    finder = KyotenFinder()
+    finder.backend = "vector"
+    finder.local_index_dir = str(index_dir)
+
+    assert finder.search("唯佛與佛").source == "妙法蓮華經"
+
+
+@pytest.mark.asyncio
+async def test_placeholder_uses_local_index_when_available(index_dir):
+    """Vertex 失敗時のフォールバックでも、索引があれば固定文ではなく検索結果を返す"""
+    finder = KyotenFinder()
+    finder.local_index_dir = str(index_dir)
+
+    response = await finder.search_sutra_placeholder(KyotenSearchRequest(theme="諸法の實相"))
+    assert response.source == "妙法蓮華經"
+
+    finder.local_index_dir = None
+    response = await finder.search_sutra_placeholder(KyotenSearchRequest(theme="諸法の實相"))
+    assert response.source == "涅槃経"
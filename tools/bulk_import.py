@@ -0,0 +1,248 @@
+"""Bulk ingestion through the Discovery Engine ImportDocuments API.
+
+Documents are first written to JSON Lines batch files. The batches are then either sent inline
+(at most 100 documents per request) or uploaded to Cloud Storage and imported with gcsSource
+requests. Every import is a long-running operation: it is polled until done, and the error
+samples it returns are mapped back to document ids.
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+import re
+import sys
+import time
+import typing as t
+from dataclasses import dataclass, field
+from urllib.parse import quote
+
+from upload_engine import UploadEngine
+
+INLINE_BATCH_LIMIT = 100
+DEFAULT_GCS_BATCH_SIZE = 10000
+GCS_URIS_PER_REQUEST = 100
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_OPERATION_TIMEOUT = 3600.0
+STORAGE_API = "https://storage.googleapis.com"
+RECONCILIATION_MODES = ("INCREMENTAL", "FULL")
+
+_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+
+class BulkImportError(RuntimeError):
+    """Raised when an import request or operation cannot be completed."""
+
+
+@dataclass
+class ImportResult:
+    succeeded: set[str] = field(default_factory=set)
+    failed: dict[str, str] = field(default_factory=dict)
+    # Documents of operations whose failures could not all be attributed to ids
+    unknown: set[str] = field(default_factory=set)
+
+    def merge(self, other: "ImportResult") -> None:
+        self.succeeded |= other.succeeded
+        self.failed.update(other.failed)
+        self.unknown |= other.unknown
+
+
+def write_jsonl_batches(
+    documents: t.Iterable[tuple[str, t.Mapping[str, t.Any]]],
+    directory: pathlib.Path,
+    batch_size: int,
+) -> list[pathlib.Path]:
+    """Write ``(document_id, payload)`` pairs as Discovery Engine ``document`` JSONL files."""
+    directory.mkdir(parents=True, exist_ok=True)
+    for stale in directory.glob("batch-*.jsonl"):
+        stale.unlink()
+    paths: list[pathlib.Path] = []
+    fh: t.TextIO | None = None
+    written = 0
+    try:
+        for document_id, payload in documents:
+            if fh is None or written >= batch_size:
+                if fh is not None:
+                    fh.close()
+                path = directory / f"batch-{len(paths):05d}.jsonl"
+                paths.append(path)
+                fh = path.open("w", encoding="utf-8")
+                written = 0
+            fh.write(json.dumps({"id": document_id, **payload}, ensure_ascii=False) + "\n")
+            written += 1
+    finally:
+        if fh is not None:
+            fh.close()
+    return paths
+
+
+def read_jsonl_batch(path: pathlib.Path) -> list[dict[str, t.Any]]:
+    with path.open(encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+class ImportClient:
+    """REST calls for documents:import, operation polling and Cloud Storage uploads, sent through the upload engine."""
+
+    def __init__(
+        self,
+        engine: UploadEngine,
+        *,
+        api_base: str,
+        storage_base: str = STORAGE_API,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        operation_timeout: float = DEFAULT_OPERATION_TIMEOUT,
+    ) -> None:
+        self.engine = engine
+        self.api_base = api_base.rstrip("/")
+        self.storage_base = storage_base.rstrip("/")
+        self.poll_interval = poll_interval
+        self.operation_timeout = operation_timeout
+
+    def _call(
+        self,
+        method: str,
+        url: str,
+        *,
+        payload: t.Mapping[str, t.Any] | None = None,
+        data: bytes | None = None,
+        content_type: str = "application/json; charset=utf-8",
+    ) -> dict[str, t.Any]:
+        response = self.engine.request(method, url, json=payload, data=data, content_type=content_type)
+        if response.status_code >= 300:
+            raise BulkImportError(f"{method} {url} failed ({response.status_code}): {response.text.strip()}")
+        return response.json()
+
+    def import_inline(self, parent_path: str, documents: list[dict[str, t.Any]], mode: str) -> str:
+        operation = self._call(
+            "POST",
+            f"{self.api_base}/{parent_path}/documents:import",
+            payload={"inlineSource": {"documents": documents}, "reconciliationMode": mode},
+        )
+        return operation["name"]
+
+    def import_gcs(self, parent_path: str, input_uris: list[str], mode: str) -> str:
+        operation = self._call(
+            "POST",
+            f"{self.api_base}/{parent_path}/documents:import",
+            payload={
+                "gcsSource": {"inputUris": input_uris, "dataSchema": "document"},
+                "reconciliationMode": mode,
+            },
+        )
+        return operation["name"]
+
+    def upload_to_gcs(self, path: pathlib.Path, bucket: str, object_name: str) -> str:
+        self._call(
+            "POST",
+            f"{self.storage_base}/upload/storage/v1/b/{quote(bucket, safe='')}/o"
+            f"?uploadType=media&name={quote(object_name, safe='')}",
+            data=path.read_bytes(),
+            content_type="application/x-ndjson",
+        )
+        return f"gs://{bucket}/{object_name}"
+
+    def wait(self, operation_name: str) -> dict[str, t.Any]:
+        deadline = time.monotonic() + self.operation_timeout
+        while True:
+            operation = self._call("GET", f"{self.api_base}/{operation_name}")
+            if operation.get("done"):
+                return operation
+            if time.monotonic() >= deadline:
+                raise BulkImportError(f"Timed out waiting for {operation_name}")
+            time.sleep(self.poll_interval)
+
+
+def collect_operation_result(operation: t.Mapping[str, t.Any], document_ids: list[str]) -> ImportResult:
+    """Attribute a finished import operation's error samples to the documents it covered."""
+    result = ImportResult()
+    if "error" in operation:
+        message = operation["error"].get("message", "import operation failed")
+        result.failed = {document_id: message for document_id in document_ids}
+        return result
+
+    known = set(document_ids)
+    samples = operation.get("response", {}).get("errorSamples", [])
+    for sample in samples:
+        message = sample.get("message", "")
+        for token in _ID_PATTERN.findall(message):
+            if token in known:
+                result.failed[token] = message
+
+    failure_count = int(operation.get("metadata", {}).get("failureCount", len(samples)) or 0)
+    if failure_count > len(result.failed):
+        # Samples are truncated: we cannot tell which of the remaining documents were imported
+        result.unknown = known - set(result.failed)
+    else:
+        result.succeeded = known - set(result.failed)
+    return result
+
+
+def bulk_import(
+    client: ImportClient,
+    parent_path: str,
+    documents: t.Mapping[str, t.Mapping[str, t.Any]],
+    *,
+    batch_dir: pathlib.Path,
+    batch_size: int | None = None,
+    gcs_bucket: str | None = None,
+    gcs_prefix: str = "",
+    reconciliation_mode: str = "INCREMENTAL",
+) -> ImportResult:
+    """Import ``documents`` (id -> payload) in batches and wait for every operation to finish."""
+    if reconciliation_mode not in RECONCILIATION_MODES:
+        raise BulkImportError(f"Unknown reconciliation mode: {reconciliation_mode}")
+    if gcs_bucket is None:
+        batch_size = min(batch_size or INLINE_BATCH_LIMIT, INLINE_BATCH_LIMIT)
+    else:
+        batch_size = batch_size or DEFAULT_GCS_BATCH_SIZE
+    batches = write_jsonl_batches(documents.items(), batch_dir, batch_size)
+    print(f"Wrote {len(documents)} documents to {len(batches)} batch files in {batch_dir}")
+
+    if reconciliation_mode == "FULL" and (gcs_bucket is None or len(batches) > GCS_URIS_PER_REQUEST):
+        # FULL deletes every document missing from the request, so all batches must go in one import
+        raise BulkImportError(
+            f"FULL reconciliation needs a single gcsSource import (at most {GCS_URIS_PER_REQUEST} batch files)"
+        )
+
+    operations: list[tuple[str, list[str]]] = []
+    if gcs_bucket is None:
+        for path in batches:
+            batch = read_jsonl_batch(path)
+            operations.append((
+                client.import_inline(parent_path, batch, reconciliation_mode),
+                [document["id"] for document in batch],
+            ))
+            print(f"submitted {path.name} ({len(batch)} documents)")
+    else:
+        uris: list[tuple[str, list[str]]] = []
+        for path in batches:
+            object_name = f"{gcs_prefix.strip('/')}/{path.name}".lstrip("/")
+            uris.append((client.upload_to_gcs(path, gcs_bucket, object_name), [d["id"] for d in read_jsonl_batch(path)]))
+            print(f"uploaded {path.name} to gs://{gcs_bucket}/{object_name}")
+        for start in range(0, len(uris), GCS_URIS_PER_REQUEST):
+            chunk = uris[start:start + GCS_URIS_PER_REQUEST]
+            operations.append((
+                client.import_gcs(parent_path, [uri for uri, _ in chunk], reconciliation_mode),
+                [document_id for _, ids in chunk for document_id in ids],
+            ))
+
+    result = ImportResult()
+    for name, document_ids in operations:
+        try:
+            operation = client.wait(name)
+        except BulkImportError as exc:
+            print(f"[error] {exc}", file=sys.stderr)
+            result.unknown |= set(document_ids)
+            continue
+        outcome = collect_operation_result(operation, document_ids)
+        for document_id, message in outcome.failed.items():
+            print(f"[error] {document_id}: {message}", file=sys.stderr)
+        if outcome.unknown:
+            print(
+                f"[warn] {name}: not every failure names its document; "
+                f"{len(outcome.unknown)} documents are left unconfirmed",
+                file=sys.stderr,
+            )
+        result.merge(outcome)
+    return result
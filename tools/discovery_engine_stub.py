@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Discovery Engine document API and Cloud Storage uploads.
+
+Run it, then point the upload tools at it with ``--api-endpoint http://127.0.0.1:8787/v1beta``
+(and ``--storage-endpoint http://127.0.0.1:8787`` for gcsSource imports) to exercise
+ingestion end to end without touching a real data store. Documents are kept in memory and
+can be inspected with ``GET /_stub/documents``.
+
+Supported calls: documents create (POST ?documentId=), PATCH (with allowMissing), DELETE,
+documents:import (inlineSource and gcsSource from objects uploaded here), operation GET and
+``upload/storage/v1/b/<bucket>/o?uploadType=media``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import typing as t
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+VALID_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,127}$")
+
+
+class StubState:
+    def __init__(self, operation_polls: int) -> None:
+        self.lock = threading.Lock()
+        self.documents: dict[str, dict[str, t.Any]] = {}
+        self.objects: dict[str, bytes] = {}
+        self.operations: dict[str, dict[str, t.Any]] = {}
+        self.operation_polls = operation_polls
+        self._ids = itertools.count(1)
+        self.requests = 0
+
+    def validate(self, document_id: str, document: t.Mapping[str, t.Any]) -> str | None:
+        if not VALID_ID.match(document_id):
+            return f"Document id {document_id} is invalid"
+        json_data = document.get("jsonData")
+        if json_data is not None:
+            try:
+                parsed = json.loads(json_data)
+            except json.JSONDecodeError:
+                parsed = None
+            if not isinstance(parsed, dict):
+                return f"Document {document_id}: jsonData is not a JSON object"
+        return None
+
+    def start_import(self, parent: str, documents: list[dict[str, t.Any]], mode: str) -> dict[str, t.Any]:
+        errors = []
+        imported = []
+        for document in documents:
+            document_id = str(document.get("id", ""))
+            error = self.validate(document_id, document)
+            if error:
+                errors.append({"code": 3, "message": error})
+                continue
+            imported.append(document_id)
+            self.documents[f"{parent}/documents/{document_id}"] = document
+        if mode == "FULL":
+            keep = {f"{parent}/documents/{document_id}" for document_id in imported}
+            for name in [name for name in self.documents if name.startswith(f"{parent}/documents/")]:
+                if name not in keep:
+                    del self.documents[name]
+        name = f"{parent.split('/branches/')[0]}/operations/import-documents-{next(self._ids)}"
+        self.operations[name] = {
+            "polls_left": self.operation_polls,
+            "result": {
+                "name": name,
+                "done": True,
+                "metadata": {"successCount": str(len(imported)), "failureCount": str(len(errors))},
+                "response": {"errorSamples": errors},
+            },
+        }
+        return {"name": name, "done": False}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: StubState
+
+    def log_message(self, format: str, *args: t.Any) -> None:  # noqa: A002 - BaseHTTPRequestHandler API
+        pass
+
+    def _reply(self, status: int, payload: t.Mapping[str, t.Any] | None = None) -> None:
+        body = json.dumps(payload or {}, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str) -> None:
+        self._reply(status, {"error": {"code": status, "message": message}})
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _route(self) -> tuple[str, dict[str, list[str]]]:
+        parsed = urlparse(self.path)
+        path = unquote(parsed.path)
+        # Drop the API version prefix (/v1, /v1beta, ...)
+        path = re.sub(r"^/v1\w*/", "", path).lstrip("/")
+        return path, parse_qs(parsed.query)
+
+    def do_GET(self) -> None:  # noqa: N802 - BaseHTTPRequestHandler API
+        path, _ = self._route()
+        with self.state.lock:
+            self.state.requests += 1
+            if path == "_stub/documents":
+                self._reply(200, {"documents": sorted(self.state.documents), "requests": self.state.requests})
+                return
+            operation = self.state.operations.get(path)
+            if operation is not None:
+                if operation["polls_left"] > 0:
+                    operation["polls_left"] -= 1
+                    self._reply(200, {"name": path, "done": False})
+                else:
+                    self._reply(200, operation["result"])
+                return
+            document = self.state.documents.get(path)
+        if document is None:
+            self._error(404, f"{path} not found")
+        else:
+            self._reply(200, {"name": path, **document})
+
+    def do_POST(self) -> None:  # noqa: N802 - BaseHTTPRequestHandler API
+        path, query = self._route()
+        body = self._body()
+        with self.state.lock:
+            self.state.requests += 1
+            if path.startswith("upload/storage/v1/b/"):
+                bucket = path.split("/")[4]
+                name = query.get("name", [""])[0]
+                self.state.objects[f"gs://{bucket}/{name}"] = body
+                self._reply(200, {"bucket": bucket, "name": name, "size": str(len(body))})
+                return
+            payload = json.loads(body or b"{}")
+            if path.endswith("/documents:import"):
+                parent = path[: -len("/documents:import")]
+                mode = payload.get("reconciliationMode", "INCREMENTAL")
+                if "inlineSource" in payload:
+                    documents = payload["inlineSource"].get("documents", [])
+                else:
+                    documents = []
+                    for uri in payload.get("gcsSource", {}).get("inputUris", []):
+                        data = self.state.objects.get(uri)
+                        if data is None:
+                            self._error(400, f"{uri} not found")
+                            return
+                        documents.extend(json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip())
+                self._reply(200, self.state.start_import(parent, documents, mode))
+                return
+            if path.endswith("/documents"):
+                document_id = query.get("documentId", [""])[0]
+                name = f"{path}/{document_id}"
+                if name in self.state.documents:
+                    self._error(409, f"{name} already exists")
+                    return
+                error = self.state.validate(document_id, payload)
+                if error:
+                    self._error(400, error)
+                    return
+                self.state.documents[name] = payload
+                self._reply(200, {"name": name, **payload})
+                return
+        self._error(404, f"{path} not found")
+
+    def do_PATCH(self) -> None:  # noqa: N802 - BaseHTTPRequestHandler API
+        path, query = self._route()
+        payload = json.loads(self._body() or b"{}")
+        with self.state.lock:
+            self.state.requests += 1
+            allow_missing = query.get("allowMissing", ["false"])[0] == "true"
+            if path not in self.state.documents and not allow_missing:
+                self._error(404, f"{path} not found")
+                return
+            error = self.state.validate(path.rsplit("/", 1)[-1], payload)
+            if error:
+                self._error(400, error)
+                return
+            self.state.documents[path] = payload
+        self._reply(200, {"name": path, **payload})
+
+    def do_DELETE(self) -> None:  # noqa: N802 - BaseHTTPRequestHandler API
+        path, _ = self._route()
+        with self.state.lock:
+            self.state.requests += 1
+            removed = self.state.documents.pop(path, None)
+        if removed is None:
+            self._error(404, f"{path} not found")
+        else:
+            self._reply(200, {})
+
+
+def make_server(host: str, port: int, *, operation_polls: int = 1) -> ThreadingHTTPServer:
+    handler = type("BoundStubHandler", (StubHandler,), {"state": StubState(operation_polls)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8787, help="Port to listen on (default: 8787)")
+    parser.add_argument(
+        "--operation-polls",
+        type=int,
+        default=1,
+        help="Number of polls an import operation stays pending before it completes (default: 1)",
+    )
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, operation_polls=args.operation_polls)
+    print(f"Discovery Engine stub listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
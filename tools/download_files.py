@@ -1,27 +1,49 @@
 #!/usr/bin/env python3
-"""Download TEI XML files from URL list and optionally upload their text to Vertex AI Search."""
+"""Download TEI XML files from URL list and optionally upload their text to Vertex AI Search.
+
+Downloads run concurrently over keep-alive connections. ETag / Last-Modified validators are kept in a
+state file inside the output directory, so reruns only cost one conditional request per unchanged file
+and interrupted downloads resume from their ``.part`` file.
+"""
 
 from __future__ import annotations
 
 import argparse
 import datetime as dt
 import hashlib
+import http.client
 import json
 import pathlib
+import random
 import re
 import shlex
 import subprocess
 import sys
+import threading
+import time
 import typing as t
-import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from urllib.error import HTTPError, URLError
-from urllib.parse import quote, urlparse
-from urllib.request import Request, urlopen
-
-CHUNK_SIZE = 8192
-TEI_NAMESPACE = "http://www.tei-c.org/ns/1.0"
-NS = {"tei": TEI_NAMESPACE}
+from urllib.parse import quote, urljoin, urlparse
+
+from http_pool import ConnectionPool
+from parse_cache import CACHE_DIRNAME, ParseCache, add_cache_arguments, cache_from_args
+from tei_extract import extract_body
+from upload_engine import UploadEngine, add_engine_arguments, build_engine
+
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = "howa-corpus-downloader/1.0"
+STATE_FILENAME = ".download-state.json"
+STATE_SAVE_INTERVAL = 2.0
+DEFAULT_WORKERS = 8
+DEFAULT_PER_HOST = 4
+DEFAULT_RETRIES = 4
+DEFAULT_BACKOFF = 1.0
+DEFAULT_TIMEOUT = 60.0
+MAX_REDIRECTS = 5
+MAX_RETRY_AFTER = 60.0
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
 BASE_URL = "https://discoveryengine.googleapis.com/v1"
 DEFAULT_COLLECTION = "default_collection"
 DEFAULT_BRANCH = "default_branch"
@@ -31,45 +53,7 @@ DEFAULT_BRANCH = "default_branch"
 class DownloadResult:
     url: str
     path: pathlib.Path
-
-
-@dataclass
-class SimpleResponse:
-    status_code: int
-    text: str
-
-
-@dataclass
-class GcloudSession:
-    access_token: str
-
-    def post(self, url: str, *, json: dict[str, t.Any] | None = None) -> SimpleResponse:
-        return self._request("POST", url, payload=json)
-
-    def patch(self, url: str, *, json: dict[str, t.Any] | None = None) -> SimpleResponse:
-        return self._request("PATCH", url, payload=json)
-
-    def _request(self, method: str, url: str, *, payload: dict[str, t.Any] | None) -> SimpleResponse:
-        data = json_dumps(payload)
-        request = Request(url, data=data, method=method)
-        request.add_header("Authorization", f"Bearer {self.access_token}")
-        request.add_header("Accept", "application/json")
-        if data is not None:
-            request.add_header("Content-Type", "application/json; charset=utf-8")
-        try:
-            with urlopen(request) as response:
-                body = response.read().decode("utf-8")
-                status = response.getcode()
-        except HTTPError as exc:
-            body = exc.read().decode("utf-8", errors="replace")
-            return SimpleResponse(status_code=exc.code, text=body)
-        return SimpleResponse(status_code=status, text=body)
-
-
-def json_dumps(payload: dict[str, t.Any] | None) -> bytes | None:
-    if payload is None:
-        return None
-    return json.dumps(payload).encode("utf-8")
+    status: str = "downloaded"
 
 
 def fetch_access_token(command: str) -> str:
@@ -96,11 +80,6 @@ def fetch_access_token(command: str) -> str:
     return token
 
 
-def build_gcloud_session(command: str) -> GcloudSession:
-    token = fetch_access_token(command)
-    return GcloudSession(access_token=token)
-
-
 def iter_urls(source: pathlib.Path) -> t.Iterable[str]:
     for line in source.read_text(encoding="utf-8").splitlines():
         url = line.strip()
@@ -116,92 +95,238 @@ def pick_filename(url: str) -> str:
     return candidate
 
 
-def ensure_unique(path: pathlib.Path) -> pathlib.Path:
-    if not path.exists():
-        return path
-    stem = path.stem
-    suffix = path.suffix
-    parent = path.parent
+def unique_name(name: str, taken: set[str]) -> str:
+    if name not in taken:
+        return name
+    path = pathlib.PurePosixPath(name)
     counter = 1
     while True:
-        candidate = parent / f"{stem}-{counter}{suffix}"
-        if not candidate.exists():
+        candidate = f"{path.stem}-{counter}{path.suffix}"
+        if candidate not in taken:
             return candidate
         counter += 1
 
 
-def download(url: str, dest_dir: pathlib.Path) -> pathlib.Path:
-    name = pick_filename(url)
-    target = ensure_unique(dest_dir / name)
-    with urlopen(url) as response, target.open("wb") as fh:
+class DownloadError(Exception):
+    """Raised when a URL cannot be fetched and retrying will not help."""
+
+
+class RetryableStatus(Exception):
+    def __init__(self, status: int, retry_after: float | None = None) -> None:
+        super().__init__(f"HTTP {status}")
+        self.retry_after = retry_after
+
+
+class DownloadState:
+    """Per-URL file name and validators (ETag / Last-Modified) persisted between runs."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        try:
+            self.entries: dict[str, dict[str, t.Any]] = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            self.entries = {}
+        except json.JSONDecodeError as exc:
+            print(f"ignoring unreadable download state {path}: {exc}", file=sys.stderr)
+            self.entries = {}
+
+    def get(self, url: str) -> dict[str, t.Any]:
+        with self._lock:
+            return dict(self.entries.get(url, {}))
+
+    def update(self, url: str, **fields: t.Any) -> None:
+        with self._lock:
+            self.entries.setdefault(url, {}).update(fields)
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= STATE_SAVE_INTERVAL:
+                self._save_locked()
+
+    def save(self) -> None:
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        if not self._dirty:
+            return
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.entries, indent=2, sort_keys=True), encoding="utf-8")
+        tmp_path.replace(self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+
+class Downloader:
+    """Fetches URLs over pooled connections, resuming partial files and skipping unchanged ones."""
+
+    def __init__(
+        self,
+        state: DownloadState,
+        pool: ConnectionPool,
+        *,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+    ) -> None:
+        self.state = state
+        self.pool = pool
+        self.retries = retries
+        self.backoff = backoff
+
+    def fetch(self, url: str, target: pathlib.Path) -> str:
+        """Download ``url`` to ``target`` and return "downloaded", "resumed" or "unchanged"."""
+        attempt = 0
         while True:
-            chunk = response.read(CHUNK_SIZE)
-            if not chunk:
-                break
-            fh.write(chunk)
-    return target
+            try:
+                return self._fetch_once(url, target)
+            except (OSError, http.client.HTTPException, RetryableStatus) as exc:
+                if attempt >= self.retries:
+                    raise DownloadError(f"{exc} (after {attempt + 1} attempts)") from exc
+                retry_after = getattr(exc, "retry_after", None)
+                delay = retry_after if retry_after is not None else self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+                time.sleep(delay)
+                attempt += 1
+
+    def _request_headers(self, url: str, target: pathlib.Path, partial: pathlib.Path) -> tuple[dict[str, str], int]:
+        entry = self.state.get(url)
+        headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "identity"}
+        etag = entry.get("etag")
+        last_modified = entry.get("last_modified")
+        offset = partial.stat().st_size if partial.exists() else 0
+        # If-Range only accepts a strong ETag or a date
+        range_validator = etag if etag and not etag.startswith("W/") else last_modified
+        if offset and range_validator:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = range_validator
+            return headers, offset
+        if target.exists():
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        return headers, 0
+
+    def _fetch_once(self, url: str, target: pathlib.Path) -> str:
+        partial = target.with_name(target.name + ".part")
+        headers, offset = self._request_headers(url, target, partial)
+        current = url
+        for _ in range(MAX_REDIRECTS + 1):
+            parsed = urlparse(current)
+            path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+            with self.pool.connection(parsed.scheme, parsed.netloc) as conn:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                status = response.status
+                if status != 200 and status != 206:
+                    response.read()
+                if status in REDIRECT_STATUSES:
+                    location = response.getheader("Location")
+                    if not location:
+                        raise DownloadError(f"HTTP {status} without Location header")
+                    current = urljoin(current, location)
+                    continue
+                if status == 304:
+                    return "unchanged"
+                if status == 416 and offset:
+                    # The partial file no longer matches the remote one; start over
+                    partial.unlink(missing_ok=True)
+                    raise RetryableStatus(status, retry_after=0)
+                if status in RETRY_STATUSES:
+                    raise RetryableStatus(status, parse_retry_after(response.getheader("Retry-After")))
+                if status != 200 and status != 206:
+                    raise DownloadError(f"HTTP {status} {response.reason}")
+
+                append = status == 206 and offset > 0
+                if append and not (response.getheader("Content-Range") or "").startswith(f"bytes {offset}-"):
+                    response.read()
+                    partial.unlink(missing_ok=True)
+                    raise RetryableStatus(status, retry_after=0)
+                # Record validators before streaming so an interrupted body can be resumed next time
+                self.state.update(
+                    url,
+                    path=target.name,
+                    etag=response.getheader("ETag"),
+                    last_modified=response.getheader("Last-Modified"),
+                )
+                with partial.open("ab" if append else "wb") as fh:
+                    while True:
+                        chunk = response.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        fh.write(chunk)
+                partial.replace(target)
+                self.state.update(url, size=target.stat().st_size)
+                return "resumed" if append else "downloaded"
+        raise DownloadError(f"too many redirects (>{MAX_REDIRECTS})")
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return min(float(value), MAX_RETRY_AFTER)
+    except ValueError:
+        return None
+
 
+def assign_targets(urls: list[str], dest_dir: pathlib.Path, state: DownloadState) -> dict[str, pathlib.Path]:
+    """Give every URL a stable file name, reusing the one recorded on earlier runs."""
+    taken = {entry["path"] for entry in state.entries.values() if entry.get("path")}
+    targets: dict[str, pathlib.Path] = {}
+    for url in urls:
+        name = state.entries.get(url, {}).get("path")
+        if not name:
+            name = unique_name(pick_filename(url), taken)
+            taken.add(name)
+        targets[url] = dest_dir / name
+    return targets
+
+
+def download_all(
+    url_file: pathlib.Path,
+    output_dir: pathlib.Path,
+    *,
+    workers: int = DEFAULT_WORKERS,
+    per_host: int = DEFAULT_PER_HOST,
+    retries: int = DEFAULT_RETRIES,
+    timeout: float = DEFAULT_TIMEOUT,
+    state_file: pathlib.Path | None = None,
+) -> tuple[list[DownloadResult], list[str]]:
+    urls = list(dict.fromkeys(iter_urls(url_file)))
+    state = DownloadState(state_file or output_dir / STATE_FILENAME)
+    targets = assign_targets(urls, output_dir, state)
+    pool = ConnectionPool(per_host=per_host, timeout=timeout)
+    downloader = Downloader(state, pool, retries=retries)
 
-def download_all(url_file: pathlib.Path, output_dir: pathlib.Path) -> tuple[list[DownloadResult], list[str]]:
     downloads: list[DownloadResult] = []
     failures: list[str] = []
-    for url in iter_urls(url_file):
-        try:
-            saved = download(url, output_dir)
-            downloads.append(DownloadResult(url=url, path=saved))
-            print(f"saved {url} -> {saved}")
-        except (HTTPError, URLError) as exc:
-            failures.append(f"{url}: {exc}")
-            print(f"failed {url}: {exc}", file=sys.stderr)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(downloader.fetch, url, targets[url]): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    status = future.result()
+                except (DownloadError, OSError, ValueError) as exc:
+                    failures.append(f"{url}: {exc}")
+                    print(f"failed {url}: {exc}", file=sys.stderr)
+                    continue
+                downloads.append(DownloadResult(url=url, path=targets[url], status=status))
+                if status == "unchanged":
+                    print(f"unchanged {url}")
+                else:
+                    print(f"{'resumed' if status == 'resumed' else 'saved'} {url} -> {targets[url]}")
+    finally:
+        pool.close()
+        state.save()
     return downloads, failures
 
 
-def collapse_whitespace(text: str) -> str:
-    return re.sub(r"\s+", " ", text).strip()
-
-
-def extract_title(root: ET.Element) -> str | None:
-    title = root.findtext(".//tei:teiHeader/tei:fileDesc/tei:titleStmt/tei:title", namespaces=NS)
-    return collapse_whitespace(title) if title else None
-
-
-def gather_paragraphs(body: ET.Element) -> list[str]:
-    paragraphs: list[str] = []
-    for paragraph in body.findall(".//tei:p", namespaces=NS):
-        text = collapse_whitespace(" ".join(part for part in paragraph.itertext()))
-        if text:
-            paragraphs.append(text)
-    if not paragraphs:
-        lines: list[str] = []
-        for line in body.findall(".//tei:l", namespaces=NS):
-            text = collapse_whitespace(" ".join(part for part in line.itertext()))
-            if text:
-                lines.append(text)
-        if lines:
-            paragraphs.append("\n".join(lines))
-    if not paragraphs:
-        text = collapse_whitespace(" ".join(part for part in body.itertext()))
-        if text:
-            paragraphs.append(text)
-    return paragraphs
-
-
-def extract_body_text(xml_path: pathlib.Path) -> tuple[str | None, str]:
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    body = root.find(".//tei:text/tei:body", namespaces=NS)
-    if body is None:
-        body = root.find(".//tei:body", namespaces=NS)
-    if body is None:
-        raise ValueError("TEI body element not found")
-    paragraphs = gather_paragraphs(body)
-    if not paragraphs:
-        raise ValueError("No textual content found in TEI body")
-    title = extract_title(root)
+def extract_body_text(xml_path: pathlib.Path, cache: ParseCache | None = None) -> tuple[str | None, str]:
+    title, content = extract_body(xml_path, cache)
     if title:
-        content = title + "\n\n" + "\n\n".join(paragraphs)
-    else:
-        content = "\n\n".join(paragraphs)
+        content = title + "\n\n" + content
     return title, content
 
 
@@ -246,7 +371,7 @@ def build_document_payload(
 
 
 def post_document(
-    session: GcloudSession,
+    engine: UploadEngine,
     *,
     parent_path: str,
     document_id: str,
@@ -254,12 +379,12 @@ def post_document(
 ) -> None:
     documents_url = f"{BASE_URL}/{parent_path}/documents"
     create_url = f"{documents_url}?documentId={quote(document_id, safe='')}"
-    response = session.post(create_url, json=payload)
+    response = engine.request("POST", create_url, json=payload)
     if response.status_code == 409:
         document_name = f"{documents_url}/{quote(document_id, safe='')}"
         update_mask = "content.mimeType,content.rawText,structData"
         update_url = f"{document_name}?updateMask={quote(update_mask, safe=',.')}"
-        update_response = session.patch(update_url, json=payload)
+        update_response = engine.request("PATCH", update_url, json=payload)
         if update_response.status_code >= 300:
             raise RuntimeError(
                 f"Update failed ({update_response.status_code}): {update_response.text.strip()}"
@@ -270,39 +395,37 @@ def post_document(
 
 def upload_documents(
     *,
-    session: GcloudSession,
+    engine: UploadEngine,
     output_dir: pathlib.Path,
     documents: list[DownloadResult],
     parent_path: str,
     content_type: str,
+    cache: ParseCache | None = None,
 ) -> tuple[int, list[str]]:
-    successes = 0
     failures: list[str] = []
-    for item in documents:
-        file_path = item.path
-        if file_path.suffix.lower() != ".xml":
-            continue  # Skip non-XML files by default
-        try:
-            title, content = extract_body_text(file_path)
-        except Exception as exc:  # noqa: BLE001 - capture parsing errors for reporting
-            failures.append(f"{file_path}: {exc}")
-            continue
+
+    def upload(item: DownloadResult) -> None:
+        title, content = extract_body_text(item.path, cache)
         payload = build_document_payload(
-            file_path=file_path,
+            file_path=item.path,
             root=output_dir,
             title=title,
             content=content,
             source_url=item.url,
             content_type=content_type,
         )
-        document_id = sanitize_document_id(file_path, output_dir)
-        try:
-            post_document(session, parent_path=parent_path, document_id=document_id, payload=payload)
-        except Exception as exc:  # noqa: BLE001 - report API failures without aborting
-            failures.append(f"{file_path}: {exc}")
+        document_id = sanitize_document_id(item.path, output_dir)
+        post_document(engine, parent_path=parent_path, document_id=document_id, payload=payload)
+
+    def report(item: DownloadResult, error: BaseException | None) -> None:
+        if error is not None:
+            failures.append(f"{item.path}: {error}")
         else:
-            successes += 1
-            print(f"uploaded {file_path} as {document_id}")
+            print(f"uploaded {item.path} as {sanitize_document_id(item.path, output_dir)}")
+
+    # Skip non-XML files by default
+    xml_documents = [item for item in documents if item.path.suffix.lower() == ".xml"]
+    successes, _ = engine.run(xml_documents, upload, on_result=report)
     return successes, failures
 
 
@@ -310,11 +433,42 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("url_file", type=pathlib.Path, help="Text file containing one URL per line")
     parser.add_argument("output_dir", type=pathlib.Path, help="Directory to save downloaded files")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Number of concurrent downloads (default: {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--per-host",
+        type=int,
+        default=DEFAULT_PER_HOST,
+        help=f"Maximum concurrent connections per host (default: {DEFAULT_PER_HOST})",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=f"Retries per URL on network errors and 429/5xx responses (default: {DEFAULT_RETRIES})",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help=f"Socket timeout in seconds (default: {DEFAULT_TIMEOUT:g})",
+    )
+    parser.add_argument(
+        "--state-file",
+        type=pathlib.Path,
+        help=f"ETag/Last-Modified state file (default: <output_dir>/{STATE_FILENAME})",
+    )
     parser.add_argument(
         "--upload",
         action="store_true",
         help="Upload downloaded XML content to Vertex AI Search",
     )
+    add_engine_arguments(parser, prefix="upload-")
+    add_cache_arguments(parser, default_dir=f"<output_dir>/{CACHE_DIRNAME}")
     parser.add_argument("--project", help="Google Cloud project ID (required with --upload)")
     parser.add_argument("--data-store", help="Vertex AI Search data store ID (required with --upload)")
     parser.add_argument("--location", default="global", help="Vertex AI Search location (default: global)")
@@ -359,7 +513,15 @@ def main(argv: list[str] | None = None) -> int:
 
     args.output_dir.mkdir(parents=True, exist_ok=True)
 
-    downloads, download_failures = download_all(args.url_file, args.output_dir)
+    downloads, download_failures = download_all(
+        args.url_file,
+        args.output_dir,
+        workers=args.workers,
+        per_host=args.per_host,
+        retries=args.retries,
+        timeout=args.timeout,
+        state_file=args.state_file,
+    )
 
     exit_code = 0
     if download_failures:
@@ -370,21 +532,24 @@ def main(argv: list[str] | None = None) -> int:
 
     if args.upload and downloads:
         try:
-            session = build_gcloud_session(args.access_token_command)
+            fetch_access_token(args.access_token_command)
         except RuntimeError as exc:
             print(f"Failed to obtain access token: {exc}", file=sys.stderr)
             return 1
+        engine = build_engine(args, lambda: fetch_access_token(args.access_token_command), prefix="upload-")
         parent_path = (
             f"projects/{args.project}/locations/{args.location}/collections/{args.collection}/"
             f"dataStores/{args.data_store}/branches/{args.branch}"
         )
-        successes, failures = upload_documents(
-            session=session,
-            output_dir=args.output_dir,
-            documents=downloads,
-            parent_path=parent_path,
-            content_type=args.content_type,
-        )
+        with engine:
+            successes, failures = upload_documents(
+                engine=engine,
+                output_dir=args.output_dir,
+                documents=downloads,
+                parent_path=parent_path,
+                content_type=args.content_type,
+                cache=cache_from_args(args, args.output_dir / CACHE_DIRNAME),
+            )
         if failures:
             print("\nSome uploads failed:", file=sys.stderr)
             for item in failures:
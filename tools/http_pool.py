@@ -0,0 +1,48 @@
+"""Keep-alive HTTP(S) connection pool shared by the download and upload tools."""
+
+from __future__ import annotations
+
+import contextlib
+import http.client
+import threading
+import typing as t
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections with at most ``per_host`` requests in flight per host."""
+
+    def __init__(self, per_host: int, timeout: float) -> None:
+        self.per_host = per_host
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle: dict[tuple[str, str], list[http.client.HTTPConnection]] = {}
+        self._limits: dict[tuple[str, str], threading.BoundedSemaphore] = {}
+
+    @contextlib.contextmanager
+    def connection(self, scheme: str, netloc: str) -> t.Iterator[http.client.HTTPConnection]:
+        if scheme not in ("http", "https"):
+            raise ValueError(f"unsupported URL scheme: {scheme!r}")
+        key = (scheme, netloc)
+        with self._lock:
+            limit = self._limits.setdefault(key, threading.BoundedSemaphore(self.per_host))
+        with limit:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                conn = idle.pop() if idle else None
+            if conn is None:
+                factory = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+                conn = factory(netloc, timeout=self.timeout)
+            try:
+                yield conn
+            except BaseException:
+                conn.close()
+                raise
+            with self._lock:
+                self._idle[key].append(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+            self._idle.clear()
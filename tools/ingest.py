@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""Download, extract, chunk and upload TEI XML files to Vertex AI Search in one streaming run.
+
+The stages run concurrently with bounded queues between them, so uploads start as soon as the
+first files are downloaded and memory stays bounded whatever the size of the URL list:
+
+    download (threads) -> extract + chunk (process pool) -> upload (upload engine)
+
+Downloads reuse download_files.py (conditional and resumable, with the same state file) and
+segments get the same ids and payloads as upload_xml_documents.py, so the tools can be mixed.
+Use upload_xml_documents.py for --sync and --bulk on an already downloaded corpus.
+"""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import os
+import pathlib
+import sys
+import typing as t
+from concurrent.futures import ProcessPoolExecutor
+
+from download_files import (
+    DEFAULT_PER_HOST,
+    DEFAULT_RETRIES,
+    DEFAULT_TIMEOUT,
+    STATE_FILENAME,
+    DownloadState,
+    Downloader,
+    iter_urls,
+    pick_filename,
+    unique_name,
+)
+from http_pool import ConnectionPool
+from parse_cache import CACHE_DIRNAME, add_cache_arguments, cache_from_args
+from pipeline import DEFAULT_QUEUE_SIZE, Pipeline, Stage
+from tei_chunker import DEFAULT_MAX_CHARS, DEFAULT_MIN_CHARS, DEFAULT_OVERLAP, chunk_tei_file
+from upload_engine import UploadEngine, add_engine_arguments, build_engine
+from upload_xml_documents import (
+    BASE_URL,
+    build_json_payload,
+    fetch_access_token,
+    format_segment_document_id,
+    sanitize_document_id,
+    upsert_document,
+)
+
+DEFAULT_DOWNLOAD_WORKERS = 8
+
+
+class DownloadedFile(t.NamedTuple):
+    url: str
+    path: pathlib.Path
+
+
+class SegmentUpload(t.NamedTuple):
+    document_id: str
+    payload: dict[str, str]
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url_file", type=pathlib.Path, help="Text file containing one XML URL per line")
+    parser.add_argument("download_dir", type=pathlib.Path, help="Directory to save downloaded files")
+    parser.add_argument("--project", default="hiraoyogizzard", help="Google Cloud project ID (default: hiraoyogizzard)")
+    parser.add_argument("--location", default="global", help="Vertex AI Search location (default: global)")
+    parser.add_argument(
+        "--collection",
+        default="default_collection",
+        help="Vertex AI Search collection ID (default: default_collection)",
+    )
+    parser.add_argument("--data-store", default="mystore", help="Vertex AI Search data store ID (default: mystore)")
+    parser.add_argument("--branch", default="0", help="Vertex AI Search branch ID (default: 0)")
+    parser.add_argument(
+        "--access-token-command",
+        default="gcloud auth print-access-token",
+        help="Command executed to obtain an access token (default: 'gcloud auth print-access-token')",
+    )
+    parser.add_argument(
+        "--api-endpoint",
+        default=BASE_URL,
+        help=f"Discovery Engine API base URL, e.g. a local stand-in server (default: {BASE_URL})",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Download and chunk the files and print the segment ids without calling the API",
+    )
+    parser.add_argument(
+        "--download-workers",
+        type=int,
+        default=DEFAULT_DOWNLOAD_WORKERS,
+        help=f"Concurrent downloads (default: {DEFAULT_DOWNLOAD_WORKERS})",
+    )
+    parser.add_argument(
+        "--per-host",
+        type=int,
+        default=DEFAULT_PER_HOST,
+        help=f"Maximum concurrent download connections per host (default: {DEFAULT_PER_HOST})",
+    )
+    parser.add_argument(
+        "--download-retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=f"Retries per URL on network errors and 429/5xx responses (default: {DEFAULT_RETRIES})",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help=f"Download socket timeout in seconds (default: {DEFAULT_TIMEOUT:g})",
+    )
+    parser.add_argument(
+        "--state-file",
+        type=pathlib.Path,
+        help=f"ETag/Last-Modified state file (default: <download_dir>/{STATE_FILENAME})",
+    )
+    parser.add_argument(
+        "--extract-workers",
+        type=int,
+        help="Processes used to parse and chunk the XML files (default: one per CPU core)",
+    )
+    parser.add_argument(
+        "--segment-min-chars",
+        type=int,
+        default=DEFAULT_MIN_CHARS,
+        help=f"Minimum segment size before a div boundary closes it (default: {DEFAULT_MIN_CHARS})",
+    )
+    parser.add_argument(
+        "--segment-max-chars",
+        type=int,
+        default=DEFAULT_MAX_CHARS,
+        help=f"Maximum characters per segment (default: {DEFAULT_MAX_CHARS})",
+    )
+    parser.add_argument(
+        "--segment-overlap",
+        type=int,
+        default=DEFAULT_OVERLAP,
+        help=f"Characters repeated at the start of the next segment (default: {DEFAULT_OVERLAP})",
+    )
+    add_cache_arguments(parser, default_dir=f"<download_dir>/{CACHE_DIRNAME}")
+    add_engine_arguments(parser, prefix="upload-")
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help=f"Items buffered in front of each stage (default: {DEFAULT_QUEUE_SIZE})",
+    )
+    args = parser.parse_args(argv)
+    if not 0 < args.segment_min_chars <= args.segment_max_chars:
+        parser.error("--segment-min-chars must be positive and at most --segment-max-chars")
+    if not 0 <= args.segment_overlap < args.segment_max_chars // 2:
+        parser.error("--segment-overlap must be less than half of --segment-max-chars")
+    return args
+
+
+def iter_targets(url_file: pathlib.Path, download_dir: pathlib.Path, state: DownloadState) -> t.Iterator[DownloadedFile]:
+    """Yield each URL once with its file name, reusing the one recorded on earlier runs."""
+    taken = {entry["path"] for entry in state.entries.values() if entry.get("path")}
+    seen: set[str] = set()
+    for url in iter_urls(url_file):
+        if url in seen:
+            continue
+        seen.add(url)
+        name = state.entries.get(url, {}).get("path")
+        if not name:
+            name = unique_name(pick_filename(url), taken)
+            taken.add(name)
+        yield DownloadedFile(url, download_dir / name)
+
+
+def report_error(stage: str) -> t.Callable[[t.Any, BaseException], None]:
+    def on_error(item: t.Any, error: BaseException) -> None:
+        label = item.url if isinstance(item, DownloadedFile) else item.document_id
+        print(f"[error] {stage} {label}: {error}", file=sys.stderr)
+    return on_error
+
+
+def run(args: argparse.Namespace, engine: UploadEngine | None) -> int:
+    download_dir: pathlib.Path = args.download_dir
+    state = DownloadState(args.state_file or download_dir / STATE_FILENAME)
+    pool = ConnectionPool(per_host=args.per_host, timeout=args.timeout)
+    downloader = Downloader(state, pool, retries=args.download_retries)
+    extract_workers = args.extract_workers or os.cpu_count() or 1
+    chunk_file = functools.partial(
+        chunk_tei_file,
+        min_chars=args.segment_min_chars,
+        max_chars=args.segment_max_chars,
+        overlap=args.segment_overlap,
+        cache=cache_from_args(args, download_dir / CACHE_DIRNAME),
+    )
+    parent_path = (
+        f"projects/{args.project}/locations/{args.location}/collections/{args.collection}/"
+        f"dataStores/{args.data_store}/branches/{args.branch}"
+    )
+    executor = ProcessPoolExecutor(max_workers=extract_workers) if extract_workers > 1 else None
+
+    def download(item: DownloadedFile) -> t.Iterator[DownloadedFile]:
+        status = downloader.fetch(item.url, item.path)
+        if status != "unchanged":
+            print(f"{'resumed' if status == 'resumed' else 'saved'} {item.url} -> {item.path}")
+        if item.path.suffix.lower() == ".xml":
+            yield item
+
+    def extract(item: DownloadedFile) -> t.Iterator[SegmentUpload]:
+        if executor is None:
+            title, chunks = chunk_file(item.path)
+        else:
+            title, chunks = executor.submit(chunk_file, item.path).result()
+        base_id = sanitize_document_id(item.path, download_dir)
+        for index, chunk in enumerate(chunks, start=1):
+            yield SegmentUpload(
+                format_segment_document_id(base_id, index),
+                build_json_payload(chunk=chunk, url=item.url, title=title),
+            )
+
+    def upload(item: SegmentUpload) -> tuple[()]:
+        if engine is None:
+            print(f"[dry-run] {item.document_id}")
+        else:
+            upsert_document(
+                engine,
+                parent_path=parent_path,
+                document_id=item.document_id,
+                payload=item.payload,
+                api_base=args.api_endpoint,
+            )
+        return ()
+
+    stages = [
+        Stage("download", download, workers=args.download_workers, queue_size=args.queue_size,
+              on_error=report_error("download")),
+        # Extract threads only wait on the process pool; one per process keeps it busy
+        Stage("extract", extract, workers=extract_workers, queue_size=args.queue_size,
+              on_error=report_error("extract")),
+        Stage("upload", upload, workers=engine.workers if engine is not None else 1,
+              queue_size=args.queue_size, on_error=report_error("upload")),
+    ]
+    pipeline = Pipeline(stages)
+    try:
+        pipeline.run(iter_targets(args.url_file, download_dir, state))
+    finally:
+        pool.close()
+        state.save()
+        if executor is not None:
+            executor.shutdown()
+
+    failures = pipeline.failures()
+    uploaded = stages[-1].stats.done - stages[-1].stats.failed
+    if failures:
+        print(f"Completed with {uploaded} segments uploaded and {failures} failures.", file=sys.stderr)
+        return 1
+    if engine is None:
+        print(f"Dry run complete: {uploaded} segments.")
+    else:
+        print(f"All {uploaded} segments uploaded successfully.")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    if not args.url_file.exists():
+        print(f"URL list file not found: {args.url_file}", file=sys.stderr)
+        return 1
+    args.download_dir.mkdir(parents=True, exist_ok=True)
+
+    if args.dry_run:
+        return run(args, None)
+    engine = build_engine(args, lambda: fetch_access_token(args.access_token_command), prefix="upload-")
+    try:
+        engine.tokens.get()
+    except RuntimeError as exc:
+        print(f"Failed to obtain access token: {exc}", file=sys.stderr)
+        return 1
+    with engine:
+        return run(args, engine)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+"""Near-duplicate detection for segments with MinHash signatures and LSH banding.
+
+Texts are normalized (whitespace and punctuation removed) and split into overlapping character
+shingles. Signatures use one-permutation MinHash: every shingle is hashed once and the minimum is
+kept per bin, with empty bins filled from the next non-empty one, so the cost is linear in the
+text length instead of in ``num_perm`` times the text length. Signatures are split into bands;
+texts sharing a band are candidates, and a candidate is a duplicate when the estimated Jaccard
+similarity of the two shingle sets reaches the threshold.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import operator
+import pathlib
+import re
+import typing as t
+from array import array
+from collections import Counter
+from hashlib import blake2b
+
+DUPLICATE_MAP_FILENAME = "near-duplicates.json"
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 5
+# Texts kept per LSH bucket and candidates verified per lookup; a large group of similar but
+# distinct texts would otherwise make lookups quadratic
+MAX_CANDIDATES = 64
+
+_NOISE = re.compile(r"[\W_]+")
+_MAX_HASH = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+def shingles(text: str, size: int) -> set[str]:
+    normalized = _NOISE.sub("", text)
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def minhash(items: t.Iterable[str], num_perm: int) -> array:
+    """One-permutation MinHash signature (``num_perm`` unsigned 64-bit values) of a set of strings."""
+    values = [int.from_bytes(blake2b(item.encode("utf-8"), digest_size=8).digest(), "little") for item in items]
+    # Later assignments win, so going through the values in descending order keeps each bin's minimum
+    minima = {value % num_perm: value for value in sorted(values, reverse=True)}
+    bins = [minima.get(index, _MAX_HASH) for index in range(num_perm)]
+    if _MAX_HASH in bins and any(value != _MAX_HASH for value in bins):
+        # Densify: an empty bin borrows the value of the next filled bin, tagged with the distance
+        # so that two sets only agree on a borrowed bin when they agree on the bin it came from
+        original = bins[:]
+        for index, value in enumerate(original):
+            if value != _MAX_HASH:
+                continue
+            distance = 1
+            while original[(index + distance) % num_perm] == _MAX_HASH:
+                distance += 1
+            bins[index] = (original[(index + distance) % num_perm] + distance * _GOLDEN) & _MAX_HASH
+    return array("Q", bins)
+
+
+def _integral(func: t.Callable[[float], float], start: float, stop: float, steps: int = 100) -> float:
+    width = (stop - start) / steps
+    return sum(func(start + (step + 0.5) * width) for step in range(steps)) * width
+
+
+def lsh_parameters(threshold: float, num_perm: int) -> tuple[int, int]:
+    """
+    (bands, rows) with bands * rows <= num_perm minimizing the probability mass of false
+    positives below ``threshold`` plus false negatives above it.
+    """
+    best: tuple[float, int, int] | None = None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            def candidate(similarity: float) -> float:
+                return 1 - (1 - similarity**rows) ** bands
+            error = _integral(candidate, 0.0, threshold) + _integral(lambda s: 1 - candidate(s), threshold, 1.0)
+            if best is None or error < best[0]:
+                best = (error, bands, rows)
+    assert best is not None
+    return best[1], best[2]
+
+
+class NearDuplicateIndex:
+    """Keeps one canonical representative per group of near-identical texts, in insertion order."""
+
+    def __init__(
+        self,
+        *,
+        threshold: float = DEFAULT_THRESHOLD,
+        num_perm: int = DEFAULT_NUM_PERM,
+        shingle_size: int = DEFAULT_SHINGLE_SIZE,
+        max_candidates: int = MAX_CANDIDATES,
+    ) -> None:
+        if not 0 < threshold <= 1:
+            raise ValueError("Similarity threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.max_candidates = max_candidates
+        self.bands, self.rows = lsh_parameters(threshold, num_perm)
+        self._buckets: list[dict[bytes, list[str]]] = [{} for _ in range(self.bands)]
+        self._signatures: dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def similarity(self, left: array, right: array) -> float:
+        return sum(map(operator.eq, left, right)) / self.num_perm
+
+    def add(self, key: str, text: str) -> str | None:
+        """
+        Return the key of the canonical text ``text`` duplicates, or None after registering it as
+        a new canonical text. Only canonical texts are indexed, so groups do not chain.
+        Texts without shingles (empty or punctuation only) have nothing to compare and are
+        always kept, without being indexed.
+        """
+        items = shingles(text, self.shingle_size)
+        if not items:
+            return None
+        signature = minhash(items, self.num_perm)
+        band_keys = [
+            signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)
+        ]
+        # Candidates sharing the most bands are the most similar ones; verify those first
+        shared: Counter[str] = Counter()
+        for buckets, band_key in zip(self._buckets, band_keys):
+            shared.update(buckets.get(band_key, ()))
+        best: tuple[float, str] | None = None
+        for candidate, _ in shared.most_common(self.max_candidates):
+            score = self.similarity(signature, self._signatures[candidate])
+            if score >= self.threshold and (best is None or score > best[0]):
+                best = (score, candidate)
+        if best is not None:
+            return best[1]
+        self._signatures[key] = signature
+        for buckets, band_key in zip(self._buckets, band_keys):
+            bucket = buckets.setdefault(band_key, [])
+            if len(bucket) < self.max_candidates:
+                bucket.append(key)
+        return None
+
+
+def add_dedupe_arguments(parser: argparse.ArgumentParser, *, default_map: str) -> None:
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Skip segments that are near-duplicates of an earlier segment (MinHash over character shingles)",
+    )
+    parser.add_argument(
+        "--dedupe-threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Estimated Jaccard similarity at which a segment counts as a duplicate (default: {DEFAULT_THRESHOLD:g})",
+    )
+    parser.add_argument(
+        "--shingle-size",
+        type=int,
+        default=DEFAULT_SHINGLE_SIZE,
+        help=f"Characters per shingle for --dedupe (default: {DEFAULT_SHINGLE_SIZE})",
+    )
+    parser.add_argument(
+        "--dedupe-map",
+        type=pathlib.Path,
+        help=f"JSON file mapping each skipped duplicate id to its canonical segment id (default: {default_map})",
+    )
+
+
+def write_duplicate_map(path: pathlib.Path, duplicates: t.Mapping[str, str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(duplicates, ensure_ascii=False, indent=1, sort_keys=True), encoding="utf-8")
+    tmp_path.replace(path)
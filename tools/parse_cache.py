@@ -0,0 +1,101 @@
+"""On-disk cache of parsed TEI files, keyed by the SHA-256 of the file and the parser versions.
+
+Entries are zlib-compressed JSON. One holds every block ``iter_tei_blocks`` yields for a file
+(title, paragraphs and verse lines with their offsets and div/lg numbers), so unchanged files are
+only hashed and never parsed again; others hold the title and segments produced from those blocks
+for one ``CHUNKER_VERSION`` and set of segment sizes, so repeated runs skip chunking too. Entries
+live under ``<cache dir>/v<EXTRACTOR_VERSION>/``; older versions can simply be deleted.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import typing as t
+import zlib
+
+from tei_chunker import CHUNKER_VERSION, Chunk, chunk_tei_blocks
+from tei_extract import EXTRACTOR_VERSION, TeiBlock, iter_tei_blocks
+
+CACHE_DIRNAME = ".parse-cache"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        while chunk := fh.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """Picklable (it only holds a path), so it can be passed to process pool workers."""
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory / f"v{EXTRACTOR_VERSION}"
+
+    def _load(self, name: str) -> t.Any:
+        try:
+            return json.loads(zlib.decompress((self.directory / name[:2] / f"{name}.json.z").read_bytes()))
+        except (OSError, ValueError, zlib.error):
+            return None  # Missing or unreadable entry
+
+    def _store(self, name: str, value: t.Any) -> None:
+        entry = self.directory / name[:2] / f"{name}.json.z"
+        data = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # Several workers may store the same entry; each writes its own file and renames it
+        tmp_path = entry.with_name(f"{entry.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(entry)
+
+    def _blocks(self, xml_path: pathlib.Path, digest: str) -> list[TeiBlock]:
+        rows = self._load(digest)
+        if rows is not None:
+            return [TeiBlock(*row) for row in rows]
+        blocks = list(iter_tei_blocks(xml_path))
+        self._store(digest, [[block.kind, block.text, block.start, block.end, block.div, block.lg] for block in blocks])
+        return blocks
+
+    def blocks(self, xml_path: pathlib.Path) -> list[TeiBlock]:
+        """Return the blocks of ``xml_path`` from the cache, parsing and storing them on a miss."""
+        return self._blocks(xml_path, file_digest(xml_path))
+
+    def chunks(
+        self, xml_path: pathlib.Path, *, min_chars: int, max_chars: int, overlap: int
+    ) -> tuple[str | None, list[Chunk]]:
+        """Return (title, chunks) of ``xml_path`` for these segment sizes, chunking the cached blocks on a miss."""
+        digest = file_digest(xml_path)
+        name = f"{digest}-chunks-v{CHUNKER_VERSION}-{min_chars}-{max_chars}-{overlap}"
+        cached = self._load(name)
+        if cached is not None:
+            return cached["title"], [Chunk(*row) for row in cached["chunks"]]
+        title, chunks = chunk_tei_blocks(
+            self._blocks(xml_path, digest), min_chars=min_chars, max_chars=max_chars, overlap=overlap
+        )
+        self._store(name, {"title": title, "chunks": [[chunk.text, chunk.start, chunk.end] for chunk in chunks]})
+        return title, chunks
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser, *, default_dir: str) -> None:
+    parser.add_argument(
+        "--parse-cache",
+        type=pathlib.Path,
+        help=f"Directory for cached parses of the XML files (default: {default_dir})",
+    )
+    parser.add_argument(
+        "--no-parse-cache",
+        action="store_true",
+        help="Parse every XML file again instead of reusing cached parses",
+    )
+
+
+def cache_from_args(args: argparse.Namespace, default_dir: pathlib.Path) -> ParseCache | None:
+    if args.no_parse_cache:
+        return None
+    return ParseCache(args.parse_cache or default_dir)
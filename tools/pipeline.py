@@ -0,0 +1,144 @@
+"""Threaded stage pipeline with bounded queues between the stages.
+
+Each stage has its own worker threads and an input queue of limited size: when a stage falls
+behind, the stages feeding it block on ``put`` instead of piling up work in memory. Every stage
+counts the items it handled, failed and emitted and the time its workers spent busy, and a
+reporter thread prints those counters periodically.
+"""
+
+from __future__ import annotations
+
+import queue
+import sys
+import threading
+import time
+import typing as t
+from dataclasses import dataclass
+
+DEFAULT_QUEUE_SIZE = 64
+REPORT_INTERVAL = 5.0
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    done: int = 0
+    failed: int = 0
+    emitted: int = 0
+    busy: float = 0.0
+
+
+class Stage:
+    """
+    ``func`` turns one input item into any number of output items, which are passed to the next
+    stage. ``on_error`` is called on the worker thread when ``func`` raises.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: t.Callable[[t.Any], t.Iterable[t.Any]],
+        *,
+        workers: int,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        on_error: t.Callable[[t.Any, BaseException], None] | None = None,
+    ) -> None:
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue: queue.Queue[t.Any] = queue.Queue(maxsize=queue_size)
+        self.on_error = on_error
+        self.stats = StageStats()
+        self.next: Stage | None = None
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, item: t.Any) -> None:
+        self.queue.put(item)
+
+    def close(self) -> None:
+        """Wait for the queued items to be handled, then close the next stage."""
+        for _ in self._threads:
+            self.queue.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+        if self.next is not None:
+            self.next.close()
+
+    def _work(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            started = time.monotonic()
+            emitted = 0
+            failed = False
+            try:
+                for output in self.func(item):
+                    emitted += 1
+                    if self.next is not None:
+                        self.next.put(output)
+            except Exception as exc:  # noqa: BLE001 - one bad item must not stop the stage
+                failed = True
+                if self.on_error is not None:
+                    self.on_error(item, exc)
+            with self._lock:
+                self.stats.done += 1
+                self.stats.failed += int(failed)
+                self.stats.emitted += emitted
+                self.stats.busy += time.monotonic() - started
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage], *, report_interval: float = REPORT_INTERVAL) -> None:
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        for stage, following in zip(stages, stages[1:]):
+            stage.next = following
+        self.stages = stages
+        self.report_interval = report_interval
+        self._started = 0.0
+        self._finished = threading.Event()
+
+    def run(self, items: t.Iterable[t.Any]) -> None:
+        """Feed ``items`` to the first stage and return once every stage has drained."""
+        self._started = time.monotonic()
+        for stage in self.stages:
+            stage.start()
+        reporter = threading.Thread(target=self._report_periodically, name="pipeline-report", daemon=True)
+        reporter.start()
+        try:
+            for item in items:
+                self.stages[0].put(item)
+            self.stages[0].close()
+        finally:
+            self._finished.set()
+            reporter.join()
+        self.report()
+
+    def _report_periodically(self) -> None:
+        while not self._finished.wait(self.report_interval):
+            self.report()
+
+    def report(self) -> None:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        parts = []
+        for stage in self.stages:
+            stats = stage.stats
+            utilization = stats.busy / elapsed / stage.workers
+            parts.append(
+                f"{stage.name} {stats.done} in, {stats.emitted} out, {stats.failed} failed, "
+                f"{stats.done / elapsed:.1f}/s, busy {utilization:.0%}, "
+                f"queue {stage.queue.qsize()}/{stage.queue.maxsize}"
+            )
+        print(f"[pipeline] {' | '.join(parts)}", file=sys.stderr)
+
+    def failures(self) -> int:
+        return sum(stage.stats.failed for stage in self.stages)
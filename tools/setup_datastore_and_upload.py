@@ -11,9 +11,11 @@ import pathlib
 import re
 import subprocess
 import sys
-from typing import Iterable, Sequence
-from urllib.parse import quote, urlencode
-import urllib.request
+from typing import Callable, Iterable, Sequence
+from urllib.parse import quote
+
+from upload_engine import UploadEngine, add_engine_arguments, build_engine
+from upload_manifest import MANIFEST_FILENAME, add_sync_arguments, run_sync
 
 SCOPES: Sequence[str] = ("https://www.googleapis.com/auth/cloud-platform",)
 BASE_URL = "https://discoveryengine.googleapis.com/v1"
@@ -81,58 +83,46 @@ def build_document_payload(
 
 
 def post_document(
-    token: str,
+    engine: UploadEngine,
     parent_path: str,
     document_id: str,
     payload: dict[str, object],
 ) -> None:
     documents_url = f"{BASE_URL}/{parent_path}/documents"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        f"{documents_url}?documentId={quote(document_id, safe='')}",
-        data=data,
-        headers=headers,
-    )
-    try:
-        with urllib.request.urlopen(req) as response:
-            if response.status >= 300:
-                raise RuntimeError(
-                    f"Create failed ({response.status}): {response.read().decode('utf-8')}"
-                )
-    except urllib.error.HTTPError as e:
-        if e.code == 409:
-            # Document already exists: update it.
-            document_name = f"{documents_url}/{quote(document_id, safe='')}"
-            params = {"updateMask": "jsonData,structData"}
-            url = f"{document_name}?{urlencode(params)}"
-            req = urllib.request.Request(
-                url,
-                data=data,
-                headers=headers,
-                method="PATCH",
-            )
-            try:
-                with urllib.request.urlopen(req) as response:
-                    if response.status >= 300:
-                        raise RuntimeError(
-                            f"Update failed ({response.status}): {response.read().decode('utf-8')}"
-                        )
-            except urllib.error.HTTPError as e2:
-                raise RuntimeError(
-                    f"Update failed ({e2.code}): {e2.read().decode('utf-8')}"
-                ) from e2
-        else:
-            raise RuntimeError(
-                f"Create failed ({e.code}): {e.read().decode('utf-8')}"
-            ) from e
+    response = engine.request("POST", f"{documents_url}?documentId={quote(document_id, safe='')}", json=payload)
+    if response.status_code == 409:
+        # Document already exists: update it.
+        document_name = f"{documents_url}/{quote(document_id, safe='')}"
+        params = {"updateMask": "jsonData,structData"}
+        response = engine.request("PATCH", document_name, params=params, json=payload)
+        if response.status_code >= 300:
+            raise RuntimeError(f"Update failed ({response.status_code}): {response.text}")
+    elif response.status_code >= 300:
+        raise RuntimeError(f"Create failed ({response.status_code}): {response.text}")
+
+
+def upsert_document(
+    engine: UploadEngine,
+    parent_path: str,
+    document_id: str,
+    payload: dict[str, object],
+) -> None:
+    """Create or replace a document in a single PATCH request (allowMissing=true)."""
+    document_name = f"{BASE_URL}/{parent_path}/documents/{quote(document_id, safe='')}"
+    response = engine.request("PATCH", document_name, params={"allowMissing": "true"}, json=payload)
+    if response.status_code >= 300:
+        raise RuntimeError(f"Upsert failed ({response.status_code}): {response.text}")
+
+
+def delete_document(engine: UploadEngine, parent_path: str, document_id: str) -> None:
+    document_name = f"{BASE_URL}/{parent_path}/documents/{quote(document_id, safe='')}"
+    response = engine.request("DELETE", document_name)
+    if response.status_code >= 300 and response.status_code != 404:  # 404: already gone
+        raise RuntimeError(f"Delete failed ({response.status_code}): {response.text}")
 
 
 def update_schema(
-    token: str,
+    engine: UploadEngine,
     project: str,
     location: str,
     data_store: str,
@@ -148,24 +138,9 @@ def update_schema(
         },
     }
     data_store_name = f"projects/{project}/locations/{location}/dataStores/{data_store}"
-    params = {"updateMask": "schema"}
-    url = f"{BASE_URL}/{data_store_name}?{urlencode(params)}"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
-    data = json.dumps(schema).encode("utf-8")
-    req = urllib.request.Request(url, data=data, headers=headers, method="PATCH")
-    try:
-        with urllib.request.urlopen(req) as response:
-            if response.status >= 300:
-                raise RuntimeError(
-                    f"Schema update failed ({response.status}): {response.read().decode('utf-8')}"
-                )
-    except urllib.error.HTTPError as e:
-        raise RuntimeError(
-            f"Schema update failed ({e.code}): {e.read().decode('utf-8')}"
-        ) from e
+    response = engine.request("PATCH", f"{BASE_URL}/{data_store_name}", params={"updateMask": "schema"}, json=schema)
+    if response.status_code >= 300:
+        raise RuntimeError(f"Schema update failed ({response.status_code}): {response.text}")
     print("Schema updated successfully.")
 
 
@@ -197,45 +172,96 @@ def main(argv: list[str] | None = None) -> int:
         action="store_true",
         help="Recursively upload files from subdirectories",
     )
+    add_engine_arguments(parser)
+    add_sync_arguments(parser, default_manifest=f"<directory>/{MANIFEST_FILENAME}")
     args = parser.parse_args(argv)
 
     directory: pathlib.Path = args.directory
     if not directory.exists() or not directory.is_dir():
         parser.error(f"Directory not found: {directory}")
 
-    token = get_gcloud_token()
-
-    update_schema(token, args.project, args.location, args.data_store)
+    plan_only = args.sync and args.plan_only
+    engine = None if plan_only else build_engine(args, get_gcloud_token)
 
     parent_path = (
         f"projects/{args.project}/locations/{args.location}/collections/{args.collection}/"
         f"dataStores/{args.data_store}/branches/{args.branch}"
     )
 
-    successes = 0
-    failures: list[str] = []
+    # Skip tool state such as the upload manifest
+    files = [path for path in iter_files(directory, recursive=args.recursive) if not path.name.startswith(".")]
 
-    for file_path in iter_files(directory, recursive=args.recursive):
-        document_id = sanitize_document_id(file_path, directory)
-        try:
-            content = read_text(file_path, args.encoding, args.errors)
-        except UnicodeDecodeError as exc:
-            failures.append(f"{file_path}: decode error ({exc})")
-            continue
-        payload = build_document_payload(
+    def load(file_path: pathlib.Path) -> dict[str, object]:
+        return build_document_payload(
             file_path=file_path,
             root=directory,
-            content=content,
+            content=read_text(file_path, args.encoding, args.errors),
             content_type=args.content_type,
             source_uri=args.source_uri,
         )
+
+    try:
+        if engine is not None:
+            update_schema(engine, args.project, args.location, args.data_store)
+        if args.sync:
+            return sync_files(args, engine, files, load, parent_path=parent_path, plan_only=plan_only)
+        return upload_files(engine, files, load, directory=directory, parent_path=parent_path)
+    finally:
+        if engine is not None:
+            engine.close()
+
+
+def sync_files(
+    args: argparse.Namespace,
+    engine: UploadEngine | None,
+    files: list[pathlib.Path],
+    load: Callable[[pathlib.Path], dict[str, object]],
+    *,
+    parent_path: str,
+    plan_only: bool,
+) -> int:
+    failures = 0
+    payloads: dict[str, dict[str, object]] = {}
+    for file_path in files:
         try:
-            post_document(token, parent_path, document_id, payload)
-        except Exception as exc:  # noqa: BLE001 - report unexpected API errors and continue
-            failures.append(f"{file_path}: {exc}")
+            payloads[sanitize_document_id(file_path, args.directory)] = load(file_path)
+        except UnicodeDecodeError as exc:
+            print(f"[skip] {file_path}: decode error ({exc})", file=sys.stderr)
+            failures += 1
+    return run_sync(
+        manifest_path=args.manifest or args.directory / MANIFEST_FILENAME,
+        parent_path=parent_path,
+        payloads=payloads,
+        read_failures=failures,
+        plan_only=plan_only,
+        upsert=lambda document_id, payload: upsert_document(engine, parent_path, document_id, payload),
+        delete=lambda document_id: delete_document(engine, parent_path, document_id),
+        engine=engine,
+    )
+
+
+def upload_files(
+    engine: UploadEngine,
+    files: list[pathlib.Path],
+    load: Callable[[pathlib.Path], dict[str, object]],
+    *,
+    directory: pathlib.Path,
+    parent_path: str,
+) -> int:
+    failures: list[str] = []
+
+    def upload(file_path: pathlib.Path) -> None:
+        post_document(engine, parent_path, sanitize_document_id(file_path, directory), load(file_path))
+
+    def report(file_path: pathlib.Path, error: BaseException | None) -> None:
+        if isinstance(error, UnicodeDecodeError):
+            failures.append(f"{file_path}: decode error ({error})")
+        elif error is not None:
+            failures.append(f"{file_path}: {error}")
         else:
-            successes += 1
-            print(f"uploaded {file_path} as {document_id}")
+            print(f"uploaded {file_path} as {sanitize_document_id(file_path, directory)}")
+
+    successes, _ = engine.run(files, upload, on_result=report)
 
     if failures:
         print("\nSome uploads failed:", file=sys.stderr)
@@ -247,5 +273,6 @@ def main(argv: list[str] | None = None) -> int:
     print(f"All {successes} files uploaded successfully.")
     return 0
 
+
 if __name__ == "__main__":
     raise SystemExit(main())
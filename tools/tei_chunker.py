@@ -0,0 +1,194 @@
+"""Pack the text blocks of a TEI file into search segments of a target size.
+
+Paragraphs and verse groups (the consecutive ``tei:l`` lines of one ``lg``) are the units: a unit
+is only cut when it alone exceeds the maximum size, and then between sentences or verse lines.
+Units are packed greedily up to ``max_chars``; a segment is closed at a ``div`` boundary once it
+has reached ``min_chars``. Consecutive segments of the same ``div`` can repeat up to
+``overlap`` characters of trailing sentences or lines so that a quote cut at a segment boundary
+is still found whole. Each segment keeps the byte range in the source file it was taken from.
+"""
+
+from __future__ import annotations
+
+import pathlib
+import re
+import typing as t
+from dataclasses import dataclass, replace
+
+from tei_extract import TeiBlock, iter_tei_blocks
+
+if t.TYPE_CHECKING:
+    from parse_cache import ParseCache
+
+# Bump when the chunks built from the same blocks change, so cached segments are not reused
+CHUNKER_VERSION = 1
+DEFAULT_MIN_CHARS = 200
+DEFAULT_MAX_CHARS = 800
+DEFAULT_OVERLAP = 0
+UNIT_SEPARATOR = "\n\n"
+
+# A sentence runs up to and including its closing punctuation and any following whitespace
+_SENTENCE = re.compile(r"[^。．！？!?]*(?:[。．！？!?]+|$)\s*")
+
+
+@dataclass
+class Chunk:
+    text: str
+    # Byte range in the source file covered by the TEI elements the text was taken from
+    start: int
+    end: int
+
+
+@dataclass
+class _Unit:
+    key: int  # Units cut from the same paragraph or verse group share a key
+    pieces: list[str]  # Sentences or verse lines
+    separator: str
+    start: int
+    end: int
+    div: int
+
+    @property
+    def text(self) -> str:
+        return self.separator.join(self.pieces)
+
+
+def _units(blocks: t.Iterable[TeiBlock]) -> t.Iterator[_Unit]:
+    verse: _Unit | None = None
+    verse_lg = 0
+    for key, block in enumerate(blocks):
+        if block.kind == "title":
+            continue
+        if block.kind == "l":
+            # Lines outside an lg are grouped while they follow each other within one div
+            if verse is not None and (block.div, block.lg) == (verse.div, verse_lg):
+                verse.pieces.append(block.text)
+                verse.end = block.end
+                continue
+            if verse is not None:
+                yield verse
+            verse = _Unit(key, [block.text], "\n", block.start, block.end, block.div)
+            verse_lg = block.lg
+            continue
+        if verse is not None:
+            yield verse
+            verse = None
+        sentences = [match for match in _SENTENCE.findall(block.text) if match]
+        yield _Unit(key, sentences or [block.text], "", block.start, block.end, block.div)
+    if verse is not None:
+        yield verse
+
+
+def _split(unit: _Unit, max_chars: int) -> t.Iterator[_Unit]:
+    """Cut a unit longer than ``max_chars`` between pieces, and pieces longer than that anywhere."""
+    if len(unit.text) <= max_chars:
+        yield unit
+        return
+    pieces: list[str] = []
+    for piece in unit.pieces:
+        pieces.extend(piece[i:i + max_chars] for i in range(0, len(piece), max_chars))
+    part: list[str] = []
+    size = 0
+    for piece in pieces:
+        added = len(piece) + (len(unit.separator) if part else 0)
+        if part and size + added > max_chars:
+            yield replace(unit, pieces=part)
+            part, size = [], 0
+            added = len(piece)
+        part.append(piece)
+        size += added
+    if part:
+        yield replace(unit, pieces=part)
+
+
+def _tail(unit: _Unit, overlap: int) -> _Unit | None:
+    """The trailing pieces of ``unit`` that fit in ``overlap`` characters, if any."""
+    pieces: list[str] = []
+    size = 0
+    for piece in reversed(unit.pieces):
+        size += len(piece) + (len(unit.separator) if pieces else 0)
+        if size > overlap:
+            break
+        pieces.insert(0, piece)
+    return replace(unit, pieces=pieces) if pieces else None
+
+
+def _separator(previous: _Unit, unit: _Unit) -> str:
+    return previous.separator if previous.key == unit.key else UNIT_SEPARATOR
+
+
+def _chunk(units: list[_Unit]) -> Chunk:
+    text = units[0].text
+    for previous, unit in zip(units, units[1:]):
+        text += _separator(previous, unit) + unit.text
+    return Chunk(text, min(unit.start for unit in units), max(unit.end for unit in units))
+
+
+def chunk_blocks(
+    blocks: t.Iterable[TeiBlock],
+    *,
+    min_chars: int = DEFAULT_MIN_CHARS,
+    max_chars: int = DEFAULT_MAX_CHARS,
+    overlap: int = DEFAULT_OVERLAP,
+) -> list[Chunk]:
+    """Pack the body blocks (title blocks are ignored) into chunks of at most ``max_chars`` characters."""
+    if not 0 < min_chars <= max_chars:
+        raise ValueError("Segment sizes must satisfy 0 < min_chars <= max_chars")
+    if not 0 <= overlap < max_chars // 2:
+        raise ValueError("Segment overlap must be less than half of max_chars")
+
+    chunks: list[Chunk] = []
+    current: list[_Unit] = []
+    size = 0
+    for unit in _units(blocks):
+        for part in _split(unit, max_chars):
+            length = len(part.text)
+            if current:
+                added = len(_separator(current[-1], part)) + length
+                boundary = part.div != current[-1].div
+                if size + added > max_chars or (boundary and size >= min_chars):
+                    chunks.append(_chunk(current))
+                    seed = None if boundary or not overlap else _tail(current[-1], overlap)
+                    current, size = [], 0
+                    if seed is not None and len(seed.text) + len(_separator(seed, part)) + length <= max_chars:
+                        current, size = [seed], len(seed.text)
+            size += (len(_separator(current[-1], part)) if current else 0) + length
+            current.append(part)
+    if current:
+        chunks.append(_chunk(current))
+    return chunks
+
+
+def chunk_tei_blocks(
+    blocks: t.Iterable[TeiBlock],
+    *,
+    min_chars: int = DEFAULT_MIN_CHARS,
+    max_chars: int = DEFAULT_MAX_CHARS,
+    overlap: int = DEFAULT_OVERLAP,
+) -> tuple[str | None, list[Chunk]]:
+    """Return (title, chunks) of the blocks of one file. Raises ValueError when the body has no text."""
+    title: str | None = None
+    body: list[TeiBlock] = []
+    for block in blocks:
+        if block.kind == "title":
+            title = block.text
+        else:
+            body.append(block)
+    chunks = chunk_blocks(body, min_chars=min_chars, max_chars=max_chars, overlap=overlap)
+    if not chunks:
+        raise ValueError("TEI body contained no textual content")
+    return title, chunks
+
+
+def chunk_tei_file(
+    xml_path: pathlib.Path,
+    *,
+    min_chars: int = DEFAULT_MIN_CHARS,
+    max_chars: int = DEFAULT_MAX_CHARS,
+    overlap: int = DEFAULT_OVERLAP,
+    cache: ParseCache | None = None,
+) -> tuple[str | None, list[Chunk]]:
+    """Return (title, chunks) of a TEI file, from ``cache`` when it has them."""
+    if cache is not None:
+        return cache.chunks(xml_path, min_chars=min_chars, max_chars=max_chars, overlap=overlap)
+    return chunk_tei_blocks(iter_tei_blocks(xml_path), min_chars=min_chars, max_chars=max_chars, overlap=overlap)
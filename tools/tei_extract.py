@@ -0,0 +1,232 @@
+"""Streaming text extraction from TEI XML files.
+
+``iter_tei_blocks`` feeds a file to an expat parser in fixed-size chunks and yields the title,
+paragraphs (``tei:p``) and verse lines (``tei:l``) of the first ``tei:body`` as it reaches them,
+with their byte offsets in the file and the ``div``/``lg`` they belong to. No tree is built, so
+memory stays flat regardless of the file size.
+``extract_files`` fans a per-file function out over a process pool.
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+import re
+import typing as t
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from xml.parsers import expat
+
+if t.TYPE_CHECKING:
+    from parse_cache import ParseCache
+
+# Bump when the blocks yielded for a file change, so cached parses are not reused
+EXTRACTOR_VERSION = 1
+TEI_NAMESPACE = "http://www.tei-c.org/ns/1.0"
+# expat reports namespaced names as "<namespace>}<local name>"
+_TEI = f"{TEI_NAMESPACE}}}"
+TITLE_PATH = (f"{_TEI}teiHeader", f"{_TEI}fileDesc", f"{_TEI}titleStmt", f"{_TEI}title")
+BLOCK_TAGS = {f"{_TEI}p": "p", f"{_TEI}l": "l"}
+READ_SIZE = 1 << 16
+
+T = t.TypeVar("T")
+R = t.TypeVar("R")
+
+
+def collapse_whitespace(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+@dataclass
+class TeiBlock:
+    kind: str  # "title", "p", "l" or "body" (whole body text when it has no p/l)
+    text: str
+    # Byte offsets in the source file, from the element's start tag to the start of its end tag
+    start: int = 0
+    end: int = 0
+    # Numbers of the innermost enclosing div and lg (0 when there is none), unique within a file
+    div: int = 0
+    lg: int = 0
+
+
+@dataclass
+class _OpenElement:
+    depth: int
+    start: int
+    pieces: list[str]
+    kind: str = ""
+
+
+class _BlockWalker:
+    """expat callbacks that collect TeiBlocks in ``pending`` as elements close."""
+
+    def __init__(self, parser: t.Any) -> None:
+        self.parser = parser
+        self.pending: list[TeiBlock] = []
+        self.body_done = False
+        self._depth = 0
+        self._tags: list[str] = []
+        self._text: list[str] = []
+        self._title_found = False
+        self._title: _OpenElement | None = None
+        self._body: _OpenElement | None = None
+        self._block: _OpenElement | None = None
+        self._blocks = 0
+        self._divs: list[tuple[int, int]] = []  # (depth, number)
+        self._lgs: list[tuple[int, int]] = []
+        self._groups = 0
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self._text.append
+
+    def _flush_text(self) -> None:
+        # Text between two tags is one piece, like an ElementTree text or tail
+        if not self._text:
+            return
+        piece = "".join(self._text)
+        self._text.clear()
+        if not piece:
+            return
+        for element in (self._title, self._block):
+            if element is not None:
+                element.pieces.append(piece)
+        if self._body is not None and not self._blocks:
+            self._body.pieces.append(piece)
+
+    def start(self, tag: str, attrs: dict[str, str]) -> None:
+        self._flush_text()
+        self._depth += 1
+        self._tags.append(tag)
+        offset = self.parser.CurrentByteIndex
+        if self._body is None:
+            if not self.body_done and tag == f"{_TEI}body":
+                self._body = _OpenElement(self._depth, offset, [])
+            elif not self._title_found and self._title is None and tuple(self._tags[-4:]) == TITLE_PATH:
+                self._title = _OpenElement(self._depth, offset, [])
+        elif tag in BLOCK_TAGS:
+            if self._block is None:
+                self._block = _OpenElement(self._depth, offset, [], BLOCK_TAGS[tag])
+        elif tag in (f"{_TEI}div", f"{_TEI}lg"):
+            self._groups += 1
+            (self._divs if tag == f"{_TEI}div" else self._lgs).append((self._depth, self._groups))
+
+    def end(self, tag: str) -> None:
+        self._flush_text()
+        offset = self.parser.CurrentByteIndex
+        depth = self._depth
+        self._depth -= 1
+        self._tags.pop()
+        if self._block is not None and self._block.depth == depth:
+            self._emit(self._block, self._block.kind, offset)
+            self._block = None
+        elif self._body is not None and self._body.depth == depth:
+            if not self._blocks:
+                self._emit(self._body, "body", offset)
+            self._body = None
+            self.body_done = True
+        elif self._title is not None and self._title.depth == depth:
+            self._emit(self._title, "title", offset)
+            self._title = None
+            self._title_found = True
+        for groups in (self._divs, self._lgs):
+            if groups and groups[-1][0] == depth:
+                groups.pop()
+
+    def _emit(self, element: _OpenElement, kind: str, end: int) -> None:
+        text = collapse_whitespace(" ".join(element.pieces))
+        if not text:
+            return
+        if kind in BLOCK_TAGS.values():
+            self._blocks += 1
+            if self._body is not None:
+                self._body.pieces.clear()  # The whole-body fallback is no longer needed
+        self.pending.append(TeiBlock(
+            kind,
+            text,
+            start=element.start,
+            end=end,
+            div=self._divs[-1][1] if self._divs else 0,
+            lg=self._lgs[-1][1] if self._lgs else 0,
+        ))
+
+
+def iter_tei_blocks(xml_path: pathlib.Path) -> t.Iterator[TeiBlock]:
+    """
+    Yield the header title, then every paragraph and verse line of the first body in document
+    order. Verse lines inside a paragraph are part of the paragraph and are not yielded twice.
+    Raises ValueError when the file has no body and expat.ExpatError when it is not well-formed.
+    """
+    parser = expat.ParserCreate(namespace_separator="}")
+    parser.buffer_text = True
+    walker = _BlockWalker(parser)
+    with open(xml_path, "rb") as fh:
+        while chunk := fh.read(READ_SIZE):
+            parser.Parse(chunk, False)
+            yield from walker.pending
+            walker.pending.clear()
+        parser.Parse(b"", True)
+    yield from walker.pending
+    if not walker.body_done:
+        raise ValueError("TEI body element not found")
+
+
+def extract_body(xml_path: pathlib.Path, cache: ParseCache | None = None) -> tuple[str | None, str]:
+    """
+    Return (title, body text). Paragraphs are used when the body has any, otherwise the verse
+    lines joined by newlines, otherwise the whole body text; paragraphs are separated by blank lines.
+    """
+    title: str | None = None
+    paragraphs: list[str] = []
+    lines: list[str] = []
+    blocks = cache.blocks(xml_path) if cache is not None else iter_tei_blocks(xml_path)
+    for block in blocks:
+        if block.kind == "title":
+            title = block.text
+        elif block.kind == "l":
+            if not paragraphs:
+                lines.append(block.text)
+        else:
+            paragraphs.append(block.text)
+    if not paragraphs and lines:
+        paragraphs.append("\n".join(lines))
+    if not paragraphs:
+        raise ValueError("TEI body contained no textual content")
+    return title, "\n\n".join(paragraphs)
+
+
+def extract_files(
+    func: t.Callable[[T], R],
+    items: t.Iterable[T],
+    *,
+    workers: int | None = None,
+) -> t.Iterator[tuple[T, R | None, BaseException | None]]:
+    """
+    Run ``func`` (a picklable module-level function) on every item across a process pool and
+    yield ``(item, result, error)`` in input order, with a bounded number of files in flight.
+    With ``workers=1`` everything runs in the current process.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for item in items:
+            try:
+                yield item, func(item), None
+            except Exception as exc:  # noqa: BLE001 - reported to the caller per file
+                yield item, None, exc
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        window: deque[tuple[T, Future[R]]] = deque()
+        for item in items:
+            window.append((item, executor.submit(func, item)))
+            if len(window) >= workers * 4:
+                yield _result(*window.popleft())
+        while window:
+            yield _result(*window.popleft())
+
+
+def _result(item: T, future: Future[R]) -> tuple[T, R | None, BaseException | None]:
+    try:
+        return item, future.result(), None
+    except Exception as exc:  # noqa: BLE001 - reported to the caller per file
+        return item, None, exc
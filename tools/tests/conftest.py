@@ -0,0 +1,70 @@
+import pathlib
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The tools import each other as top-level modules, as when they are run from tools/
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """Serves ``files`` with strong ETags, honouring If-None-Match and Range/If-Range."""
+
+    protocol_version = "HTTP/1.1"
+    files: dict[str, tuple[bytes, str]]
+    # Statuses (and Retry-After values) to answer with before serving a path
+    failures: dict[str, list[tuple[int, str | None]]]
+    requests: list[tuple[str, dict[str, str]]]
+
+    def log_message(self, format, *args):  # noqa: A002 - BaseHTTPRequestHandler API
+        pass
+
+    def _send(self, status, body=b"", headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # noqa: N802 - BaseHTTPRequestHandler API
+        self.requests.append((self.path, dict(self.headers)))
+        if self.failures.get(self.path):
+            status, retry_after = self.failures[self.path].pop(0)
+            self._send(status, headers=[("Retry-After", retry_after)] if retry_after is not None else [])
+            return
+        if self.path not in self.files:
+            self._send(404)
+            return
+        body, etag = self.files[self.path]
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, headers=[("ETag", etag)])
+            return
+        requested = self.headers.get("Range", "")
+        if requested.startswith("bytes=") and self.headers.get("If-Range") == etag:
+            start = int(requested[len("bytes="):].rstrip("-"))
+            content_range = f"bytes {start}-{len(body) - 1}/{len(body)}"
+            self._send(206, body[start:], [("ETag", etag), ("Content-Range", content_range)])
+            return
+        self._send(200, body, [("ETag", etag)])
+
+
+@pytest.fixture
+def file_server():
+    handler = type("BoundFileHandler", (FileHandler,), {"files": {}, "failures": {}, "requests": []})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.base = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    def serve(path, body, etag='"v1"'):
+        handler.files[path] = (body, etag)
+        return httpd.base + path
+
+    httpd.serve = serve
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    thread.join()
@@ -0,0 +1,104 @@
+import json
+import threading
+
+import pytest
+
+from bulk_import import BulkImportError, ImportClient, bulk_import, collect_operation_result
+from discovery_engine_stub import make_server
+from upload_engine import TokenProvider, UploadEngine
+
+PARENT = "projects/p/locations/global/collections/default_collection/dataStores/ds/branches/default_branch"
+
+
+def document(**data):
+    return {"jsonData": json.dumps(data, ensure_ascii=False)}
+
+
+@pytest.fixture
+def stub():
+    server = make_server("127.0.0.1", 0, operation_polls=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def client(stub):
+    base = f"http://127.0.0.1:{stub.server_address[1]}"
+    with UploadEngine(TokenProvider(lambda: "token"), workers=2, rate=0, retries=0) as engine:
+        yield ImportClient(engine, api_base=f"{base}/v1beta", storage_base=base, poll_interval=0)
+
+
+def stored_ids(stub):
+    return {name.rsplit("/", 1)[-1] for name in stub.RequestHandlerClass.state.documents}
+
+
+def test_inline_import_attributes_error_samples_to_document_ids(stub, client, tmp_path):
+    documents = {f"doc-{index}": document(index=index) for index in range(5)}
+    documents["doc-3"] = {"jsonData": "[1, 2]"}
+    result = bulk_import(client, PARENT, documents, batch_dir=tmp_path, batch_size=2)
+
+    assert result.succeeded == {"doc-0", "doc-1", "doc-2", "doc-4"}
+    assert list(result.failed) == ["doc-3"] and "jsonData" in result.failed["doc-3"]
+    assert result.unknown == set()
+    assert stored_ids(stub) == result.succeeded
+    assert len(list(tmp_path.glob("batch-*.jsonl"))) == 3
+
+
+def test_gcs_import_uploads_the_batches_and_imports_them_together(stub, client, tmp_path):
+    documents = {f"doc-{index}": document(index=index) for index in range(5)}
+    result = bulk_import(
+        client, PARENT, documents, batch_dir=tmp_path, batch_size=2, gcs_bucket="bucket", gcs_prefix="/run/"
+    )
+
+    state = stub.RequestHandlerClass.state
+    assert sorted(state.objects) == [f"gs://bucket/run/batch-{index:05d}.jsonl" for index in range(3)]
+    assert result.succeeded == set(documents) == stored_ids(stub)
+    assert len(state.operations) == 1
+
+
+def test_full_reconciliation_replaces_the_data_store_in_one_import(stub, client, tmp_path):
+    bulk_import(client, PARENT, {"old": document(), "kept": document()}, batch_dir=tmp_path)
+    result = bulk_import(
+        client, PARENT, {"kept": document(), "new": document()},
+        batch_dir=tmp_path, gcs_bucket="bucket", reconciliation_mode="FULL",
+    )
+    assert result.succeeded == {"kept", "new"} == stored_ids(stub)
+
+
+@pytest.mark.parametrize("gcs_bucket, count", [(None, 1), ("bucket", 101)])
+def test_full_reconciliation_refuses_more_than_one_import(stub, client, tmp_path, gcs_bucket, count):
+    """FULL deletes whatever a request leaves out, so it must not be split over several imports"""
+    documents = {f"doc-{index}": document() for index in range(count)}
+    with pytest.raises(BulkImportError, match="FULL"):
+        bulk_import(
+            client, PARENT, documents,
+            batch_dir=tmp_path, batch_size=1, gcs_bucket=gcs_bucket, reconciliation_mode="FULL",
+        )
+    assert stub.RequestHandlerClass.state.requests == 0
+
+
+def test_unknown_reconciliation_mode_is_rejected(client, tmp_path):
+    with pytest.raises(BulkImportError, match="mode"):
+        bulk_import(client, PARENT, {}, batch_dir=tmp_path, reconciliation_mode="REPLACE")
+
+
+def test_truncated_error_samples_leave_the_rest_unconfirmed():
+    operation = {
+        "done": True,
+        "metadata": {"failureCount": "3"},
+        "response": {"errorSamples": [{"message": "Document doc-1: jsonData is not a JSON object"}]},
+    }
+    result = collect_operation_result(operation, ["doc-0", "doc-1", "doc-10"])
+    # Only whole tokens count: "doc-1" in the message does not blame "doc-10"
+    assert list(result.failed) == ["doc-1"]
+    assert result.unknown == {"doc-0", "doc-10"} and result.succeeded == set()
+
+
+def test_failed_operation_fails_every_document():
+    result = collect_operation_result({"done": True, "error": {"message": "quota"}}, ["a", "b"])
+    assert result.failed == {"a": "quota", "b": "quota"}
+    assert result.succeeded == set() == result.unknown
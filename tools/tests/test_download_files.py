@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+import download_files
+from download_files import (
+    STATE_FILENAME, DownloadError, Downloader, DownloadState, download_all, pick_filename, unique_name
+)
+from http_pool import ConnectionPool
+
+BODY = b"<TEI>" + b"x" * 1000 + b"</TEI>"
+
+
+@pytest.fixture
+def downloader(tmp_path):
+    pool = ConnectionPool(per_host=2, timeout=5)
+    yield Downloader(DownloadState(tmp_path / STATE_FILENAME), pool, retries=2, backoff=0)
+    pool.close()
+
+
+def served(file_server, path, body=BODY, etag='"v1"'):
+    return file_server.serve(path, body, etag)
+
+
+def test_file_names_are_unique_and_stable():
+    assert pick_filename("https://example.com/tei/T0001.xml?raw=1") == "T0001.xml"
+    assert pick_filename("https://example.com/").startswith("download-")
+    assert unique_name("T0001.xml", {"T0001.xml", "T0001-1.xml"}) == "T0001-2.xml"
+    assert unique_name("T0002.xml", {"T0001.xml"}) == "T0002.xml"
+
+
+def test_rerun_keeps_names_and_only_revalidates(file_server, tmp_path):
+    first = served(file_server, "/a/T0001.xml", b"first")
+    second = served(file_server, "/b/T0001.xml", b"second")
+    url_file = tmp_path / "urls.txt"
+    url_file.write_text(f"{first}\n# comment\n{second}\n", encoding="utf-8")
+    output = tmp_path / "out"
+    output.mkdir()
+
+    downloads, failures = download_all(url_file, output, workers=2)
+    assert failures == [] and {result.status for result in downloads} == {"downloaded"}
+    names = {result.url: result.path.name for result in downloads}
+    assert names == {first: "T0001.xml", second: "T0001-1.xml"}
+    assert (output / "T0001-1.xml").read_bytes() == b"second"
+
+    # A later run in a different order keeps the recorded names and gets 304 for both files
+    url_file.write_text(f"{second}\n{first}\n", encoding="utf-8")
+    downloads, failures = download_all(url_file, output, workers=2)
+    assert failures == [] and {result.status for result in downloads} == {"unchanged"}
+    assert {result.url: result.path.name for result in downloads} == names
+    assert all(headers.get("If-None-Match") == '"v1"' for _, headers in file_server.RequestHandlerClass.requests[2:])
+    state = json.loads((output / STATE_FILENAME).read_text(encoding="utf-8"))
+    assert state[second] == {"etag": '"v1"', "last_modified": None, "path": "T0001-1.xml", "size": 6}
+
+
+def test_partial_download_resumes_with_range_and_if_range(file_server, downloader, tmp_path):
+    url = served(file_server, "/T0001.xml")
+    target = tmp_path / "T0001.xml"
+    (tmp_path / "T0001.xml.part").write_bytes(BODY[:300])
+    downloader.state.update(url, path=target.name, etag='"v1"')
+
+    assert downloader.fetch(url, target) == "resumed"
+    assert target.read_bytes() == BODY
+    _, headers = file_server.RequestHandlerClass.requests[-1]
+    assert (headers["Range"], headers["If-Range"]) == ("bytes=300-", '"v1"')
+
+
+def test_changed_file_is_downloaded_again_instead_of_resumed(file_server, downloader, tmp_path):
+    url = served(file_server, "/T0001.xml", etag='"v2"')
+    target = tmp_path / "T0001.xml"
+    (tmp_path / "T0001.xml.part").write_bytes(b"stale bytes")
+    downloader.state.update(url, path=target.name, etag='"v1"')
+
+    assert downloader.fetch(url, target) == "downloaded"
+    assert target.read_bytes() == BODY
+    assert downloader.state.get(url)["etag"] == '"v2"'
+
+
+def test_throttling_and_server_errors_are_retried(file_server, downloader, tmp_path, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(download_files.time, "sleep", sleeps.append)
+    url = served(file_server, "/T0001.xml")
+    file_server.RequestHandlerClass.failures["/T0001.xml"] = [(429, "7"), (503, None)]
+
+    assert downloader.fetch(url, tmp_path / "T0001.xml") == "downloaded"
+    # Retry-After is honoured; without it the backoff (0 here) applies
+    assert sleeps == [7.0, 0]
+    assert len(file_server.RequestHandlerClass.requests) == 3
+
+
+def test_retries_run_out_and_client_errors_fail_at_once(file_server, downloader, tmp_path, monkeypatch):
+    monkeypatch.setattr(download_files.time, "sleep", lambda seconds: None)
+    url = served(file_server, "/T0001.xml")
+    file_server.RequestHandlerClass.failures["/T0001.xml"] = [(503, "0")] * 3
+    with pytest.raises(DownloadError, match="after 3 attempts"):
+        downloader.fetch(url, tmp_path / "T0001.xml")
+
+    with pytest.raises(DownloadError, match="404"):
+        downloader.fetch(file_server.base + "/missing.xml", tmp_path / "missing.xml")
+    assert not (tmp_path / "missing.xml").exists()
@@ -0,0 +1,52 @@
+import pytest
+
+import ingest
+
+TEI = (
+    '<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><fileDesc><titleStmt><title>{title}</title>'
+    "</titleStmt></fileDesc></teiHeader><text><body>{body}</body></text></TEI>"
+)
+
+
+def tei(title, paragraphs):
+    return TEI.format(title=title, body="".join(f"<p>{text}</p>" for text in paragraphs)).encode("utf-8")
+
+
+def dry_run(tmp_path, urls, *options):
+    url_file = tmp_path / "urls.txt"
+    url_file.write_text("\n".join(urls) + "\n", encoding="utf-8")
+    return ingest.main([
+        str(url_file), str(tmp_path / "dl"), "--dry-run", "--no-parse-cache",
+        "--download-retries", "0", "--segment-min-chars", "5", "--segment-max-chars", "15", *options,
+    ])
+
+
+@pytest.mark.parametrize("extract_workers", ["1", "2"])
+def test_dry_run_downloads_chunks_and_prints_segment_ids(file_server, tmp_path, capsys, extract_workers):
+    urls = [
+        file_server.serve("/T0001.xml", tei("法句経", ["諸行は無常なり。", "是れ生滅の法なり。"])),
+        file_server.serve("/T0002.xml", tei("般若心経", ["色即是空。"])),
+        file_server.serve("/notes.txt", b"not a TEI file"),
+    ]
+    assert dry_run(tmp_path, urls, "--extract-workers", extract_workers) == 0
+
+    out = capsys.readouterr().out
+    segments = sorted(line.split()[1] for line in out.splitlines() if line.startswith("[dry-run]"))
+    assert segments == ["t0001-xml-001", "t0001-xml-002", "t0002-xml-001"]
+    assert "Dry run complete: 3 segments." in out
+    assert (tmp_path / "dl" / "notes.txt").exists()
+
+
+def test_failed_download_and_parse_set_the_exit_code(file_server, tmp_path, capsys):
+    urls = [
+        file_server.serve("/T0001.xml", tei("法句経", ["諸行は無常なり。"])),
+        file_server.serve("/broken.xml", b"<TEI><text><body><p>"),
+        file_server.base + "/missing.xml",
+    ]
+    assert dry_run(tmp_path, urls, "--extract-workers", "1") == 1
+
+    captured = capsys.readouterr()
+    assert "[dry-run] t0001-xml-001" in captured.out
+    assert f"[error] download {file_server.base}/missing.xml" in captured.err
+    assert f"[error] extract {file_server.base}/broken.xml" in captured.err
+    assert "Completed with 1 segments uploaded and 2 failures." in captured.err
@@ -0,0 +1,72 @@
+import pytest
+
+from near_duplicates import NearDuplicateIndex, lsh_parameters, minhash, shingles
+
+BASE = "諸行無常是生滅法生滅滅已寂滅為楽" * 3 + "色即是空空即是色受想行識亦復如是舎利子是諸法空相"
+# The last six characters differ: the estimated similarity to BASE is about 0.78
+EDITED = BASE[:-6] + "不生不滅不垢"
+OTHER = "怨みは怨みによって息むことはない怨みを捨ててこそ息むこれは永遠の真理である"
+
+
+def test_shingles_ignore_whitespace_and_punctuation():
+    assert shingles("諸行 無常、是生滅法。", 5) == shingles("諸行無常是生滅法", 5)
+    assert shingles("無常", 5) == {"無常"}
+    assert shingles("。、 ", 5) == set()
+
+
+def test_identical_signatures_for_equal_sets():
+    assert minhash({"a", "b", "c"}, 16) == minhash(["c", "b", "a"], 16)
+    assert len(minhash({"a"}, 16)) == 16
+
+
+def test_duplicates_resolve_to_the_first_canonical_text():
+    index = NearDuplicateIndex()
+    assert index.add("first", BASE) is None
+    assert index.add("copy", BASE.replace("楽", "楽、")) == "first"
+    assert index.add("other", OTHER) is None
+    assert len(index) == 2
+
+
+def test_threshold_decides_whether_an_edited_text_is_a_duplicate():
+    similarity = NearDuplicateIndex().similarity(
+        minhash(shingles(BASE, 5), 128), minhash(shingles(EDITED, 5), 128)
+    )
+    assert 0.7 <= similarity < 0.8
+
+    strict = NearDuplicateIndex(threshold=0.8)
+    strict.add("base", BASE)
+    assert strict.add("edited", EDITED) is None
+
+    loose = NearDuplicateIndex(threshold=0.7)
+    loose.add("base", BASE)
+    assert loose.add("edited", EDITED) == "base"
+
+
+def test_only_canonical_texts_are_indexed():
+    """A duplicate is not registered, so later copies of it still resolve to the group's canonical text"""
+    index = NearDuplicateIndex(threshold=0.7)
+    index.add("base", BASE)
+    assert index.add("edited", EDITED) == "base"
+    assert index.add("edited-again", EDITED) == "base"
+    assert len(index) == 1
+
+
+
+def test_texts_without_shingles_are_never_duplicates():
+    index = NearDuplicateIndex()
+    assert [index.add(key, text) for key, text in [("empty", ""), ("dots", "。。、"), ("space", " \n")]] == [None] * 3
+    assert index.add("base", BASE) is None
+    assert index.add("more-dots", "……") is None
+    assert len(index) == 1
+
+def test_lsh_parameters_fit_the_signature():
+    bands, rows = lsh_parameters(0.8, 128)
+    assert bands * rows <= 128
+    # A higher threshold needs more rows per band to keep dissimilar texts apart
+    assert lsh_parameters(0.5, 128)[1] < rows
+
+
+@pytest.mark.parametrize("threshold", [0, 1.5])
+def test_threshold_must_be_a_similarity(threshold):
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(threshold=threshold)
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+import parse_cache
+import tei_extract
+from parse_cache import ParseCache
+
+TEI = (
+    '<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><fileDesc><titleStmt><title>法句経</title>'
+    "</titleStmt></fileDesc></teiHeader><text><body><div><p>{first}</p><p>是れ生滅の法なり。</p></div>"
+    "</body></text></TEI>"
+)
+SIZES = {"min_chars": 5, "max_chars": 12, "overlap": 0}
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Count the files actually parsed and chunked instead of read from the cache."""
+    counts = {"parsed": 0, "chunked": 0}
+    chunk = parse_cache.chunk_tei_blocks
+
+    def iter_tei_blocks(path):
+        counts["parsed"] += 1
+        return tei_extract.iter_tei_blocks(path)
+
+    def chunk_tei_blocks(blocks, **sizes):
+        counts["chunked"] += 1
+        return chunk(blocks, **sizes)
+
+    monkeypatch.setattr(parse_cache, "iter_tei_blocks", iter_tei_blocks)
+    monkeypatch.setattr(parse_cache, "chunk_tei_blocks", chunk_tei_blocks)
+    return counts
+
+
+def write(path, first="諸行は無常なり。"):
+    path.write_text(TEI.format(first=first), encoding="utf-8")
+    return path
+
+
+def test_unchanged_file_is_served_from_the_cache(tmp_path, parses):
+    path = write(tmp_path / "T0001.xml")
+    cache = ParseCache(tmp_path / "cache")
+    expected = cache.chunks(path, **SIZES)
+    assert expected[0] == "法句経" and [chunk.text for chunk in expected[1]] == ["諸行は無常なり。", "是れ生滅の法なり。"]
+
+    # A new mtime alone does not invalidate the entry: it is keyed by content
+    os.utime(path, (1, 1))
+    assert ParseCache(tmp_path / "cache").chunks(path, **SIZES) == expected
+    assert ParseCache(tmp_path / "cache").blocks(path) == list(tei_extract.iter_tei_blocks(path))
+    assert parses == {"parsed": 1, "chunked": 1}
+
+
+def test_changed_content_is_parsed_again(tmp_path, parses):
+    path = write(tmp_path / "T0001.xml")
+    cache = ParseCache(tmp_path / "cache")
+    cache.chunks(path, **SIZES)
+    # Same size, different content
+    write(path, "諸行は無我なり。")
+    _, chunks = cache.chunks(path, **SIZES)
+    assert chunks[0].text == "諸行は無我なり。"
+    write(path, "諸行は無常なり。ゆえに")
+    assert cache.chunks(path, **SIZES)[1][0].text == "諸行は無常なり。ゆえに"
+    assert parses == {"parsed": 3, "chunked": 3}
+
+
+def test_other_segment_sizes_rechunk_the_cached_blocks(tmp_path, parses):
+    path = write(tmp_path / "T0001.xml")
+    cache = ParseCache(tmp_path / "cache")
+    cache.chunks(path, **SIZES)
+    _, chunks = cache.chunks(path, min_chars=5, max_chars=40, overlap=0)
+    assert len(chunks) == 1
+    assert parses == {"parsed": 1, "chunked": 2}
+
+
+def test_version_bumps_invalidate_their_entries(tmp_path, parses, monkeypatch):
+    path = write(tmp_path / "T0001.xml")
+    ParseCache(tmp_path / "cache").chunks(path, **SIZES)
+
+    monkeypatch.setattr(parse_cache, "CHUNKER_VERSION", 2)
+    ParseCache(tmp_path / "cache").chunks(path, **SIZES)
+    assert parses == {"parsed": 1, "chunked": 2}
+
+    monkeypatch.setattr(parse_cache, "EXTRACTOR_VERSION", 2)
+    ParseCache(tmp_path / "cache").chunks(path, **SIZES)
+    assert parses == {"parsed": 2, "chunked": 3}
+    assert sorted(entry.name for entry in (tmp_path / "cache").iterdir()) == ["v1", "v2"]
+
+
+def test_unreadable_entries_are_rebuilt(tmp_path, parses):
+    path = write(tmp_path / "T0001.xml")
+    cache = ParseCache(tmp_path / "cache")
+    expected = cache.chunks(path, **SIZES)
+    for entry in (tmp_path / "cache").rglob("*.json.z"):
+        entry.write_bytes(b"not zlib")
+    assert cache.chunks(path, **SIZES) == expected
+    assert parses == {"parsed": 2, "chunked": 2}
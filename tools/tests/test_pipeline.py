@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+
+def test_items_flow_through_every_stage_before_run_returns():
+    seen = []
+    lock = threading.Lock()
+
+    def collect(item):
+        with lock:
+            seen.append(item)
+        return ()
+
+    stages = [
+        Stage("split", lambda n: [n, n + 100], workers=2),
+        Stage("double", lambda n: [n * 2], workers=3),
+        Stage("collect", collect, workers=2),
+    ]
+    pipeline = Pipeline(stages, report_interval=60)
+    pipeline.run(range(20))
+
+    # run() closes the stages in order and waits for each to drain
+    assert sorted(seen) == sorted(n * 2 for i in range(20) for n in (i, i + 100))
+    assert [(stage.stats.done, stage.stats.emitted) for stage in stages] == [(20, 40), (40, 40), (40, 0)]
+    assert all(not thread.is_alive() for stage in stages for thread in stage._threads)
+    assert pipeline.failures() == 0
+
+
+def test_failures_are_counted_per_stage_and_do_not_stop_it():
+    errors = []
+
+    def parse(n):
+        if n % 3 == 0:
+            raise ValueError(n)
+        return [n]
+
+    def upload(n):
+        if n == 4:
+            raise RuntimeError("quota")
+        return ()
+
+    stages = [
+        Stage("parse", parse, workers=2, on_error=lambda item, exc: errors.append(("parse", item))),
+        Stage("upload", upload, workers=1, on_error=lambda item, exc: errors.append(("upload", item))),
+    ]
+    pipeline = Pipeline(stages, report_interval=60)
+    pipeline.run(range(9))
+
+    assert sorted(errors) == [("parse", 0), ("parse", 3), ("parse", 6), ("upload", 4)]
+    assert [stage.stats.failed for stage in stages] == [3, 1]
+    assert stages[1].stats.done == 6 and pipeline.failures() == 4
+
+
+def test_a_slow_stage_blocks_the_producer_instead_of_buffering():
+    release = threading.Event()
+    pulled = []
+
+    def items():
+        for n in range(100):
+            pulled.append(n)
+            yield n
+
+    def slow(n):
+        release.wait()
+        return ()
+
+    stages = [
+        Stage("fast", lambda n: [n], workers=1, queue_size=2),
+        Stage("slow", slow, workers=1, queue_size=2),
+    ]
+    pipeline = Pipeline(stages, report_interval=60)
+    runner = threading.Thread(target=pipeline.run, args=(items(),))
+    runner.start()
+    try:
+        # Wait until the producer is stuck: nothing more is pulled from the input
+        previous = -1
+        while len(pulled) != previous:
+            previous = len(pulled)
+            runner.join(0.2)
+        # slow's worker and queue (1 + 2), fast's worker and queue (1 + 2) and one item blocked in put
+        assert len(pulled) <= 7
+        assert stages[0].queue.qsize() == stages[1].queue.qsize() == 2
+    finally:
+        release.set()
+        runner.join(10)
+    assert not runner.is_alive()
+    assert len(pulled) == 100 and stages[1].stats.done == 100
+
+
+def test_a_pipeline_needs_a_stage():
+    with pytest.raises(ValueError):
+        Pipeline([])
@@ -0,0 +1,84 @@
+import pytest
+
+from tei_chunker import chunk_blocks, chunk_tei_file
+from tei_extract import TeiBlock
+
+
+def paragraph(text, start, div=1):
+    return TeiBlock("p", text, start=start, end=start + len(text), div=div)
+
+
+def test_paragraphs_are_packed_up_to_max_chars():
+    blocks = [paragraph("あ" * 30, 0), paragraph("い" * 30, 100), paragraph("う" * 30, 200)]
+    chunks = chunk_blocks(blocks, min_chars=10, max_chars=70)
+    assert [chunk.text for chunk in chunks] == ["あ" * 30 + "\n\n" + "い" * 30, "う" * 30]
+    assert [(chunk.start, chunk.end) for chunk in chunks] == [(0, 130), (200, 230)]
+
+
+def test_long_paragraph_is_cut_between_sentences():
+    sentences = ["一" * 8 + "。", "二" * 8 + "。", "三" * 8 + "。"]
+    chunks = chunk_blocks([paragraph("".join(sentences), 0)], min_chars=5, max_chars=20)
+    assert [chunk.text for chunk in chunks] == [sentences[0] + sentences[1], sentences[2]]
+    # Every piece keeps the byte range of the paragraph it was cut from
+    assert {(chunk.start, chunk.end) for chunk in chunks} == {(0, 27)}
+
+
+def test_sentence_longer_than_max_chars_is_cut_anywhere():
+    chunks = chunk_blocks([paragraph("長" * 25, 0)], min_chars=5, max_chars=10)
+    assert [len(chunk.text) for chunk in chunks] == [10, 10, 5]
+
+
+def test_div_boundary_closes_a_segment_once_it_reaches_min_chars():
+    blocks = [paragraph("あ" * 10, 0, div=1), paragraph("い" * 10, 20, div=2), paragraph("う" * 10, 40, div=3)]
+    assert len(chunk_blocks(blocks, min_chars=10, max_chars=100)) == 3
+    # Below min_chars the next div is packed into the same segment
+    assert len(chunk_blocks(blocks, min_chars=20, max_chars=100)) == 2
+
+
+def test_verse_lines_of_one_group_form_a_single_unit():
+    lines = [TeiBlock("l", f"偈{index}", start=index * 10, end=index * 10 + 5, div=1, lg=1) for index in range(3)]
+    other = TeiBlock("l", "別の偈", start=40, end=45, div=1, lg=2)
+    (chunk,) = chunk_blocks([*lines, other], min_chars=1, max_chars=100)
+    assert chunk.text == "偈0\n偈1\n偈2\n\n別の偈"
+    assert (chunk.start, chunk.end) == (0, 45)
+
+
+def test_overlap_repeats_trailing_sentences_within_a_div():
+    sentences = [f"{char * 9}。" for char in "一二三四"]
+    chunks = chunk_blocks([paragraph("".join(sentences), 0)], min_chars=5, max_chars=30, overlap=10)
+    assert [chunk.text for chunk in chunks] == ["".join(sentences[:3]), "".join(sentences[2:])]
+
+    # A sentence longer than the overlap is not repeated
+    chunks = chunk_blocks([paragraph("".join(sentences), 0)], min_chars=5, max_chars=30, overlap=9)
+    assert [chunk.text for chunk in chunks] == ["".join(sentences[:3]), sentences[3]]
+
+
+def test_overlap_is_not_carried_across_divs():
+    blocks = [paragraph("一" * 9 + "。", 0, div=1), paragraph("二" * 9 + "。", 20, div=2)]
+    chunks = chunk_blocks(blocks, min_chars=5, max_chars=20, overlap=9)
+    assert [chunk.text for chunk in chunks] == ["一" * 9 + "。", "二" * 9 + "。"]
+
+
+@pytest.mark.parametrize("sizes", [
+    {"min_chars": 0, "max_chars": 10},
+    {"min_chars": 20, "max_chars": 10},
+    {"min_chars": 5, "max_chars": 10, "overlap": 5},
+])
+def test_invalid_sizes_are_rejected(sizes):
+    with pytest.raises(ValueError):
+        chunk_blocks([], **sizes)
+
+
+def test_title_is_returned_separately_and_an_empty_body_is_an_error(tmp_path):
+    path = tmp_path / "T0001.xml"
+    path.write_text(
+        '<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><fileDesc><titleStmt><title>法句経</title>'
+        "</titleStmt></fileDesc></teiHeader><text><body><p>本文。</p></body></text></TEI>",
+        encoding="utf-8",
+    )
+    title, chunks = chunk_tei_file(path)
+    assert title == "法句経" and [chunk.text for chunk in chunks] == ["本文。"]
+
+    path.write_text('<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><p> </p></body></text></TEI>', encoding="utf-8")
+    with pytest.raises(ValueError):
+        chunk_tei_file(path)
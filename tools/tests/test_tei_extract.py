@@ -0,0 +1,92 @@
+import time
+from xml.parsers import expat
+
+import pytest
+
+import tei_extract
+from tei_extract import extract_body, extract_files, iter_tei_blocks
+
+TEI = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><fileDesc><titleStmt>'
+    "<title>法句<hi>経</hi></title></titleStmt></fileDesc></teiHeader>"
+    "<text><body><div><p>諸行は\n  無常なり。<note>注</note></p>"
+    "<p>外<p>内</p>後</p>"
+    "<lg><l>偈の一</l><l> </l><l>偈の二</l></lg></div>"
+    "<div><l>散文の偈</l></div></body>"
+    "<body><p>二つ目の本文は読まない</p></body></text></TEI>"
+)
+
+
+def write(tmp_path, text, name="T0001.xml"):
+    path = tmp_path / name
+    path.write_bytes(text.encode("utf-8"))
+    return path
+
+
+def test_blocks_follow_document_order_with_offsets_and_groups(tmp_path):
+    path = write(tmp_path, TEI)
+    blocks = list(iter_tei_blocks(path))
+    assert [(block.kind, block.text) for block in blocks] == [
+        ("title", "法句 経"),
+        ("p", "諸行は 無常なり。 注"),
+        # A paragraph nested in another one is part of it and not yielded twice
+        ("p", "外 内 後"),
+        ("l", "偈の一"),
+        ("l", "偈の二"),
+        ("l", "散文の偈"),
+    ]
+    data = path.read_bytes()
+    for block in blocks[1:]:
+        element = data[block.start:block.end].decode("utf-8")
+        assert element.startswith(("<p>", "<l>"))
+    assert [(block.div, block.lg) for block in blocks[3:]] == [(1, 2), (1, 2), (3, 0)]
+    assert blocks[1].div == blocks[2].div == 1
+
+
+def test_blocks_are_the_same_when_read_in_small_chunks(tmp_path, monkeypatch):
+    path = write(tmp_path, TEI)
+    expected = list(iter_tei_blocks(path))
+    monkeypatch.setattr(tei_extract, "READ_SIZE", 7)
+    assert list(iter_tei_blocks(path)) == expected
+
+
+def test_body_without_paragraphs_is_one_block(tmp_path):
+    path = write(tmp_path, '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body> 本文 <hi>だけ</hi> </body></text></TEI>')
+    assert [(block.kind, block.text) for block in iter_tei_blocks(path)] == [("body", "本文 だけ")]
+
+
+def test_missing_body_and_malformed_xml_are_errors(tmp_path):
+    with pytest.raises(ValueError, match="body"):
+        list(iter_tei_blocks(write(tmp_path, '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text/></TEI>')))
+    with pytest.raises(expat.ExpatError):
+        list(iter_tei_blocks(write(tmp_path, "<TEI><text><body><p>閉じていない</body></TEI>")))
+
+
+def test_extract_body_prefers_paragraphs_over_verse_lines(tmp_path):
+    assert extract_body(write(tmp_path, TEI)) == ("法句 経", "諸行は 無常なり。 注\n\n外 内 後")
+    verse = '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><lg><l>一</l><l>二</l></lg></body></text></TEI>'
+    assert extract_body(write(tmp_path, verse)) == (None, "一\n二")
+
+
+def slow_square(value):
+    # Later items finish first, so the output order has to come from the input order
+    time.sleep(0.02 * (5 - value))
+    if value == 3:
+        raise ValueError("three")
+    return value * value
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_extract_files_keeps_input_order_and_reports_errors_per_item(workers):
+    results = list(extract_files(slow_square, range(5), workers=workers))
+    assert [(item, result) for item, result, _ in results] == [(0, 0), (1, 1), (2, 4), (3, None), (4, 16)]
+    errors = [error for _, _, error in results]
+    assert isinstance(errors[3], ValueError) and errors[:3] + errors[4:] == [None] * 4
+
+
+def test_extract_files_fans_out_over_processes(tmp_path):
+    paths = [write(tmp_path, TEI.replace("無常", f"無常{index}"), f"T{index:04d}.xml") for index in range(6)]
+    results = list(extract_files(extract_body, paths, workers=2))
+    assert [item for item, _, _ in results] == paths
+    assert [body.split("\n\n")[0] for _, (_, body), _ in results] == [f"諸行は 無常{index}なり。 注" for index in range(6)]
@@ -0,0 +1,119 @@
+import http.client
+
+import pytest
+
+import upload_engine
+from upload_engine import MAX_BACKOFF, SimpleResponse, TokenBucket, TokenProvider, UploadEngine, UploadError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(upload_engine, "time", clock)
+    return clock
+
+
+def test_token_bucket_allows_a_burst_then_paces_requests(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert clock.sleeps == [0.5]
+    clock.now += 10
+    # Idle time refills the bucket up to the burst size only
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == [0.5]
+    bucket.acquire()
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_zero_rate_disables_the_limit(clock):
+    bucket = TokenBucket(rate=0)
+    for _ in range(100):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+
+def test_token_provider_refreshes_old_and_rejected_tokens(clock):
+    tokens = iter(["first", "second", "third"])
+    provider = TokenProvider(lambda: next(tokens), max_age=60)
+    assert provider.get() == "first"
+    clock.now = 60
+    assert provider.get() == "second"
+    provider.invalidate("first")  # Already replaced by another thread
+    assert provider.get() == "second"
+    provider.invalidate("second")
+    assert provider.get() == "third"
+
+
+def scripted_engine(outcomes, **options):
+    """An engine whose requests return (or raise) ``outcomes`` in order, recording the tokens used."""
+    fetched = iter(f"token-{index}" for index in range(10))
+    engine = UploadEngine(TokenProvider(lambda: next(fetched)), rate=0, backoff=1.0, **options)
+    sent = []
+
+    def send(method, url, data, content_type, token):
+        sent.append(token)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        status, retry_after = outcome
+        return SimpleResponse(status, "{}"), retry_after
+
+    engine._send = send
+    return engine, sent
+
+
+def test_transient_statuses_are_retried_with_backoff(clock, monkeypatch):
+    monkeypatch.setattr(upload_engine.random, "uniform", lambda low, high: 1.0)
+    engine, sent = scripted_engine([(503, None), (429, 7.0), (500, 100.0), (200, None)], retries=5)
+    assert engine.request("POST", "http://stub/v1/documents", json={}).status_code == 200
+    # Exponential backoff without Retry-After; Retry-After is honoured but capped
+    assert clock.sleeps == [1.0, 7.0, MAX_BACKOFF]
+    assert len(sent) == 4
+
+
+def test_last_response_is_returned_when_retries_run_out(clock):
+    engine, sent = scripted_engine([(503, 0.0)] * 3, retries=2)
+    assert engine.request("GET", "http://stub/v1/operations/1").status_code == 503
+    assert len(sent) == 3
+
+
+def test_client_errors_are_not_retried(clock):
+    engine, sent = scripted_engine([(400, None)], retries=5)
+    assert engine.request("GET", "http://stub/v1/documents/x").status_code == 400
+    assert clock.sleeps == []
+
+
+def test_network_errors_raise_after_the_last_retry(clock):
+    engine, sent = scripted_engine(
+        [ConnectionResetError("reset"), http.client.RemoteDisconnected("closed")], retries=1
+    )
+    with pytest.raises(UploadError, match="after 2 attempts"):
+        engine.request("GET", "http://stub/v1/documents/x")
+    assert len(clock.sleeps) == 1
+
+
+def test_rejected_token_is_refreshed_once(clock):
+    engine, sent = scripted_engine([(401, None), (200, None)])
+    assert engine.request("GET", "http://stub/v1/documents/x").status_code == 200
+    assert sent == ["token-0", "token-1"] and clock.sleeps == []
+
+    engine, sent = scripted_engine([(401, None), (401, None)])
+    assert engine.request("GET", "http://stub/v1/documents/x").status_code == 401
+    assert len(sent) == 2
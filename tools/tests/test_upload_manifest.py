@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from bulk_import import BulkImportError
+from upload_manifest import UploadManifest, payload_hash, run_sync
+
+PARENT = "projects/p/locations/global/collections/default_collection/dataStores/ds/branches/default_branch"
+
+
+class FakeApi:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.upserted = []
+        self.deleted = []
+
+    def upsert(self, document_id, payload):
+        if document_id in self.fail:
+            raise RuntimeError("quota")
+        self.upserted.append(document_id)
+
+    def delete(self, document_id):
+        self.deleted.append(document_id)
+
+
+def sync(path, payloads, api, **options):
+    options.setdefault("read_failures", 0)
+    options.setdefault("plan_only", False)
+    return run_sync(
+        manifest_path=path, parent_path=PARENT, payloads=payloads, upsert=api.upsert, delete=api.delete, **options
+    )
+
+
+def stored(path):
+    return json.loads(path.read_text(encoding="utf-8"))["stores"][PARENT]
+
+
+def test_plan_compares_payload_hashes_with_the_manifest(tmp_path):
+    manifest = UploadManifest(tmp_path / "manifest.json", PARENT)
+    manifest.record_upload("same", payload_hash({"text": "a"}))
+    manifest.record_upload("changed", payload_hash({"text": "old"}))
+    manifest.record_upload("gone", payload_hash({"text": "b"}))
+    plan = manifest.plan({
+        "same": payload_hash({"text": "a"}),
+        "changed": payload_hash({"text": "new"}),
+        "new": payload_hash({"text": "c"}),
+    })
+    assert (plan.create, plan.update, plan.delete, plan.unchanged) == (["new"], ["changed"], ["gone"], 1)
+    # Key order does not change the hash
+    assert payload_hash({"a": 1, "b": 2}) == payload_hash({"b": 2, "a": 1})
+
+
+def test_second_sync_uploads_only_changes_and_deletes_removed_documents(tmp_path):
+    path = tmp_path / "manifest.json"
+    first = FakeApi()
+    assert sync(path, {"a": {"v": 1}, "b": {"v": 1}, "c": {"v": 1}}, first) == 0
+    assert sorted(first.upserted) == ["a", "b", "c"]
+
+    second = FakeApi()
+    assert sync(path, {"a": {"v": 1}, "b": {"v": 2}}, second) == 0
+    assert (second.upserted, second.deleted) == (["b"], ["c"])
+    assert set(stored(path)) == {"a", "b"}
+    assert stored(path)["b"]["hash"] == payload_hash({"v": 2})
+
+
+def test_failed_uploads_stay_pending_for_the_next_sync(tmp_path):
+    path = tmp_path / "manifest.json"
+    assert sync(path, {"a": {}, "b": {}}, FakeApi(fail={"b"})) == 1
+    retry = FakeApi()
+    assert sync(path, {"a": {}, "b": {}}, retry) == 0
+    assert retry.upserted == ["b"]
+
+
+def test_deletes_are_refused_when_local_files_could_not_be_read(tmp_path, capsys):
+    """A file that failed to parse would otherwise look deleted and its documents would be removed"""
+    path = tmp_path / "manifest.json"
+    sync(path, {"a": {}, "b": {}}, FakeApi())
+    api = FakeApi()
+    assert sync(path, {"a": {}}, api, read_failures=1) == 1
+    assert api.deleted == [] and set(stored(path)) == {"a", "b"}
+    assert "Not deleting 1 documents" in capsys.readouterr().err
+
+
+def test_plan_only_calls_nothing(tmp_path, capsys):
+    api = FakeApi()
+    assert sync(tmp_path / "manifest.json", {"a": {}}, api, plan_only=True) == 0
+    assert api.upserted == [] and not (tmp_path / "manifest.json").exists()
+    assert "1 new" in capsys.readouterr().out
+
+
+def test_bulk_sync_records_only_confirmed_imports(tmp_path):
+    path = tmp_path / "manifest.json"
+
+    def import_batch(payloads):
+        assert set(payloads) == {"a", "b", "c"}
+        return {"a", "c"}, {"b": "invalid jsonData"}
+
+    assert sync(path, {"a": {}, "b": {}, "c": {}}, FakeApi(), import_batch=import_batch) == 1
+    assert set(stored(path)) == {"a", "c"}
+
+
+@pytest.mark.parametrize("previous", [{}, {"old": {}}])
+def test_bulk_import_error_ends_the_sync_with_exit_code_1(tmp_path, capsys, previous):
+    path = tmp_path / "manifest.json"
+    sync(path, previous, FakeApi())
+
+    def import_batch(payloads):
+        raise BulkImportError("FULL reconciliation needs a single gcsSource import")
+
+    api = FakeApi()
+    assert sync(path, {"a": {}}, api, import_batch=import_batch) == 1
+    assert "bulk import failed: FULL" in capsys.readouterr().err
+    assert api.deleted == [] and "a" not in stored(path)
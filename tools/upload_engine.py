@@ -0,0 +1,303 @@
+"""Concurrent REST upload engine shared by the Vertex AI Search upload tools.
+
+Requests go over a pool of persistent HTTPS connections, are paced by a token bucket matched to
+the API quota, are retried with jittered exponential backoff on network errors, 429 and 5xx,
+and pick up a fresh access token when the current one expires or is rejected.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+import typing as t
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from urllib.parse import urlencode, urlparse
+
+from http_pool import ConnectionPool
+
+DEFAULT_WORKERS = 8
+# Discovery Engine document writes default to a few hundred requests per minute per project
+DEFAULT_RATE = 5.0
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+DEFAULT_TIMEOUT = 60.0
+TOKEN_MAX_AGE = 45 * 60
+PROGRESS_INTERVAL = 5.0
+MAX_BACKOFF = 60.0
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+T = t.TypeVar("T")
+
+
+class UploadError(RuntimeError):
+    """Raised when a request still fails after all retries."""
+
+
+@dataclass
+class SimpleResponse:
+    status_code: int
+    text: str
+
+    def json(self) -> t.Any:
+        return json.loads(self.text) if self.text.strip() else {}
+
+
+class TokenProvider:
+    """Caches an access token and fetches a new one when it is old or was rejected."""
+
+    def __init__(self, fetch: t.Callable[[], str], max_age: float = TOKEN_MAX_AGE) -> None:
+        self._fetch = fetch
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._token: str | None = None
+        self._fetched_at = 0.0
+
+    def get(self) -> str:
+        with self._lock:
+            if self._token is None or time.monotonic() - self._fetched_at >= self.max_age:
+                self._token = self._fetch()
+                self._fetched_at = time.monotonic()
+            return self._token
+
+    def invalidate(self, stale: str) -> None:
+        """Drop ``stale`` so the next get() refreshes, unless another thread already did."""
+        with self._lock:
+            if self._token == stale:
+                self._token = None
+
+
+class TokenBucket:
+    """Allows ``rate`` requests per second on average with bursts of up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int | None = None) -> None:
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class Progress:
+    """Prints throughput (documents per second) and ETA at most every ``interval`` seconds."""
+
+    def __init__(self, total: int | None, label: str, interval: float = PROGRESS_INTERVAL) -> None:
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self._started = time.monotonic()
+        self._reported = self._started
+
+    def update(self, failed: bool) -> None:
+        self.done += 1
+        self.failed += int(failed)
+        if time.monotonic() - self._reported >= self.interval:
+            self.report()
+
+    def report(self) -> None:
+        self._reported = time.monotonic()
+        elapsed = max(self._reported - self._started, 1e-9)
+        rate = self.done / elapsed
+        line = f"[progress] {self.done}"
+        if self.total is not None:
+            line += f"/{self.total}"
+        line += f" {self.label} ({self.failed} failed), {rate:.1f} {self.label}/s"
+        if self.total is not None and rate > 0:
+            remaining = dt.timedelta(seconds=round((self.total - self.done) / rate))
+            line += f", ETA {remaining}"
+        print(line, file=sys.stderr)
+
+
+class UploadEngine:
+    def __init__(
+        self,
+        tokens: TokenProvider,
+        *,
+        workers: int = DEFAULT_WORKERS,
+        rate: float = DEFAULT_RATE,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> None:
+        self.tokens = tokens
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = TokenBucket(rate)
+        self.pool = ConnectionPool(per_host=workers, timeout=timeout)
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def __enter__(self) -> "UploadEngine":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        json: t.Any = None,
+        params: t.Mapping[str, str] | None = None,
+        data: bytes | None = None,
+        content_type: str = "application/json; charset=utf-8",
+    ) -> SimpleResponse:
+        """Send one request, retrying transient failures. Other error statuses are returned as-is."""
+        if json is not None:
+            data = _json_dumps(json)
+        if params:
+            url = f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+        attempt = 0
+        refreshed = False
+        while True:
+            self.limiter.acquire()
+            token = self.tokens.get()
+            try:
+                response, retry_after = self._send(method, url, data, content_type, token)
+            except (OSError, http.client.HTTPException) as exc:
+                if attempt >= self.retries:
+                    raise UploadError(f"{method} {url}: {exc} (after {attempt + 1} attempts)") from exc
+                self._sleep(attempt, None)
+                attempt += 1
+                continue
+            if response.status_code == 401 and not refreshed:
+                self.tokens.invalidate(token)
+                refreshed = True
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                self._sleep(attempt, retry_after)
+                attempt += 1
+                continue
+            return response
+
+    def _send(
+        self, method: str, url: str, data: bytes | None, content_type: str, token: str
+    ) -> tuple[SimpleResponse, float | None]:
+        parsed = urlparse(url)
+        path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+        if data is not None:
+            headers["Content-Type"] = content_type
+        with self.pool.connection(parsed.scheme, parsed.netloc) as conn:
+            conn.request(method, path, body=data, headers=headers)
+            response = conn.getresponse()
+            body = response.read().decode("utf-8", errors="replace")
+            retry_after = response.getheader("Retry-After")
+        try:
+            delay = float(retry_after) if retry_after else None
+        except ValueError:
+            delay = None
+        return SimpleResponse(status_code=response.status, text=body), delay
+
+    def _sleep(self, attempt: int, retry_after: float | None) -> None:
+        if retry_after is None:
+            retry_after = self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+        time.sleep(min(retry_after, MAX_BACKOFF))
+
+    def run(
+        self,
+        items: t.Iterable[T],
+        func: t.Callable[[T], object],
+        *,
+        total: int | None = None,
+        label: str = "docs",
+        on_result: t.Callable[[T, BaseException | None], None] | None = None,
+    ) -> tuple[int, list[tuple[T, BaseException]]]:
+        """
+        Call ``func`` on every item from ``workers`` threads, keeping only a bounded number of
+        items in flight. ``on_result`` runs on the calling thread as each item finishes.
+        """
+        if total is None and isinstance(items, t.Sized):
+            total = len(items)
+        progress = Progress(total, label)
+        successes = 0
+        failures: list[tuple[T, BaseException]] = []
+        pending: dict[Future[object], T] = {}
+
+        def drain(block_until: str) -> None:
+            nonlocal successes
+            done, _ = wait(pending, return_when=block_until)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    successes += 1
+                else:
+                    failures.append((item, error))
+                if on_result is not None:
+                    on_result(item, error)
+                progress.update(failed=error is not None)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for item in items:
+                pending[executor.submit(func, item)] = item
+                if len(pending) >= self.workers * 2:
+                    drain(FIRST_COMPLETED)
+            while pending:
+                drain(FIRST_COMPLETED)
+        progress.report()
+        return successes, failures
+
+
+def _json_dumps(payload: t.Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def add_engine_arguments(parser: argparse.ArgumentParser, prefix: str = "") -> None:
+    """Add --workers/--rate/--retries (optionally as --<prefix>workers etc.) to ``parser``."""
+    parser.add_argument(
+        f"--{prefix}workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Concurrent upload requests (default: {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        f"--{prefix}rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help=(
+            f"Maximum upload requests per second, matched to the data store's write quota "
+            f"(default: {DEFAULT_RATE:g}; 0 disables the limit)"
+        ),
+    )
+    parser.add_argument(
+        f"--{prefix}retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=f"Retries per upload request on network errors and 429/5xx (default: {DEFAULT_RETRIES})",
+    )
+
+
+def build_engine(args: argparse.Namespace, fetch_token: t.Callable[[], str], prefix: str = "") -> UploadEngine:
+    dest = prefix.replace("-", "_")
+    return UploadEngine(
+        TokenProvider(fetch_token),
+        workers=getattr(args, f"{dest}workers"),
+        rate=getattr(args, f"{dest}rate"),
+        retries=getattr(args, f"{dest}retries"),
+    )
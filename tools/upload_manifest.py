@@ -0,0 +1,247 @@
+"""Local manifest of uploaded Vertex AI Search documents, used by the upload tools' --sync mode.
+
+The manifest maps every document id to the SHA-256 of the payload last uploaded and the upload
+time, separately for each data store branch. Comparing it with the documents built from the local
+corpus gives the sync plan: upload new or changed documents, delete the ones that disappeared.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import hashlib
+import json
+import pathlib
+import sys
+import typing as t
+from dataclasses import dataclass, field
+
+from bulk_import import BulkImportError
+
+if t.TYPE_CHECKING:
+    from upload_engine import UploadEngine
+
+MANIFEST_FILENAME = ".upload-manifest.json"
+MANIFEST_VERSION = 1
+SAVE_EVERY = 200
+PLAN_PREVIEW = 10
+
+# Uploads many documents at once; returns (ids confirmed imported, id -> error message)
+ImportBatch = t.Callable[[t.Mapping[str, t.Mapping[str, t.Any]]], "tuple[set[str], dict[str, str]]"]
+
+
+def payload_hash(payload: t.Mapping[str, t.Any]) -> str:
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SyncPlan:
+    create: list[str] = field(default_factory=list)
+    update: list[str] = field(default_factory=list)
+    delete: list[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def uploads(self) -> list[str]:
+        return self.create + self.update
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.create)} new, {len(self.update)} changed, "
+            f"{len(self.delete)} to delete, {self.unchanged} unchanged"
+        )
+
+
+class UploadManifest:
+    """Document id -> {"hash", "uploaded_at"} for one data store branch, stored as JSON."""
+
+    def __init__(self, path: pathlib.Path, parent_path: str) -> None:
+        self.path = path
+        self.parent_path = parent_path
+        self._data: dict[str, t.Any] = {"version": MANIFEST_VERSION, "stores": {}}
+        if path.exists():
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"Unsupported upload manifest version in {path}: {data.get('version')}")
+            self._data = data
+        self.documents: dict[str, dict[str, str]] = self._data["stores"].setdefault(parent_path, {})
+        self._pending = 0
+
+    def plan(self, local_hashes: t.Mapping[str, str]) -> SyncPlan:
+        plan = SyncPlan()
+        for document_id, digest in local_hashes.items():
+            entry = self.documents.get(document_id)
+            if entry is None:
+                plan.create.append(document_id)
+            elif entry.get("hash") != digest:
+                plan.update.append(document_id)
+            else:
+                plan.unchanged += 1
+        plan.delete = sorted(set(self.documents) - set(local_hashes))
+        return plan
+
+    def record_upload(self, document_id: str, digest: str) -> None:
+        self.documents[document_id] = {
+            "hash": digest,
+            "uploaded_at": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        }
+        self._touch()
+
+    def record_delete(self, document_id: str) -> None:
+        self.documents.pop(document_id, None)
+        self._touch()
+
+    def _touch(self) -> None:
+        self._pending += 1
+        if self._pending >= SAVE_EVERY:
+            self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self._data, ensure_ascii=False, indent=1, sort_keys=True), encoding="utf-8")
+        tmp_path.replace(self.path)
+        self._pending = 0
+
+
+def add_sync_arguments(parser: argparse.ArgumentParser, *, default_manifest: str) -> None:
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help=(
+            "Upload only new or changed documents and delete documents that no longer exist "
+            "locally, based on the upload manifest"
+        ),
+    )
+    parser.add_argument(
+        "--plan-only",
+        action="store_true",
+        help="With --sync, print the sync plan and exit without calling the API",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=pathlib.Path,
+        help=f"Upload manifest file (default: {default_manifest})",
+    )
+
+
+def print_plan(plan: SyncPlan) -> None:
+    print(f"Sync plan: {plan.summary()}")
+    for label, ids in (("upload", plan.create), ("update", plan.update), ("delete", plan.delete)):
+        for document_id in ids[:PLAN_PREVIEW]:
+            print(f"  {label} {document_id}")
+        if len(ids) > PLAN_PREVIEW:
+            print(f"  ... and {len(ids) - PLAN_PREVIEW} more to {label}")
+
+
+def _run_serially(
+    items: t.Iterable[str],
+    func: t.Callable[[str], object],
+    *,
+    on_result: t.Callable[[str, BaseException | None], None],
+) -> None:
+    for item in items:
+        try:
+            func(item)
+        except Exception as exc:  # noqa: BLE001 - report API failures without aborting
+            on_result(item, exc)
+        else:
+            on_result(item, None)
+
+
+def apply_sync(
+    plan: SyncPlan,
+    manifest: UploadManifest,
+    payloads: t.Mapping[str, t.Mapping[str, t.Any]],
+    hashes: t.Mapping[str, str],
+    *,
+    upsert: t.Callable[[str, t.Mapping[str, t.Any]], None],
+    delete: t.Callable[[str], None],
+    import_batch: ImportBatch | None = None,
+    engine: UploadEngine | None = None,
+) -> tuple[int, list[str]]:
+    """
+    Run the plan, recording every completed operation in the manifest as it goes.
+    With an ``engine`` the uploads and deletions run concurrently on its workers.
+    """
+    successes = 0
+    failures: list[str] = []
+
+    def finished(action: str, record: t.Callable[[str], None]) -> t.Callable[[str, BaseException | None], None]:
+        def on_result(document_id: str, error: BaseException | None) -> None:
+            nonlocal successes
+            if error is not None:
+                failures.append(f"{document_id}: {error}")
+                print(f"[error] {document_id}: {error}", file=sys.stderr)
+                return
+            record(document_id)
+            successes += 1
+            print(f"{action} {document_id}")
+        return on_result
+
+    run = engine.run if engine is not None else _run_serially
+    try:
+        if import_batch is not None and plan.uploads:
+            succeeded, failed = import_batch({document_id: payloads[document_id] for document_id in plan.uploads})
+            for document_id in plan.uploads:
+                if document_id in succeeded:
+                    manifest.record_upload(document_id, hashes[document_id])
+                    successes += 1
+                else:
+                    failures.append(f"{document_id}: {failed.get(document_id, 'import not confirmed')}")
+        elif plan.uploads:
+            run(
+                plan.uploads,
+                lambda document_id: upsert(document_id, payloads[document_id]),
+                on_result=finished("uploaded", lambda document_id: manifest.record_upload(document_id, hashes[document_id])),
+            )
+        if plan.delete:
+            run(plan.delete, delete, on_result=finished("deleted", manifest.record_delete))
+    finally:
+        manifest.save()
+    return successes, failures
+
+
+def run_sync(
+    *,
+    manifest_path: pathlib.Path,
+    parent_path: str,
+    payloads: t.Mapping[str, t.Mapping[str, t.Any]],
+    read_failures: int,
+    plan_only: bool,
+    upsert: t.Callable[[str, t.Mapping[str, t.Any]], None],
+    delete: t.Callable[[str], None],
+    import_batch: ImportBatch | None = None,
+    engine: UploadEngine | None = None,
+) -> int:
+    """Print the sync plan for ``payloads`` and, unless ``plan_only``, apply it. Returns an exit code."""
+    manifest = UploadManifest(manifest_path, parent_path)
+    hashes = {document_id: payload_hash(payload) for document_id, payload in payloads.items()}
+    plan = manifest.plan(hashes)
+    if read_failures and plan.delete:
+        # Documents of files that could not be read would otherwise look deleted
+        print(
+            f"Not deleting {len(plan.delete)} documents because {read_failures} files could not be read.",
+            file=sys.stderr,
+        )
+        plan.delete = []
+    print_plan(plan)
+    if plan_only:
+        return 1 if read_failures else 0
+
+    try:
+        successes, failures = apply_sync(
+            plan, manifest, payloads, hashes, upsert=upsert, delete=delete, import_batch=import_batch, engine=engine
+        )
+    except BulkImportError as exc:
+        print(f"[error] bulk import failed: {exc}", file=sys.stderr)
+        return 1
+    if failures or read_failures:
+        print(
+            f"Sync completed with {successes} successes and {len(failures) + read_failures} failures.",
+            file=sys.stderr,
+        )
+        return 1
+    print(f"Sync complete: {successes} operations applied.")
+    return 0
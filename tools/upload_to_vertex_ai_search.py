@@ -10,12 +10,15 @@ import json
 import pathlib
 import re
 import sys
-from typing import Iterable, Sequence
+from typing import Callable, Iterable, Sequence
 from urllib.parse import quote
 
+from upload_engine import UploadEngine, add_engine_arguments, build_engine
+from upload_manifest import MANIFEST_FILENAME, add_sync_arguments, run_sync
+
 try:
     import google.auth
-    from google.auth.transport.requests import AuthorizedSession
+    import google.auth.transport.requests
     from google.oauth2 import service_account
 except ImportError as exc:  # pragma: no cover - makes failure mode explicit for users
     raise SystemExit(
@@ -35,14 +38,21 @@ def iter_files(root: pathlib.Path, recursive: bool) -> Iterable[pathlib.Path]:
         yield from (path for path in root.iterdir() if path.is_file())
 
 
-def build_session(service_account_file: pathlib.Path | None) -> AuthorizedSession:
+def build_token_fetcher(service_account_file: pathlib.Path | None) -> Callable[[], str]:
+    """Return a callable that refreshes the credentials and yields a fresh access token."""
     if service_account_file is not None:
         credentials = service_account.Credentials.from_service_account_file(
             str(service_account_file), scopes=SCOPES
         )
     else:
         credentials, _ = google.auth.default(scopes=SCOPES)
-    return AuthorizedSession(credentials)
+    auth_request = google.auth.transport.requests.Request()
+
+    def fetch() -> str:
+        credentials.refresh(auth_request)
+        return credentials.token
+
+    return fetch
 
 
 def sanitize_document_id(path: pathlib.Path, root: pathlib.Path) -> str:
@@ -89,18 +99,18 @@ def build_document_payload(
 
 
 def post_document(
-    session: AuthorizedSession,
+    engine: UploadEngine,
     parent_path: str,
     document_id: str,
     payload: dict[str, object],
 ) -> None:
     documents_url = f"{BASE_URL}/{parent_path}/documents"
-    response = session.post(f"{documents_url}?documentId={quote(document_id, safe='')}", json=payload)
+    response = engine.request("POST", f"{documents_url}?documentId={quote(document_id, safe='')}", json=payload)
     if response.status_code == 409:
         # Document already exists: update it.
         document_name = f"{documents_url}/{quote(document_id, safe='')}"
         params = {"updateMask": "jsonData,structData"}
-        update_response = session.patch(document_name, params=params, json=payload)
+        update_response = engine.request("PATCH", document_name, params=params, json=payload)
         if update_response.status_code >= 300:
             raise RuntimeError(
                 f"Update failed ({update_response.status_code}): {update_response.text.strip()}"
@@ -109,6 +119,26 @@ def post_document(
         raise RuntimeError(f"Create failed ({response.status_code}): {response.text.strip()}")
 
 
+def upsert_document(
+    engine: UploadEngine,
+    parent_path: str,
+    document_id: str,
+    payload: dict[str, object],
+) -> None:
+    """Create or replace a document in a single PATCH request (allowMissing=true)."""
+    document_name = f"{BASE_URL}/{parent_path}/documents/{quote(document_id, safe='')}"
+    response = engine.request("PATCH", document_name, params={"allowMissing": "true"}, json=payload)
+    if response.status_code >= 300:
+        raise RuntimeError(f"Upsert failed ({response.status_code}): {response.text.strip()}")
+
+
+def delete_document(engine: UploadEngine, parent_path: str, document_id: str) -> None:
+    document_name = f"{BASE_URL}/{parent_path}/documents/{quote(document_id, safe='')}"
+    response = engine.request("DELETE", document_name)
+    if response.status_code >= 300 and response.status_code != 404:
+        raise RuntimeError(f"Delete failed ({response.status_code}): {response.text.strip()}")
+
+
 def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("directory", type=pathlib.Path, help="Directory containing downloaded files")
@@ -142,43 +172,94 @@ def main(argv: list[str] | None = None) -> int:
         action="store_true",
         help="Recursively upload files from subdirectories",
     )
+    add_engine_arguments(parser)
+    add_sync_arguments(parser, default_manifest=f"<directory>/{MANIFEST_FILENAME}")
     args = parser.parse_args(argv)
 
     directory: pathlib.Path = args.directory
     if not directory.exists() or not directory.is_dir():
         parser.error(f"Directory not found: {directory}")
 
-    session = build_session(args.service_account)
+    plan_only = args.sync and args.plan_only
+    engine = None if plan_only else build_engine(args, build_token_fetcher(args.service_account))
 
     parent_path = (
         f"projects/{args.project}/locations/{args.location}/collections/{args.collection}/"
         f"dataStores/{args.data_store}/branches/{args.branch}"
     )
 
-    successes = 0
-    failures: list[str] = []
+    # Skip tool state such as the upload manifest
+    files = [path for path in iter_files(directory, recursive=args.recursive) if not path.name.startswith(".")]
 
-    for file_path in iter_files(directory, recursive=args.recursive):
-        document_id = sanitize_document_id(file_path, directory)
-        try:
-            content = read_text(file_path, args.encoding, args.errors)
-        except UnicodeDecodeError as exc:
-            failures.append(f"{file_path}: decode error ({exc})")
-            continue
-        payload = build_document_payload(
+    def load(file_path: pathlib.Path) -> dict[str, object]:
+        return build_document_payload(
             file_path=file_path,
             root=directory,
-            content=content,
+            content=read_text(file_path, args.encoding, args.errors),
             content_type=args.content_type,
             source_uri=args.source_uri,
         )
+
+    try:
+        if args.sync:
+            return sync_files(args, engine, files, load, parent_path=parent_path, plan_only=plan_only)
+        return upload_files(engine, files, load, directory=directory, parent_path=parent_path)
+    finally:
+        if engine is not None:
+            engine.close()
+
+
+def sync_files(
+    args: argparse.Namespace,
+    engine: UploadEngine | None,
+    files: list[pathlib.Path],
+    load: Callable[[pathlib.Path], dict[str, object]],
+    *,
+    parent_path: str,
+    plan_only: bool,
+) -> int:
+    failures = 0
+    payloads: dict[str, dict[str, object]] = {}
+    for file_path in files:
         try:
-            post_document(session, parent_path, document_id, payload)
-        except Exception as exc:  # noqa: BLE001 - report unexpected API errors and continue
-            failures.append(f"{file_path}: {exc}")
+            payloads[sanitize_document_id(file_path, args.directory)] = load(file_path)
+        except UnicodeDecodeError as exc:
+            print(f"[skip] {file_path}: decode error ({exc})", file=sys.stderr)
+            failures += 1
+    return run_sync(
+        manifest_path=args.manifest or args.directory / MANIFEST_FILENAME,
+        parent_path=parent_path,
+        payloads=payloads,
+        read_failures=failures,
+        plan_only=plan_only,
+        upsert=lambda document_id, payload: upsert_document(engine, parent_path, document_id, payload),
+        delete=lambda document_id: delete_document(engine, parent_path, document_id),
+        engine=engine,
+    )
+
+
+def upload_files(
+    engine: UploadEngine,
+    files: list[pathlib.Path],
+    load: Callable[[pathlib.Path], dict[str, object]],
+    *,
+    directory: pathlib.Path,
+    parent_path: str,
+) -> int:
+    failures: list[str] = []
+
+    def upload(file_path: pathlib.Path) -> None:
+        post_document(engine, parent_path, sanitize_document_id(file_path, directory), load(file_path))
+
+    def report(file_path: pathlib.Path, error: BaseException | None) -> None:
+        if isinstance(error, UnicodeDecodeError):
+            failures.append(f"{file_path}: decode error ({error})")
+        elif error is not None:
+            failures.append(f"{file_path}: {error}")
         else:
-            successes += 1
-            print(f"uploaded {file_path} as {document_id}")
+            print(f"uploaded {file_path} as {sanitize_document_id(file_path, directory)}")
+
+    successes, _ = engine.run(files, upload, on_result=report)
 
     if failures:
         print("\nSome uploads failed:", file=sys.stderr)
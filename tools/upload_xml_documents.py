@@ -4,6 +4,7 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import hashlib
 import json
 import pathlib
@@ -12,13 +13,23 @@ import shlex
 import subprocess
 import sys
 import typing as t
-import xml.etree.ElementTree as ET
-from urllib.error import HTTPError
 from urllib.parse import quote, urlparse
-from urllib.request import Request, urlopen
 
-TEI_NAMESPACE = "http://www.tei-c.org/ns/1.0"
-NS = {"tei": TEI_NAMESPACE}
+from bulk_import import (
+    DEFAULT_POLL_INTERVAL,
+    RECONCILIATION_MODES,
+    STORAGE_API,
+    BulkImportError,
+    ImportClient,
+    bulk_import,
+)
+from near_duplicates import DUPLICATE_MAP_FILENAME, NearDuplicateIndex, add_dedupe_arguments, write_duplicate_map
+from parse_cache import CACHE_DIRNAME, add_cache_arguments, cache_from_args
+from tei_chunker import DEFAULT_MAX_CHARS, DEFAULT_MIN_CHARS, DEFAULT_OVERLAP, Chunk, chunk_tei_file
+from tei_extract import extract_files
+from upload_engine import UploadEngine, add_engine_arguments, build_engine
+from upload_manifest import MANIFEST_FILENAME, add_sync_arguments, run_sync
+
 BASE_URL = "https://discoveryengine.googleapis.com/v1beta"
 
 
@@ -77,7 +88,93 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
         action="store_true",
         help="Parse XML and display payloads without calling the API",
     )
-    return parser.parse_args(argv)
+    parser.add_argument(
+        "--export-segments",
+        type=pathlib.Path,
+        help=(
+            "Write the extracted segments as JSON Lines instead of uploading them "
+            "(input for the backend's local search index)"
+        ),
+    )
+    parser.add_argument(
+        "--segment-min-chars",
+        type=int,
+        default=DEFAULT_MIN_CHARS,
+        help=f"Keep adding paragraphs to a segment across div boundaries until it has this many characters (default: {DEFAULT_MIN_CHARS})",
+    )
+    parser.add_argument(
+        "--segment-max-chars",
+        type=int,
+        default=DEFAULT_MAX_CHARS,
+        help=f"Maximum characters per segment; longer paragraphs are cut between sentences (default: {DEFAULT_MAX_CHARS})",
+    )
+    parser.add_argument(
+        "--segment-overlap",
+        type=int,
+        default=DEFAULT_OVERLAP,
+        help=f"Characters of trailing sentences or verse lines repeated at the start of the next segment (default: {DEFAULT_OVERLAP})",
+    )
+    parser.add_argument(
+        "--extract-workers",
+        type=int,
+        help="Processes used to parse the XML files (default: one per CPU core; 1 parses in-process)",
+    )
+    add_cache_arguments(parser, default_dir=f"<download-dir>/{CACHE_DIRNAME}")
+    add_dedupe_arguments(parser, default_map=f"<download-dir>/{DUPLICATE_MAP_FILENAME}")
+    add_engine_arguments(parser)
+    add_sync_arguments(parser, default_manifest=f"<download-dir>/{MANIFEST_FILENAME}")
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Write segments to JSONL batches and ingest them with documents:import instead of one request each",
+    )
+    parser.add_argument(
+        "--batch-dir",
+        type=pathlib.Path,
+        help="Directory for the JSONL batch files (default: <download-dir>/.bulk-import)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Documents per batch file (default: 100 inline, 10000 with --gcs-bucket)",
+    )
+    parser.add_argument(
+        "--gcs-bucket",
+        help="Upload the batches to this Cloud Storage bucket and import them with gcsSource",
+    )
+    parser.add_argument("--gcs-prefix", default="sutra-import", help="Object prefix for --gcs-bucket")
+    parser.add_argument(
+        "--reconciliation-mode",
+        choices=RECONCILIATION_MODES,
+        default="INCREMENTAL",
+        help="INCREMENTAL upserts; FULL also removes documents missing from the import (gcsSource only)",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help=f"Seconds between import operation polls (default: {DEFAULT_POLL_INTERVAL:g})",
+    )
+    parser.add_argument(
+        "--api-endpoint",
+        default=BASE_URL,
+        help=f"Discovery Engine API base URL, e.g. a local stand-in server (default: {BASE_URL})",
+    )
+    parser.add_argument(
+        "--storage-endpoint",
+        default=STORAGE_API,
+        help=f"Cloud Storage API base URL (default: {STORAGE_API})",
+    )
+    args = parser.parse_args(argv)
+    if not 0 < args.segment_min_chars <= args.segment_max_chars:
+        parser.error("--segment-min-chars must be positive and at most --segment-max-chars")
+    if not 0 <= args.segment_overlap < args.segment_max_chars // 2:
+        parser.error("--segment-overlap must be less than half of --segment-max-chars")
+    if not 0 < args.dedupe_threshold <= 1:
+        parser.error("--dedupe-threshold must be in (0, 1]")
+    if args.sync and args.bulk and args.reconciliation_mode == "FULL":
+        parser.error("--sync imports only changed documents and cannot be combined with FULL reconciliation")
+    return args
 
 
 def ensure_url_list(path: pathlib.Path) -> pathlib.Path:
@@ -109,53 +206,6 @@ def build_url_map(source: pathlib.Path) -> dict[str, str]:
     return mapping
 
 
-def collapse_whitespace(text: str) -> str:
-    return re.sub(r"\s+", " ", text).strip()
-
-
-def extract_title(root: ET.Element) -> str | None:
-    title = root.findtext(".//tei:teiHeader/tei:fileDesc/tei:titleStmt/tei:title", namespaces=NS)
-    if title:
-        return collapse_whitespace(title)
-    return None
-
-
-def gather_body_text(body: ET.Element) -> str:
-    parts: list[str] = []
-    for paragraph in body.findall(".//tei:p", namespaces=NS):
-        text = collapse_whitespace(" ".join(segment for segment in paragraph.itertext()))
-        if text:
-            parts.append(text)
-    if not parts:
-        lines: list[str] = []
-        for line in body.findall(".//tei:l", namespaces=NS):
-            text = collapse_whitespace(" ".join(segment for segment in line.itertext()))
-            if text:
-                lines.append(text)
-        if lines:
-            parts.append("\n".join(lines))
-    if not parts:
-        raw = collapse_whitespace(" ".join(segment for segment in body.itertext()))
-        if raw:
-            parts.append(raw)
-    if not parts:
-        raise ValueError("TEI body contained no textual content")
-    return "\n\n".join(parts)
-
-
-def extract_body(xml_path: pathlib.Path) -> tuple[str | None, str]:
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    body = root.find(".//tei:text/tei:body", namespaces=NS)
-    if body is None:
-        body = root.find(".//tei:body", namespaces=NS)
-    if body is None:
-        raise ValueError("TEI body element not found")
-    title = extract_title(root)
-    content = gather_body_text(body)
-    return title, content
-
-
 def fetch_access_token(command: str) -> str:
     parts = shlex.split(command)
     if not parts:
@@ -197,62 +247,100 @@ def format_segment_document_id(base_id: str, index: int) -> str:
     return f"{base_id}{suffix}"
 
 
-def split_content_segments(content: str) -> list[str]:
-    segments = []
-    for line in content.splitlines():
-        stripped = line.strip()
-        if stripped:
-            segments.append(stripped)
-    return segments
-
-
-def build_json_payload(*, content: str, url: str, title: str | None) -> dict[str, str]:
-    body: dict[str, str] = {"content": content, "uri": url}
+def build_json_payload(*, chunk: Chunk, url: str, title: str | None) -> dict[str, str]:
+    body: dict[str, t.Any] = {
+        "content": chunk.text,
+        "uri": url,
+        "source_start": chunk.start,
+        "source_end": chunk.end,
+    }
     if title:
         body["title"] = title
     return {"jsonData": json.dumps(body, ensure_ascii=False)}
 
 
+def build_segment_record(*, document_id: str, chunk: Chunk, url: str, title: str | None) -> dict[str, t.Any]:
+    return {
+        "id": document_id,
+        "title": title,
+        "uri": url,
+        "content": chunk.text,
+        "source_start": chunk.start,
+        "source_end": chunk.end,
+    }
+
+
 def post_document(
+    engine: UploadEngine,
     *,
-    token: str,
     parent_path: str,
     document_id: str,
     payload: dict[str, str],
+    api_base: str = BASE_URL,
 ) -> None:
-    documents_url = f"{BASE_URL}/{parent_path}/documents"
-    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json; charset=utf-8",
-        "Accept": "application/json",
-    }
+    documents_url = f"{api_base}/{parent_path}/documents"
     create_url = f"{documents_url}?documentId={quote(document_id, safe='')}"
-    request = Request(create_url, data=data, headers=headers)
-    try:
-        with urlopen(request) as response:
-            status = response.getcode()
-            if status >= 300:
-                body = response.read().decode("utf-8", errors="replace")
-                raise UploadFailure(f"Create failed ({status}): {body}")
-    except HTTPError as exc:
-        if exc.code != 409:
-            body = exc.read().decode("utf-8", errors="replace")
-            raise UploadFailure(f"Create failed ({exc.code}): {body}") from exc
+    response = engine.request("POST", create_url, json=payload)
+    if response.status_code == 409:
         document_name = f"{documents_url}/{quote(document_id, safe='')}"
-        update_url = f"{document_name}?updateMask=jsonData"
-        patch_request = Request(update_url, data=data, headers=headers, method="PATCH")
-        with urlopen(patch_request) as response:
-            status = response.getcode()
-            if status >= 300:
-                body = response.read().decode("utf-8", errors="replace")
-                raise UploadFailure(f"Update failed ({status}): {body}")
+        response = engine.request("PATCH", f"{document_name}?updateMask=jsonData", json=payload)
+        if response.status_code >= 300:
+            raise UploadFailure(f"Update failed ({response.status_code}): {response.text}")
+    elif response.status_code >= 300:
+        raise UploadFailure(f"Create failed ({response.status_code}): {response.text}")
+
+
+def upsert_document(
+    engine: UploadEngine,
+    *,
+    parent_path: str,
+    document_id: str,
+    payload: t.Mapping[str, str],
+    api_base: str = BASE_URL,
+) -> None:
+    """Create or replace a document in a single PATCH request (allowMissing=true)."""
+    document_url = f"{api_base}/{parent_path}/documents/{quote(document_id, safe='')}?allowMissing=true"
+    response = engine.request("PATCH", document_url, json=payload)
+    if response.status_code >= 300:
+        raise UploadFailure(f"Upsert failed ({response.status_code}): {response.text}")
+
+
+def delete_document(engine: UploadEngine, *, parent_path: str, document_id: str, api_base: str = BASE_URL) -> None:
+    document_url = f"{api_base}/{parent_path}/documents/{quote(document_id, safe='')}"
+    response = engine.request("DELETE", document_url)
+    if response.status_code >= 300 and response.status_code != 404:  # 404: already gone
+        raise UploadFailure(f"Delete failed ({response.status_code}): {response.text}")
 
 
 def iter_xml_files(directory: pathlib.Path) -> t.Iterable[pathlib.Path]:
     yield from sorted(path for path in directory.iterdir() if path.suffix.lower() == ".xml")
 
 
+def import_segments(
+    args: argparse.Namespace,
+    engine: UploadEngine,
+    parent_path: str,
+    payloads: t.Mapping[str, t.Mapping[str, str]],
+) -> tuple[set[str], dict[str, str]]:
+    client = ImportClient(
+        engine,
+        api_base=args.api_endpoint,
+        storage_base=args.storage_endpoint,
+        poll_interval=args.poll_interval,
+    )
+    result = bulk_import(
+        client,
+        parent_path,
+        payloads,
+        batch_dir=args.batch_dir or args.download_dir / ".bulk-import",
+        batch_size=args.batch_size,
+        gcs_bucket=args.gcs_bucket,
+        gcs_prefix=args.gcs_prefix,
+        reconciliation_mode=args.reconciliation_mode,
+    )
+    return result.succeeded, result.failed
+
+
 def main(argv: list[str] | None = None) -> int:
     args = parse_args(argv)
 
@@ -274,61 +362,173 @@ def main(argv: list[str] | None = None) -> int:
         f"dataStores/{args.data_store}/branches/{args.branch}"
     )
 
-    if args.dry_run:
-        token = None  # type: ignore[assignment]
-    else:
+    export_file: t.TextIO | None = None
+    if args.export_segments is not None:
+        args.export_segments.parent.mkdir(parents=True, exist_ok=True)
+        export_file = args.export_segments.open("w", encoding="utf-8")
+
+    plan_only = args.sync and (args.plan_only or args.dry_run)
+    engine: UploadEngine | None = None
+    if not (args.dry_run or plan_only or export_file is not None):
+        engine = build_engine(args, lambda: fetch_access_token(args.access_token_command))
         try:
-            token = fetch_access_token(args.access_token_command)
+            engine.tokens.get()
         except RuntimeError as exc:
             print(f"Failed to obtain access token: {exc}", file=sys.stderr)
             return 1
 
+    try:
+        return upload_segments(
+            args,
+            engine=engine,
+            documents=documents,
+            url_map=url_map,
+            url_list_name=url_list_path.name,
+            parent_path=parent_path,
+            export_file=export_file,
+            plan_only=plan_only,
+        )
+    finally:
+        if engine is not None:
+            engine.close()
+
+
+def upload_segments(
+    args: argparse.Namespace,
+    *,
+    engine: UploadEngine | None,
+    documents: list[pathlib.Path],
+    url_map: dict[str, str],
+    url_list_name: str,
+    parent_path: str,
+    export_file: t.TextIO | None,
+    plan_only: bool,
+) -> int:
+    download_dir: pathlib.Path = args.download_dir
+    uploads: list[tuple[str, int, str, dict[str, str]]] = []
+
+    sync_payloads: dict[str, dict[str, str]] = {}
     failures = 0
     successes = 0
-    for xml_path in documents:
-        try:
-            title, content = extract_body(xml_path)
-        except Exception as exc:  # noqa: BLE001
-            print(f"[skip] {xml_path}: failed to extract body ({exc})", file=sys.stderr)
+    chunk_file = functools.partial(
+        chunk_tei_file,
+        min_chars=args.segment_min_chars,
+        max_chars=args.segment_max_chars,
+        overlap=args.segment_overlap,
+        cache=cache_from_args(args, download_dir / CACHE_DIRNAME),
+    )
+    dedupe = (
+        NearDuplicateIndex(threshold=args.dedupe_threshold, shingle_size=args.shingle_size) if args.dedupe else None
+    )
+    duplicates: dict[str, str] = {}
+    for xml_path, extracted, error in extract_files(chunk_file, documents, workers=args.extract_workers):
+        if extracted is None:
+            print(f"[skip] {xml_path}: failed to extract body ({error})", file=sys.stderr)
             failures += 1
             continue
+        title, segments = extracted
         url = url_map.get(xml_path.name)
         if url is None:
-            print(f"[skip] {xml_path}: source URL not found in {url_list_path.name}", file=sys.stderr)
-            failures += 1
-            continue
-        segments = split_content_segments(content)
-        if not segments:
-            print(f"[skip] {xml_path}: no content segments after splitting", file=sys.stderr)
+            print(f"[skip] {xml_path}: source URL not found in {url_list_name}", file=sys.stderr)
             failures += 1
             continue
         base_document_id = sanitize_document_id(xml_path, download_dir)
         for index, segment in enumerate(segments, start=1):
             segment_id = format_segment_document_id(base_document_id, index)
-            payload = build_json_payload(content=segment, url=url, title=title)
+            if dedupe is not None:
+                canonical = dedupe.add(segment_id, segment.text)
+                if canonical is not None:
+                    duplicates[segment_id] = canonical
+                    continue
+            if export_file is not None:
+                record = build_segment_record(
+                    document_id=segment_id, chunk=segment, url=url, title=title
+                )
+                export_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                successes += 1
+                continue
+            payload = build_json_payload(chunk=segment, url=url, title=title)
+            if args.sync or (args.bulk and not args.dry_run):
+                sync_payloads[segment_id] = payload
+                continue
             if args.dry_run:
                 print(
                     f"[dry-run] {xml_path.name} -> {segment_id}\n"
                     f"{json.dumps(payload, ensure_ascii=False)}"
                 )
                 continue
-            try:
-                post_document(
-                    token=token,
-                    parent_path=parent_path,
-                    document_id=segment_id,
-                    payload=payload,
-                )
-            except UploadFailure as exc:
-                print(f"[error] {xml_path}:{segment_id} {exc}", file=sys.stderr)
-                failures += 1
+            uploads.append((xml_path.name, index, segment_id, payload))
+
+    if dedupe is not None:
+        map_path = args.dedupe_map or download_dir / DUPLICATE_MAP_FILENAME
+        write_duplicate_map(map_path, duplicates)
+        print(f"Skipped {len(duplicates)} near-duplicate segments ({len(dedupe)} kept); map written to {map_path}")
+
+    if export_file is not None:
+        export_file.close()
+        print(f"Exported {successes} segments to {args.export_segments}")
+    elif args.sync:
+        return run_sync(
+            manifest_path=args.manifest or download_dir / MANIFEST_FILENAME,
+            parent_path=parent_path,
+            payloads=sync_payloads,
+            read_failures=failures,
+            plan_only=plan_only,
+            upsert=lambda document_id, payload: upsert_document(
+                engine,
+                parent_path=parent_path,
+                document_id=document_id,
+                payload=payload,
+                api_base=args.api_endpoint,
+            ),
+            delete=lambda document_id: delete_document(
+                engine, parent_path=parent_path, document_id=document_id, api_base=args.api_endpoint
+            ),
+            import_batch=(lambda payloads: import_segments(args, engine, parent_path, payloads)) if args.bulk else None,
+            engine=engine,
+        )
+    elif args.bulk and not args.dry_run:
+        try:
+            succeeded, failed = import_segments(args, engine, parent_path, sync_payloads)
+        except BulkImportError as exc:
+            print(f"[error] bulk import failed: {exc}", file=sys.stderr)
+            return 1
+        successes = len(succeeded)
+        failures += len(sync_payloads) - successes
+        if failures:
+            print(
+                f"Imported {successes} segments; {len(failed)} failed, "
+                f"{len(sync_payloads) - successes - len(failed)} unconfirmed.",
+                file=sys.stderr,
+            )
+
+    elif uploads:
+
+        def upload(item: tuple[str, int, str, dict[str, str]]) -> None:
+            post_document(
+                engine,
+                parent_path=parent_path,
+                document_id=item[2],
+                payload=item[3],
+                api_base=args.api_endpoint,
+            )
+
+        def report(item: tuple[str, int, str, dict[str, str]], error: BaseException | None) -> None:
+            name, index, segment_id, _ = item
+            if error is not None:
+                print(f"[error] {name}:{segment_id} {error}", file=sys.stderr)
             else:
-                successes += 1
-                print(f"uploaded {xml_path.name} segment {index} as {segment_id}")
+                print(f"uploaded {name} segment {index} as {segment_id}")
+
+        uploaded, upload_failures = engine.run(uploads, upload, on_result=report)
+        successes += uploaded
+        failures += len(upload_failures)
 
     if failures:
         print(f"Completed with {successes} successes and {failures} failures.", file=sys.stderr)
         return 1
+    if export_file is not None:
+        return 0
     if args.dry_run:
         print("Dry run complete.")
         return 0